@@ -19,6 +19,13 @@ from torch.utils import data as data_utils
 from torch.utils.data import DataLoader, Dataset
 from torchvision import transforms
 
+from .checkpoint import TrainingCheckpointer
+from .evaluation import (evaluate, get_eval_batchsize, inference_mode,
+                         is_validation_epoch, is_validation_step)
+from .export import export_model
+from .inference import predict_batched
+from .quantization import quantize_model
+
 
 def conv2D_output_size(img_size, kernel_size, stride, padding):
     outshape = (np.floor((img_size[0] + 2 * padding[0] - (kernel_size[0] - 1) - 1) / stride[0] + 1).astype(int),
@@ -284,7 +291,7 @@ class CNN2DImage():
 
     """
 
-    def __init__(self, train_data_address, val_data_address, shuffle=True):
+    def __init__(self, train_data_address, val_data_address, shuffle=True, resume_from=None, checkpoint_path=None, checkpoint_every=1, checkpoint_batches=None, validate_every=1, validate_every_steps=None, eval_batchsize=None):
 
         # Lists used in the functions below
         self.criterion_list = {1: nn.CrossEntropyLoss(), 2: torch.nn.L1Loss(
@@ -294,6 +301,15 @@ class CNN2DImage():
         self.val_address = val_data_address
         self.shuffle = shuffle
 
+        # checkpointing and resuming of the training state
+        self.checkpointer = TrainingCheckpointer(
+            resume_from, checkpoint_path, checkpoint_every, checkpoint_batches)
+
+        # validation cadence and validation batch size
+        self.validate_every = validate_every
+        self.validate_every_steps = validate_every_steps
+        self.eval_batchsize = eval_batchsize
+
         self.get_default_paramters()            # getting default parameters argument
 
         self.num_classes = self.get_num_classes()  # getting the number of classes
@@ -620,7 +636,7 @@ class CNN2DImage():
 
         # creating the validation dataset dataloader
         self.dev_loader = torch.utils.data.DataLoader(
-            self.val_dataset, batch_size=self.batchsize)
+            self.val_dataset, batch_size=get_eval_batchsize(self.batchsize, self.eval_batchsize))
 
         self.train_model()          # training the model
 
@@ -677,19 +693,22 @@ class CNN2DImage():
         self.training_acc = []
         self.dev_loss = []
         self.dev_accuracy = []
-        total_predictions = 0.0
-        correct_predictions = 0.0
+        self.dev_epochs = []
+        self.step_validation = []
+        self.checkpointer.start(self)             # restoring the state when resuming
+        total_predictions = self.checkpointer.counters['total_predictions']
+        correct_predictions = self.checkpointer.counters['correct_predictions']
 
         print('Training the model...')
 
-        for epoch in range(self.numEpochs):
+        for epoch in self.checkpointer.epochs(self.numEpochs):
 
             start_time = time.time()
             self.net.train()
             print('Epoch_Number: ', epoch)
-            running_loss = 0.0
+            running_loss = self.checkpointer.counters['running_loss']
 
-            for batch_idx, (data, target) in enumerate(self.train_loader):
+            for batch_idx, (data, target) in self.checkpointer.batches(self.train_loader):
 
                 self.optimizer.zero_grad()
                 data = data.double().to(self.device)
@@ -711,6 +730,14 @@ class CNN2DImage():
                 running_loss += loss.item()
                 loss.backward()
                 self.optimizer.step()
+                self.checkpointer.batch_done(
+                    epoch, batch_idx, running_loss, total_predictions, correct_predictions)
+
+                # validating in the middle of the epoch only if requested
+                if is_validation_step(batch_idx, self.validate_every_steps):
+
+                    self.step_validation.append(
+                        (epoch, batch_idx + 1) + self.validate_model())
 
             running_loss /= len(self.train_loader)
             self.training_loss.append(running_loss)
@@ -723,7 +750,12 @@ class CNN2DImage():
                 self.training_acc.append(acc)
                 print('Training Accuracy: ', acc, '%')
 
-            dev_loss, dev_acc = self.validate_model()
+            # validating the model only at the configured cadence
+            validated = is_validation_epoch(
+                epoch, self.numEpochs, self.validate_every)
+            if validated:
+
+                dev_loss, dev_acc = self.validate_model()
 
             if self.scheduler_input != '1':
 
@@ -734,51 +766,32 @@ class CNN2DImage():
             print('Epoch Time: ', end_time - start_time, 's')
             print('#'*50)
 
-            self.dev_loss.append(dev_loss)
-
-            # saving the epoch validation accuracy only if the loss function is Cross entropy
-            if self.criterion_input == '1':
+            if validated:
 
-                self.dev_accuracy.append(dev_acc)
+                self.dev_epochs.append(epoch)
+                self.dev_loss.append(dev_loss)
 
-    def validate_model(self):
-
-        with torch.no_grad():
-            self.net.eval()
-        running_loss = 0.0
-        total_predictions = 0.0
-        correct_predictions = 0.0
-        acc = 0
-        self.actual = []
-        self.predict = []
+                # saving the epoch validation accuracy only if the loss function is Cross entropy
+                if self.criterion_input == '1':
 
-        for batch_idx, (data, target) in enumerate(self.dev_loader):
+                    self.dev_accuracy.append(dev_acc)
 
-            data = data.double().to(self.device)
-            target = target.to(self.device)
-            outputs = self.net(data)
+            self.checkpointer.epoch_done(
+                epoch, total_predictions, correct_predictions)
 
-            if self.criterion_input == '1':
+        self.checkpointer.close()
 
-                loss = self.criterion(outputs, target.long())
-                _, predicted = torch.max(outputs.data, 1)
-                total_predictions += target.size(0)
-                correct_predictions += (predicted == target).sum().item()
-                self.predict.append(predicted.detach().cpu().numpy())
+    def validate_model(self):
 
-            else:
-                loss = self.criterion(outputs, target)
-                self.predict.append(outputs.detach().cpu().numpy())
-            running_loss += loss.item()
-            self.actual.append(target.detach().cpu().numpy())
+        # Method for evaluating the model on the validation set in inference mode
 
-        running_loss /= len(self.dev_loader)
+        running_loss, acc, self.predict, self.actual = evaluate(
+            self.net, self.dev_loader, self.criterion, self.criterion_input == '1', self.device, input_dtype=torch.float64)
         print('Validation Loss: ', running_loss)
 
-        # calculating and printing the epoch accuracy only if the loss function is Cross entropy
+        # printing the accuracy only if the loss function is Cross entropy
         if self.criterion_input == '1':
 
-            acc = (correct_predictions/total_predictions)*100.0
             print('Validation Accuracy: ', acc, '%')
 
         return running_loss, acc
@@ -789,7 +802,7 @@ class CNN2DImage():
 
         plt.figure(figsize=(8, 8))
         plt.plot(self.training_loss, label='Training Loss')
-        plt.plot(self.dev_loss, label='Validation Loss')
+        plt.plot(self.dev_epochs, self.dev_loss, label='Validation Loss')
         plt.legend()
         plt.title('Model Loss')
         plt.xlabel('Epochs')
@@ -802,7 +815,7 @@ class CNN2DImage():
 
         plt.figure(figsize=(8, 8))
         plt.plot(self.training_acc, label='Training Accuracy')
-        plt.plot(self.dev_accuracy, label='Validation Accuracy')
+        plt.plot(self.dev_epochs, self.dev_accuracy, label='Validation Accuracy')
         plt.legend()
         plt.title('Model accuracy')
         plt.xlabel('Epochs')
@@ -814,8 +827,7 @@ class CNN2DImage():
         # Method for getting the confusion matrix for classification problem
         print('Confusion Matix: ')
 
-        result = confusion_matrix(np.concatenate(
-            np.array(self.predict)), np.concatenate(np.array(self.actual)))
+        result = confusion_matrix(self.predict, self.actual)
         print(result)
 
     def get_prediction(self, x_input):
@@ -837,13 +849,61 @@ class CNN2DImage():
 
         x_input = torch.from_numpy(x_input).to(self.device)
 
-        net_output = self.net.forward(x_input)
+        self.net.eval()
+        with inference_mode():
+
+            net_output = self.net(x_input)
 
         if self.criterion_input == '1':             # handling the case of classification problem
 
             _, net_output = torch.max(net_output.data, 1)
 
         return net_output
+
+    def predict_batched(self, X, batch_size=1024, num_threads=None, output=None):
+        """
+
+        Makes predictions on a large dataset in batches, without building autograd graphs.
+        X can be a numpy array, a numpy memmap or an iterable of arrays, with the number of examples as the first dimension.
+        output selects 'class' (class indices), 'proba' (class probabilities) or 'value' (regression values);
+        by default class indices are returned for classification and values for regression.
+        num_threads sets the number of CPU threads used by torch. Returns a numpy array.
+
+        """
+
+        return predict_batched(self.net, X, batch_size=batch_size, num_threads=num_threads,
+                               output=output, classification=self.criterion_input == '1', device=self.device)
+
+    def export(self, path, format='torchscript', example_input=None, normalizer=None):
+        """
+
+        Exports the trained network to the directory path as a standalone artifact that is loaded with
+        ManufacturingNet.runtime.load(path), without the training code or its dependencies.
+        format is 'torchscript' or 'onnx'. The metadata written next to the model holds the task, the input
+        shape and dtype, the class mapping, the architecture config and, if a fitted normalizer is given,
+        its statistics so that the loader normalizes raw inputs the same way.
+        example_input is one input batch used for tracing; by default a validation sample is used.
+
+        """
+
+        return export_model(self, path, format=format, example_input=example_input, normalizer=normalizer)
+
+    def quantize(self, method='static', calibration_batches=10, backend=None, report=True):
+        """
+
+        Builds an int8 copy of the trained network for fast CPU inference and stores it in quantized_net.
+        Static quantization ('static') stores the weights and activations of the convolution and linear layers in int8,
+        with the activation ranges calibrated on calibration_batches validation batches;
+        dynamic quantization ('dynamic') only quantizes the linear layers and needs no calibration.
+        backend is the quantized engine ('fbgemm' or 'x86' for Intel and AMD CPUs, 'qnnpack' for ARM).
+        With report, the accuracy and latency of the quantized network are compared with the float network
+        on the validation data, printed and stored in quantization_report.
+
+        """
+
+        self.quantized_net, self.quantization_report = quantize_model(
+            self, method, calibration_batches=calibration_batches, backend=backend, report=report)
+        return self.quantized_net
     
     
     def get_mapping(self):
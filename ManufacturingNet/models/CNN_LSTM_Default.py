@@ -12,6 +12,16 @@ import torch.optim as optim
 import torch.optim.lr_scheduler as scheduler
 import torch.utils.data as data
 
+from .checkpoint import TrainingCheckpointer
+from .evaluation import (evaluate, get_eval_batchsize, inference_mode,
+                         is_validation_epoch, is_validation_step)
+from .export import export_model
+from .inference import predict_batched
+from .quantization import quantize_model
+from .sequences import (PackedSequence, is_variable_length, last_valid_output,
+                        pack_inputs, sequence_loader, to_sequence_list)
+from .streaming import StreamingPredictor
+
 
 class ModelDataset():
     """ModelDataset creates necessary inputs for the Dataset and
@@ -685,42 +695,51 @@ class LSTM(nn.Module):
 
     def forward(self, x):
         out, _ = self.lstm(x)
-        out = self.linear1(out[:, -1, :])
+        if isinstance(x, PackedSequence):
+            out = last_valid_output(out)
+        else:
+            out = out[:, -1, :]
+        out = self.linear1(out)
         out = self.linear2(out)
         out = self.linear3(out)
         return out
 
 
 class CNN_LSTM(nn.Module):
-    """CNN_LSTM combines the CNN and LSTM networks."""
+    """CNN_LSTM combines the CNN and LSTM networks.
+
+    The CNN is applied to every frame of the sequence at once by folding
+    the time dimension into the batch dimension. If max_chunk is set, at
+    most max_chunk frames go through the CNN together, which caps the
+    activation memory for long sequences. Packed variable-length batches
+    only run the CNN on their valid frames.
+    """
 
-    def __init__(self, CNNNetwork, LSTMNetwork, device):
+    def __init__(self, CNNNetwork, LSTMNetwork, device, max_chunk=None):
         super(CNN_LSTM, self).__init__()
         self.cnn = CNNNetwork
         self.lstm = LSTMNetwork
         self.device = device
+        self.max_chunk = max_chunk
 
-    def forward(self, x):
-        b, time, num_channels, h, w = x.shape
-        lstm_input = torch.zeros(
-            (b, time, self.lstm.input_size)).double().to(self.device)
+    def _time_distributed(self, frames):
+        if self.max_chunk is None or frames.shape[0] <= self.max_chunk:
+            return self.cnn(frames)
+        return torch.cat([self.cnn(chunk)
+                          for chunk in torch.split(frames, self.max_chunk)])
 
-        for i in range(time):
-            lstm_input[:, i, :] = self.cnn.forward(x[:, i, :, :, :])
+    def forward(self, x):
+        if isinstance(x, PackedSequence):
+            features = self._time_distributed(x.data)
+            return self.lstm(x._replace(data=features))
 
-        output = self.lstm(lstm_input)
+        b, time = x.shape[:2]
+        features = self._time_distributed(x.reshape((b * time,) + x.shape[2:]))
+        output = self.lstm(features.reshape(b, time, -1))
         return output
 
     def predict(self, x):
-        b, time, num_channels, h, w = x.shape
-        lstm_input = torch.zeros(
-            (b, time, self.lstm.input_size)).double().to(self.device)
-
-        for i in range(time):
-            lstm_input[:, i, :] = self.cnn.forward(x[:, i, :, :, :])
-
-        output = self.lstm(lstm_input)
-        return output
+        return self.forward(x)
 
 
 class CNNLSTM():
@@ -730,19 +749,31 @@ class CNNLSTM():
     View the documentation at https://manufacturingnet.readthedocs.io/
     """
 
-    def __init__(self, X, Y, shuffle=True):
+    def __init__(self, X, Y, shuffle=True, resume_from=None, checkpoint_path=None, checkpoint_every=1, checkpoint_batches=None, validate_every=1, validate_every_steps=None, eval_batchsize=None, frame_chunk=None, lengths=None):
         self.criterion_list = {1: nn.CrossEntropyLoss(), 2: torch.nn.L1Loss(
         ), 3: torch.nn.SmoothL1Loss(), 4: torch.nn.MSELoss()}
         self.x_data = X
         self.y_data = Y
         self.shuffle = shuffle
+
+        # sequences of different lengths are trained as packed, length-bucketed batches
+        self.variable_length = is_variable_length(X, lengths)
+        if self.variable_length:
+            self.x_data = to_sequence_list(X, lengths)
+        self.checkpointer = TrainingCheckpointer(
+            resume_from, checkpoint_path, checkpoint_every, checkpoint_batches)
+
+        self.validate_every = validate_every
+        self.validate_every_steps = validate_every_steps
+        self.eval_batchsize = eval_batchsize
         self.get_default_parameters()
 
         self.cnn_network = CNN2D(CNNBlock).double()
         self.lstm_network = LSTM(
             self.cnn_network.linear_size, self.default_gate).double()
         self._set_device()
-        self.net = CNN_LSTM(self.cnn_network, self.lstm_network, self.device)
+        self.net = CNN_LSTM(self.cnn_network, self.lstm_network,
+                            self.device, max_chunk=frame_chunk)
 
         print("=" * 25)
         print("13/18 - Batch size input")
@@ -752,6 +783,7 @@ class CNNLSTM():
         print("14/18 - Validation set size")
         self._get_valsize_input()
 
+        self.checkpointer.seed_split()
         self.model_data = ModelDataset(
             self.x_data, self.y_data, batchsize=self.batchsize, valset_size=self.valset_size, shuffle=self.shuffle)
 
@@ -1019,13 +1051,20 @@ class CNNLSTM():
         # creating the validation dataset
         self.val_dataset = Dataset(xv, yv)
 
-        # creating the training dataset dataloader
-        self.train_loader = torch.utils.data.DataLoader(self.train_dataset, batch_size=self.model_data.get_batchsize(
-        ), shuffle=True)
+        if self.variable_length:
+            # creating dataloaders of packed batches of similar-length sequences
+            self.train_loader = sequence_loader(
+                self.train_dataset, self.model_data.get_batchsize(), shuffle=True)
+            self.dev_loader = sequence_loader(self.val_dataset, get_eval_batchsize(
+                self.model_data.get_batchsize(), self.eval_batchsize), shuffle=False)
+        else:
+            # creating the training dataset dataloader
+            self.train_loader = torch.utils.data.DataLoader(self.train_dataset, batch_size=self.model_data.get_batchsize(
+            ), shuffle=True)
 
-        # creating the validation dataset dataloader
-        self.dev_loader = torch.utils.data.DataLoader(
-            self.val_dataset, batch_size=self.model_data.get_batchsize())
+            # creating the validation dataset dataloader
+            self.dev_loader = torch.utils.data.DataLoader(
+                self.val_dataset, batch_size=get_eval_batchsize(self.model_data.get_batchsize(), self.eval_batchsize))
 
         self.train_model()
         self.get_loss_graph()
@@ -1075,18 +1114,21 @@ class CNNLSTM():
         self.training_acc = []
         self.dev_loss = []
         self.dev_accuracy = []
-        total_predictions = 0.0
-        correct_predictions = 0.0
+        self.dev_epochs = []
+        self.step_validation = []
+        self.checkpointer.start(self)             # restoring the state when resuming
+        total_predictions = self.checkpointer.counters["total_predictions"]
+        correct_predictions = self.checkpointer.counters["correct_predictions"]
 
         print("Training the model...")
 
-        for epoch in range(self.numEpochs):
+        for epoch in self.checkpointer.epochs(self.numEpochs):
             start_time = time.time()
             self.net.train()
             print("Epoch_Number:", epoch)
-            running_loss = 0.0
+            running_loss = self.checkpointer.counters["running_loss"]
 
-            for batch_idx, (data, target) in enumerate(self.train_loader):
+            for batch_idx, (data, target) in self.checkpointer.batches(self.train_loader):
 
                 self.optimizer.zero_grad()
                 data = data.to(self.device)
@@ -1106,6 +1148,13 @@ class CNNLSTM():
                 running_loss += loss.item()
                 loss.backward()
                 self.optimizer.step()
+                self.checkpointer.batch_done(
+                    epoch, batch_idx, running_loss, total_predictions, correct_predictions)
+
+                # validating in the middle of the epoch only if requested
+                if is_validation_step(batch_idx, self.validate_every_steps):
+                    self.step_validation.append(
+                        (epoch, batch_idx + 1) + self.validate_model())
 
             running_loss /= len(self.train_loader)
             self.training_loss.append(running_loss)
@@ -1117,7 +1166,11 @@ class CNNLSTM():
                 self.training_acc.append(acc)
                 print("Training Accuracy:", acc, "%")
 
-            dev_loss, dev_acc = self.validate_model()
+            # validating the model only at the configured cadence
+            validated = is_validation_epoch(
+                epoch, self.numEpochs, self.validate_every)
+            if validated:
+                dev_loss, dev_acc = self.validate_model()
 
             if self.scheduler_input != "1":
                 self.scheduler.step()
@@ -1127,46 +1180,26 @@ class CNNLSTM():
             print("Epoch Time:", end_time - start_time, "s")
             print("#"*50)
 
-            self.dev_loss.append(dev_loss)
+            if validated:
+                self.dev_epochs.append(epoch)
+                self.dev_loss.append(dev_loss)
 
-            # saving the epoch validation accuracy only if the loss function is Cross entropy
-            if self.criterion_input == "1":
-                self.dev_accuracy.append(dev_acc)
+                # saving the epoch validation accuracy only if the loss function is Cross entropy
+                if self.criterion_input == "1":
+                    self.dev_accuracy.append(dev_acc)
 
-    def validate_model(self):
-        with torch.no_grad():
-            self.net.eval()
-        running_loss = 0.0
-        total_predictions = 0.0
-        correct_predictions = 0.0
-        acc = 0
-        self.actual = []
-        self.predict = []
-
-        for batch_idx, (data, target) in enumerate(self.dev_loader):
-            data = data.to(self.device)
-            target = target.to(self.device)
-            outputs = self.net(data)
+            self.checkpointer.epoch_done(
+                epoch, total_predictions, correct_predictions)
 
-            if self.criterion_input == "1":
-                loss = self.criterion(outputs, target.long())
-                _, predicted = torch.max(outputs.data, 1)
-                total_predictions += target.size(0)
-                correct_predictions += (predicted == target).sum().item()
-                self.predict.append(predicted.detach().cpu().numpy())
-            else:
-                loss = self.criterion(outputs, target)
-                self.predict.append(outputs.detach().cpu().numpy())
+        self.checkpointer.close()
 
-            running_loss += loss.item()
-            self.actual.append(target.detach().cpu().numpy())
-
-        running_loss /= len(self.dev_loader)
+    def validate_model(self):
+        running_loss, acc, self.predict, self.actual = evaluate(
+            self.net, self.dev_loader, self.criterion, self.criterion_input == "1", self.device)
         print("Validation Loss:", running_loss)
 
-        # calculating and printing the epoch accuracy only if the loss function is Cross entropy
+        # printing the accuracy only if the loss function is Cross entropy
         if self.criterion_input == "1":
-            acc = (correct_predictions/total_predictions)*100.0
             print("Validation Accuracy:", acc, "%")
 
         return running_loss, acc
@@ -1174,7 +1207,7 @@ class CNNLSTM():
     def get_loss_graph(self):
         plt.figure(figsize=(8, 8))
         plt.plot(self.training_loss, label="Training Loss")
-        plt.plot(self.dev_loss, label="Validation Loss")
+        plt.plot(self.dev_epochs, self.dev_loss, label="Validation Loss")
         plt.legend()
         plt.title("Model Loss")
         plt.xlabel("Epochs")
@@ -1184,7 +1217,7 @@ class CNNLSTM():
     def get_accuracy_graph(self):
         plt.figure(figsize=(8, 8))
         plt.plot(self.training_acc, label="Training Accuracy")
-        plt.plot(self.dev_accuracy, label="Validation Accuracy")
+        plt.plot(self.dev_epochs, self.dev_accuracy, label="Validation Accuracy")
         plt.legend()
         plt.title("Model accuracy")
         plt.xlabel("Epochs")
@@ -1192,20 +1225,17 @@ class CNNLSTM():
         plt.savefig("accuracy.png")
 
     def get_confusion_matrix(self):
-        result = confusion_matrix(np.concatenate(
-            np.array(self.predict)), np.concatenate(np.array(self.actual)))
+        result = confusion_matrix(self.predict, self.actual)
         print("Confusion Matrix:")
         print(result)
 
     def get_r2_score(self):
-        result = r2_score(np.concatenate(np.array(self.predict)),
-                          np.concatenate(np.array(self.actual)))
+        result = r2_score(self.predict, self.actual)
         print("r2 score: ")
         print(result)
 
         plt.figure(figsize=(8, 8))
-        plt.scatter(np.concatenate(np.array(self.actual)), np.concatenate(
-            np.array(self.predict)), label="r2 score", s=1)
+        plt.scatter(self.actual, self.predict, label="r2 score", s=1)
         plt.legend()
         plt.title("Model r2 score: " + str(result))
         plt.xlabel("labels")
@@ -1220,15 +1250,68 @@ class CNNLSTM():
         has (3, 50, 50) resized or original input size, the shape of the
         array must be (10, 3, 50, 50).
         View the documentation at https://manufacturingnet.readthedocs.io/
+        Sequences of different lengths can be passed as a list of arrays
+        of shape (length, channels, height, width).
         """
-        if len(x_input.shape) == 3:
-            x_input = (x_input).reshape(
-                1, x_input.shape[0], x_input.shape[1], x_input.shape[2])
+        if is_variable_length(x_input):
+            x_input = pack_inputs(x_input, self.device)
+        else:
+            if len(x_input.shape) == 3:
+                x_input = (x_input).reshape(
+                    1, x_input.shape[0], x_input.shape[1], x_input.shape[2])
 
-        x_input = torch.from_numpy(x_input).to(self.device)
-        net_output = self.net.predict(x_input)
+            x_input = torch.from_numpy(x_input).to(self.device)
+
+        self.net.eval()
+        with inference_mode():
+            net_output = self.net(x_input)
 
         if self.criterion_input == "1":
             _, net_output = torch.max(net_output.data, 1)
 
-        return net_outp
+        return net_output
+
+    def predict_batched(self, X, batch_size=1024, num_threads=None, output=None):
+        """Makes predictions on a large dataset in batches, without
+        building autograd graphs. X can be a numpy array, a numpy memmap
+        or an iterable of arrays, with the number of examples as the
+        first dimension. output selects "class" (class indices), "proba"
+        (class probabilities) or "value" (regression values); by default
+        class indices are returned for classification and values for
+        regression. num_threads sets the number of CPU threads used by
+        torch. Returns a numpy array.
+        """
+        return predict_batched(self.net, X, batch_size=batch_size, num_threads=num_threads,
+                               output=output, classification=self.criterion_input == "1", device=self.device)
+
+    def export(self, path, format="torchscript", example_input=None, normalizer=None):
+        """Exports the trained network to the directory path as a
+        standalone artifact that is loaded with
+        ManufacturingNet.runtime.load(path). format is "torchscript" or
+        "onnx". The metadata holds the task, input shape and dtype, the
+        architecture config and, if a fitted normalizer is given, its
+        statistics. Models trained on variable-length sequences need a
+        padded example_input of shape (1, length, ...).
+        """
+        return export_model(self, path, format=format, example_input=example_input, normalizer=normalizer)
+
+    def quantize(self, method="dynamic", calibration_batches=10, backend=None, report=True):
+        """Builds an int8 copy of the trained network for fast CPU
+        inference and stores it in quantized_net. Dynamic quantization
+        ("dynamic") stores the weights of the linear and LSTM layers in
+        int8; the CNN layers stay in float32. With report, the accuracy
+        and latency of the quantized network are compared with the float
+        network on the validation data and stored in quantization_report.
+        """
+        self.quantized_net, self.quantization_report = quantize_model(
+            self, method, calibration_batches=calibration_batches, backend=backend, report=report)
+        return self.quantized_net
+
+    def get_streaming_predictor(self):
+        """Returns a StreamingPredictor built on the trained network for
+        online monitoring. It keeps the LSTM state of every stream between
+        calls, so each new frame or block of frames is processed without
+        re-running the history.
+        View the documentation at https://manufacturingnet.readthedocs.io/
+        """
+        return StreamingPredictor(self)
@@ -14,6 +14,16 @@ import torch.optim as optim
 import torch.optim.lr_scheduler as scheduler
 import torch.utils.data as data
 
+from .checkpoint import TrainingCheckpointer
+from .evaluation import (evaluate, get_eval_batchsize, inference_mode,
+                         is_validation_epoch, is_validation_step)
+from .export import export_model
+from .inference import predict_batched
+from .quantization import quantize_model
+from .sequences import (PackedSequence, is_variable_length, last_valid_output,
+                        pack_inputs, sequence_loader, to_sequence_list)
+from .streaming import StreamingPredictor
+
 
 # The following class is used to create necessary inputs for dataset class and dataloader class used during training process
 class ModelDataset():
@@ -68,11 +78,11 @@ class Dataset(data.Dataset):
 
 
 # The following class builds an LSTM network
-class LSTM(nn.Module):
+class LSTMNetwork(nn.Module):
 
     def __init__(self, if_default):
 
-        super(LSTM, self).__init__()
+        super(LSTMNetwork, self).__init__()
 
         self.default_gate = if_default
 
@@ -216,19 +226,26 @@ class LSTM(nn.Module):
         self.linear3 = nn.Linear(int(self.linear_input/4), self.output_size)
 
     def forward(self, x):
+
+        # Standard Pytorch function used during training. x is either a padded batch of
+        # shape (batch, time, features) or a PackedSequence of variable-length sequences
+
         out, _ = self.lstm(x)
-        out = self.linear1(out[:, -1, :])
+        if isinstance(x, PackedSequence):
+            out = last_valid_output(out)
+        else:
+            out = out[:, -1, :]
+        out = self.linear1(out)
         out = self.linear2(out)
         out = self.linear3(out)
 
         return out
 
     def predict(self, x):
-        out, _ = self.lstm(x)
-        out = self.linear1(out[:, -1, :])
-        out = self.linear2(out)
-        out = self.linear3(out)
-        return out
+
+        # Method for getting output during inference time once the model is trained
+
+        return self.forward(x)
 
 
 # The following class will be called by a user. The class calls other necessary classes to build a complete pipeline required for training
@@ -238,7 +255,7 @@ class LSTM():
 
     """
 
-    def __init__(self, X, Y, shuffle=True):
+    def __init__(self, X, Y, shuffle=True, resume_from=None, checkpoint_path=None, checkpoint_every=1, checkpoint_batches=None, validate_every=1, validate_every_steps=None, eval_batchsize=None, lengths=None):
 
         # Lists used in the functions below
         self.criterion_list = {1: nn.CrossEntropyLoss(), 2: torch.nn.L1Loss(
@@ -248,10 +265,24 @@ class LSTM():
         self.y_data = Y
         self.shuffle = shuffle
 
+        # sequences of different lengths are trained as packed, length-bucketed batches
+        self.variable_length = is_variable_length(X, lengths)
+        if self.variable_length:
+            self.x_data = to_sequence_list(X, lengths)
+
+        # checkpointing and resuming of the training state
+        self.checkpointer = TrainingCheckpointer(
+            resume_from, checkpoint_path, checkpoint_every, checkpoint_batches)
+
+        # validation cadence and validation batch size
+        self.validate_every = validate_every
+        self.validate_every_steps = validate_every_steps
+        self.eval_batchsize = eval_batchsize
+
         self.get_default_paramters()            # getting default parameters argument
 
         # building a network architecture
-        self.net = (LSTM(self.default_gate)).double()
+        self.net = (LSTMNetwork(self.default_gate)).double()
 
         print('='*25)
         print('6/11 - Batch size input')
@@ -263,6 +294,7 @@ class LSTM():
         self._get_valsize_input()                # getting a train-validation split
 
         # splitting the data into training and validation sets
+        self.checkpointer.seed_split()
         self.model_data = ModelDataset(
             self.x_data, self.y_data, batchsize=self.batchsize, valset_size=self.valset_size, shuffle=self.shuffle)
 
@@ -549,12 +581,22 @@ class LSTM():
         # creating the validation dataset
         self.val_dataset = Dataset(xv, yv)
 
-        self.train_loader = torch.utils.data.DataLoader(self.train_dataset, batch_size=self.model_data.get_batchsize(
-        ), shuffle=True)           # creating the training dataset dataloadet
+        if self.variable_length:
+
+            # creating dataloaders of packed batches of similar-length sequences
+            self.train_loader = sequence_loader(
+                self.train_dataset, self.model_data.get_batchsize(), shuffle=True)
+            self.dev_loader = sequence_loader(self.val_dataset, get_eval_batchsize(
+                self.model_data.get_batchsize(), self.eval_batchsize), shuffle=False)
 
-        # creating the validation dataset dataloader
-        self.dev_loader = torch.utils.data.DataLoader(
-            self.val_dataset, batch_size=self.model_data.get_batchsize())
+        else:
+
+            self.train_loader = torch.utils.data.DataLoader(self.train_dataset, batch_size=self.model_data.get_batchsize(
+            ), shuffle=True)           # creating the training dataset dataloadet
+
+            # creating the validation dataset dataloader
+            self.dev_loader = torch.utils.data.DataLoader(
+                self.val_dataset, batch_size=get_eval_batchsize(self.model_data.get_batchsize(), self.eval_batchsize))
 
         self.train_model()          # training the model
 
@@ -617,19 +659,22 @@ class LSTM():
         self.training_acc = []
         self.dev_loss = []
         self.dev_accuracy = []
-        total_predictions = 0.0
-        correct_predictions = 0.0
+        self.dev_epochs = []
+        self.step_validation = []
+        self.checkpointer.start(self)             # restoring the state when resuming
+        total_predictions = self.checkpointer.counters['total_predictions']
+        correct_predictions = self.checkpointer.counters['correct_predictions']
 
         print('Training the model...')
 
-        for epoch in range(self.numEpochs):
+        for epoch in self.checkpointer.epochs(self.numEpochs):
 
             start_time = time.time()
             self.net.train()
             print('Epoch_Number: ', epoch)
-            running_loss = 0.0
+            running_loss = self.checkpointer.counters['running_loss']
 
-            for batch_idx, (data, target) in enumerate(self.train_loader):
+            for batch_idx, (data, target) in self.checkpointer.batches(self.train_loader):
 
                 self.optimizer.zero_grad()
                 data = data.to(self.device)
@@ -652,6 +697,14 @@ class LSTM():
                 running_loss += loss.item()
                 loss.backward()
                 self.optimizer.step()
+                self.checkpointer.batch_done(
+                    epoch, batch_idx, running_loss, total_predictions, correct_predictions)
+
+                # validating in the middle of the epoch only if requested
+                if is_validation_step(batch_idx, self.validate_every_steps):
+
+                    self.step_validation.append(
+                        (epoch, batch_idx + 1) + self.validate_model())
 
             running_loss /= len(self.train_loader)
             self.training_loss.append(running_loss)
@@ -664,7 +717,12 @@ class LSTM():
                 self.training_acc.append(acc)
                 print('Training Accuracy: ', acc, '%')
 
-            dev_loss, dev_acc = self.validate_model()
+            # validating the model only at the configured cadence
+            validated = is_validation_epoch(
+                epoch, self.numEpochs, self.validate_every)
+            if validated:
+
+                dev_loss, dev_acc = self.validate_model()
 
             if self.scheduler_input != '1':
 
@@ -675,51 +733,32 @@ class LSTM():
             print('Epoch Time: ', end_time - start_time, 's')
             print('#'*50)
 
-            self.dev_loss.append(dev_loss)
-
-            # saving the epoch validation accuracy only if the loss function is Cross entropy
-            if self.criterion_input == '1':
-
-                self.dev_accuracy.append(dev_acc)
+            if validated:
 
-    def validate_model(self):
+                self.dev_epochs.append(epoch)
+                self.dev_loss.append(dev_loss)
 
-        with torch.no_grad():
-            self.net.eval()
-        running_loss = 0.0
-        total_predictions = 0.0
-        correct_predictions = 0.0
-        acc = 0
-        self.actual = []
-        self.predict = []
+                # saving the epoch validation accuracy only if the loss function is Cross entropy
+                if self.criterion_input == '1':
 
-        for batch_idx, (data, target) in enumerate(self.dev_loader):
+                    self.dev_accuracy.append(dev_acc)
 
-            data = data.to(self.device)
-            target = target.to(self.device)
-            outputs = self.net(data)
+            self.checkpointer.epoch_done(
+                epoch, total_predictions, correct_predictions)
 
-            if self.criterion_input == '1':
+        self.checkpointer.close()
 
-                loss = self.criterion(outputs, target.long())
-                _, predicted = torch.max(outputs.data, 1)
-                total_predictions += target.size(0)
-                correct_predictions += (predicted == target).sum().item()
-                self.predict.append(predicted.detach().cpu().numpy())
+    def validate_model(self):
 
-            else:
-                loss = self.criterion(outputs, target)
-                self.predict.append(outputs.detach().cpu().numpy())
-            running_loss += loss.item()
-            self.actual.append(target.detach().cpu().numpy())
+        # Method for evaluating the model on the validation set in inference mode
 
-        running_loss /= len(self.dev_loader)
+        running_loss, acc, self.predict, self.actual = evaluate(
+            self.net, self.dev_loader, self.criterion, self.criterion_input == '1', self.device)
         print('Validation Loss: ', running_loss)
 
-        # calculating and printing the epoch accuracy only if the loss function is Cross entropy
+        # printing the accuracy only if the loss function is Cross entropy
         if self.criterion_input == '1':
 
-            acc = (correct_predictions/total_predictions)*100.0
             print('Validation Accuracy: ', acc, '%')
 
         return running_loss, acc
@@ -730,7 +769,7 @@ class LSTM():
 
         plt.figure(figsize=(8, 8))
         plt.plot(self.training_loss, label='Training Loss')
-        plt.plot(self.dev_loss, label='Validation Loss')
+        plt.plot(self.dev_epochs, self.dev_loss, label='Validation Loss')
         plt.legend()
         plt.title('Model Loss')
         plt.xlabel('Epochs')
@@ -743,7 +782,7 @@ class LSTM():
 
         plt.figure(figsize=(8, 8))
         plt.plot(self.training_acc, label='Training Accuracy')
-        plt.plot(self.dev_accuracy, label='Validation Accuracy')
+        plt.plot(self.dev_epochs, self.dev_accuracy, label='Validation Accuracy')
         plt.legend()
         plt.title('Model accuracy')
         plt.xlabel('Epochs')
@@ -755,21 +794,18 @@ class LSTM():
         # Method for getting the confusion matrix for classification problem
         print('Confusion Matix: ')
 
-        result = confusion_matrix(np.concatenate(
-            np.array(self.predict)), np.concatenate(np.array(self.actual)))
+        result = confusion_matrix(self.predict, self.actual)
         print(result)
 
     def get_r2_score(self):
 
         # Method for getting the r2 score for regression problem
         print('r2 score: ')
-        result = r2_score(np.concatenate(np.array(self.predict)),
-                          np.concatenate(np.array(self.actual)))
+        result = r2_score(self.predict, self.actual)
         print(result)
 
         plt.figure(figsize=(8, 8))
-        plt.scatter(np.concatenate(np.array(self.actual)), np.concatenate(
-            np.array(self.predict)), label='r2 score', s=1)
+        plt.scatter(self.actual, self.predict, label='r2 score', s=1)
         plt.legend()
         plt.title('Model r2 score: ' + str(result))
         plt.xlabel('labels')
@@ -782,22 +818,90 @@ class LSTM():
         Pass in an input numpy array for making prediction.
         For passing multiple inputs, make sure to keep number of examples to be the first dimension of the input.
         For example, 5 data points need to be checked and each point has 14 input size with time sequence dimension of 4, the shape of the array must be (5,4,14).
+        Sequences of different lengths can be passed as a list of arrays of shape (length, 14).
         For more information, please see documentation.
 
         """
 
         # Method to use at the time of inference
 
-        if len(x_input.shape) == 2:             # handling the case of single
+        if is_variable_length(x_input):             # handling the case of variable-length sequences
+
+            x_input = pack_inputs(x_input, self.device)
 
-            x_input = (x_input).reshape(1, x_input.shape[0], x_input.shape[1])
+        else:
+
+            if len(x_input.shape) == 2:             # handling the case of single
+
+                x_input = (x_input).reshape(1, x_input.shape[0], x_input.shape[1])
+
+            x_input = torch.from_numpy(x_input).to(self.device)
 
-        x_input = torch.from_numpy(x_input).to(self.device)
+        self.net.eval()
+        with inference_mode():
 
-        net_output = self.net.predict(x_input)
+            net_output = self.net(x_input)
 
         if self.criterion_input == '1':             # handling the case of classification problem
 
             _, net_output = torch.max(net_output.data, 1)
 
         return net_output
+
+    def predict_batched(self, X, batch_size=1024, num_threads=None, output=None):
+        """
+
+        Makes predictions on a large dataset in batches, without building autograd graphs.
+        X can be a numpy array, a numpy memmap or an iterable of arrays, with the number of examples as the first dimension.
+        output selects 'class' (class indices), 'proba' (class probabilities) or 'value' (regression values);
+        by default class indices are returned for classification and values for regression.
+        num_threads sets the number of CPU threads used by torch. Returns a numpy array.
+
+        """
+
+        return predict_batched(self.net, X, batch_size=batch_size, num_threads=num_threads,
+                               output=output, classification=self.criterion_input == '1', device=self.device)
+
+    def export(self, path, format='torchscript', example_input=None, normalizer=None):
+        """
+
+        Exports the trained network to the directory path as a standalone artifact that is loaded with
+        ManufacturingNet.runtime.load(path), without the training code or its dependencies.
+        format is 'torchscript' or 'onnx'. The metadata written next to the model holds the task, the input
+        shape and dtype, the class mapping, the architecture config and, if a fitted normalizer is given,
+        its statistics so that the loader normalizes raw inputs the same way.
+        example_input is one input batch used for tracing; by default a validation sample is used.
+
+        """
+
+        return export_model(self, path, format=format, example_input=example_input, normalizer=normalizer)
+
+    def quantize(self, method='dynamic', calibration_batches=10, backend=None, report=True):
+        """
+
+        Builds an int8 copy of the trained network for fast CPU inference and stores it in quantized_net.
+        Dynamic quantization ('dynamic') stores the weights of the linear and LSTM layers in int8;
+        static quantization ('static') also quantizes the activations, calibrated on calibration_batches validation batches.
+        backend is the quantized engine ('fbgemm' or 'x86' for Intel and AMD CPUs, 'qnnpack' for ARM).
+        With report, the accuracy and latency of the quantized network are compared with the float network
+        on the validation data, printed and stored in quantization_report.
+
+        """
+
+        self.quantized_net, self.quantization_report = quantize_model(
+            self, method, calibration_batches=calibration_batches, backend=backend, report=report)
+        return self.quantized_net
+
+    def get_streaming_predictor(self):
+        """
+
+        Returns a StreamingPredictor built on the trained network for online monitoring.
+        It keeps the LSTM state of every stream between calls, so each new sample or block of samples
+        is processed without re-running the history. For example:
+
+            stream = model.get_streaming_predictor()
+            prediction = stream.update('machine_1', new_samples)
+
+        """
+
+        return StreamingPredictor(self)
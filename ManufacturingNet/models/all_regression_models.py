@@ -1,20 +1,30 @@
 """AllRegressionModels runs every available regression algorithm on the
 given dataset and outputs the coefficient of determination and
-execution time of each successful model when run() is called.
+execution time of each successful model when run() is called. In
+benchmark mode, all models and cross validation folds are run in
+parallel worker processes that share the dataset and the fold indices.
+With a result cache, models whose inputs haven't changed since an
+earlier run aren't fitted again.
 
 View the documentation at https://manufacturingnet.readthedocs.io/.
 """
 
 import io
+import os
 import time
 from contextlib import redirect_stderr, redirect_stdout
 
+import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
 from sklearn.svm import SVR, LinearSVR, NuSVR
 from xgboost import XGBRegressor
 
+from .parallel import FoldCache, run_models, summarize
+from .result_cache import ResultCache, fingerprint
+from .sparse_inputs import check_sparse_support, is_sliceable
+
 
 class AllRegressionModels:
     """Wrapper class around all supported regression models:
@@ -29,6 +39,13 @@ class AllRegressionModels:
 
         self.test_size = None
         self.verbose = None
+        self.benchmark = False
+        self.n_jobs = None
+        self.time_budget = None
+        self.random_state = None
+        self.cache_dir = None
+        self.cache_max_size_mb = 1024
+        self.cache_max_age_days = 30
 
         self.linear_regression = None
         self.random_forest = None
@@ -38,7 +55,14 @@ class AllRegressionModels:
         self.XGB_regressor = None
 
         self._regression_models = {"Model": ["R2 Score", "Time (seconds)"]}
+        self._benchmark_results = {"Model": ["R2 Score", "5-Fold CV Mean",
+                                             "Fit Time (s)", "Predict Time (s)",
+                                             "Peak Memory (MB)"]}
         self._failures = []
+        self._cache = None
+        self._data_key = None
+        self._split_seed = None
+        self._cached_models = []
 
     # Accessor methods
 
@@ -50,6 +74,14 @@ class AllRegressionModels:
         """Accessor method for labels."""
         return self.labels
 
+    def get_random_state(self):
+        """Accessor method for random_state."""
+        return self.random_state
+
+    def get_cache_dir(self):
+        """Accessor method for cache_dir."""
+        return self.cache_dir
+
     def get_all_regression_models(self):
         """Accessor method that returns a list of all models."""
         return [self.linear_regression, self.random_forest, self.SVR,
@@ -89,15 +121,49 @@ class AllRegressionModels:
         """Modifier method for labels."""
         self.labels = new_labels
 
+    def set_random_state(self, new_random_state=None):
+        """Modifier method for random_state, the seed of the train/test
+        split.
+        """
+        self.random_state = new_random_state
+
+    def set_cache(self, new_cache_dir=None, new_max_size_mb=1024,
+                  new_max_age_days=30):
+        """Modifier method for the result cache. Results are cached in the
+        directory new_cache_dir, or not at all if it is None; entries
+        created more than new_max_age_days ago are evicted, then the least
+        recently used ones until the cache is smaller than new_max_size_mb.
+        """
+        self.cache_dir = new_cache_dir
+        self.cache_max_size_mb = new_max_size_mb
+        self.cache_max_age_days = new_max_age_days
+
     # Regression functionality
 
     def run(self):
         """Driver method for running all regression models with given
         attributes and labels.
         """
+        # Sparse attributes must be sliceable by rows
+        if not is_sliceable(self.attributes):
+            print("attributes is a sparse matrix that can't be sliced by",
+                  "rows; convert it with tocsr() to fix this!")
+            return
+
         # Get parameters; create models
         self._create_models()
 
+        # Fingerprint the dataset for the result cache, if there is one
+        self._open_cache()
+
+        # Run models and folds in worker processes; results are printed
+        # as soon as each model finishes
+        if self.benchmark:
+            self._benchmark_regression_models_runner()
+            self._print_failures()
+            self._close_cache()
+            return
+
         # Call helper method for running all regression models
         # Suppress output, if needed
         if not self.verbose:
@@ -110,9 +176,19 @@ class AllRegressionModels:
 
         # Print results
         self._print_results()
+        self._close_cache()
 
     # Helper methods
 
+    def _models(self):
+        """Helper method that returns the (name, attribute) pairs of all
+        models.
+        """
+        return [("LinearRegression", "linear_regression"),
+                ("RandomForest", "random_forest"), ("SVR", "SVR"),
+                ("NuSVR", "nu_SVR"), ("LinearSVR", "linear_SVR"),
+                ("XGBRegressor", "XGB_regressor")]
+
     def _create_models(self):
         """Prompts user for parameter input and instantiates all the
         regressor models.
@@ -154,6 +230,59 @@ class AllRegressionModels:
 
         print("test_size =", self.test_size)
 
+        while True:
+            user_input = input("\nRun in benchmark mode, fitting all models "
+                               + "and 5 CV folds in parallel (y/N)? ").lower()
+            if user_input == "y":
+                self.benchmark = True
+                break
+            elif user_input in {"n", ""}:
+                self.benchmark = False
+                break
+            else:
+                print("Invalid input.")
+
+        print("benchmark =", self.benchmark)
+
+        if self.benchmark:
+            while True:
+                user_input = input("\nNumber of worker processes "
+                                   + "(default=all cores): ")
+                try:
+                    if user_input == "":
+                        self.n_jobs = os.cpu_count()
+                        break
+
+                    user_input = int(user_input)
+                    if user_input <= 0:
+                        raise Exception
+                    else:
+                        self.n_jobs = user_input
+                        break
+                except Exception:
+                    print("Invalid input.")
+
+            print("n_jobs =", self.n_jobs)
+
+            while True:
+                user_input = input("\nTimeout per model in seconds "
+                                   + "(leave blank for none): ")
+                try:
+                    if user_input == "":
+                        self.time_budget = None
+                        break
+
+                    user_input = float(user_input)
+                    if user_input <= 0:
+                        raise Exception
+                    else:
+                        self.time_budget = user_input
+                        break
+                except Exception:
+                    print("Invalid input.")
+
+            print("time_budget =", self.time_budget)
+
         print("\n===========================================")
         print("= End of inputs; press enter to continue. =")
         input("===========================================\n")
@@ -174,107 +303,205 @@ class AllRegressionModels:
         # Split dataset
         dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test = \
             train_test_split(self.attributes, self.labels,
-                             test_size=self.test_size)
+                             test_size=self.test_size,
+                             random_state=self._split_seed)
 
-        # Run and time all models; identify each as success or failure
-        try:
-            start_time = time.time()
-            self.linear_regression.fit(dataset_X_train, dataset_y_train)
-            end_time = time.time()
+        # Run and time all models; identify each as success or failure.
+        # Models whose results are cached aren't run again
+        for name, attribute in self._models():
+            if self._load_cached(name, attribute, "serial"):
+                continue
 
-            r2_score = self.linear_regression.score(dataset_X_test,
-                                                    dataset_y_test)
-            elapsed_time = end_time - start_time
+            model = getattr(self, attribute)
+            try:
+                check_sparse_support(model, self.attributes)
+                start_time = time.time()
+                model.fit(dataset_X_train, dataset_y_train)
+                end_time = time.time()
+
+                r2_score = model.score(dataset_X_test, dataset_y_test)
+                elapsed_time = end_time - start_time
+
+                self._regression_models[name] = [r2_score, elapsed_time]
+            except Exception as e:
+                print("\n" + name, "failed. Exception message:")
+                print(e, "\n")
+                self._failures.append(name)
+                continue
+
+            self._store_cached(name, attribute, "serial")
+
+    def _benchmark_regression_models_runner(self):
+        """Helper method that runs the holdout fit and the 5 CV folds of
+        all models concurrently in worker processes, printing each
+        model's results as soon as it finishes. The split and fold indices
+        are computed once and shared with the data by every worker.
+        """
+        labels = np.ravel(self.labels)
+        fold_cache = FoldCache(labels, self.test_size, n_folds=5,
+                               random_state=self._split_seed)
+
+        models = self._models()
+        attribute_names = dict(models)
+
+        self._print_header(self._benchmark_results["Model"])
+
+        def on_model_done(name, results, error):
+            if error is not None:
+                self._failures.append(name + " (" + error + ")")
+                return
+
+            summary = summarize(results, fold_cache.n_folds)
+            setattr(self, attribute_names[name], summary["estimator"])
+            self._regression_models[name] = \
+                [summary["score"], summary["fit_time"]]
+            self._benchmark_results[name] = \
+                [summary["score"], summary["cv_score"], summary["fit_time"],
+                 summary["predict_time"], summary["peak_memory"]]
+            self._print_row(name, self._benchmark_results[name])
+            self._store_cached(name, attribute_names[name], "benchmark")
+
+        # Models that would densify sparse attributes aren't run, and
+        # neither are those whose results are cached
+        runnable = []
+        for name, attribute in models:
+            if self._load_cached(name, attribute, "benchmark"):
+                self._print_row(name, self._benchmark_results[name])
+                continue
+            try:
+                check_sparse_support(getattr(self, attribute),
+                                     self.attributes)
+                runnable.append((name, getattr(self, attribute)))
+            except ValueError as e:
+                self._failures.append(name + " (" + str(e) + ")")
+
+        run_models(runnable, self.attributes, labels, fold_cache,
+                   n_jobs=self.n_jobs, time_budget=self.time_budget,
+                   verbose=self.verbose, on_model_done=on_model_done)
+
+    def _open_cache(self):
+        """Helper method that opens the result cache and fingerprints the
+        attributes and labels, if cache_dir is set. The split is seeded
+        with random_state, or 0 if it isn't set, so that cached results
+        stay comparable.
+        """
+        self._cache = None
+        self._cached_models = []
+        self._split_seed = self.random_state
+        if self.cache_dir is None:
+            return
 
-            self._regression_models["LinearRegression"] = \
-                [r2_score, elapsed_time]
-        except Exception as e:
-            print("\nLinearRegression failed. Exception message:")
-            print(e, "\n")
-            self._failures.append("LinearRegression")
+        if self._split_seed is None:
+            self._split_seed = 0
 
+        # Try to open the cache
+        # Handle exception if cache_dir isn't writable
         try:
-            start_time = time.time()
-            self.random_forest.fit(dataset_X_train, dataset_y_train)
-            end_time = time.time()
-
-            r2_score = self.random_forest.score(dataset_X_test, dataset_y_test)
-            elapsed_time = end_time - start_time
-
-            self._regression_models["RandomForest"] = [r2_score, elapsed_time]
+            self._cache = ResultCache(self.cache_dir, self.cache_max_size_mb,
+                                      self.cache_max_age_days)
+            self._data_key = [fingerprint(self.attributes),
+                              fingerprint(np.ravel(self.labels))]
         except Exception as e:
-            print("\nRandomForest failed. Exception message:")
-            print(e, "\n")
-            self._failures.append("RandomForest")
-
-        try:
-            start_time = time.time()
-            self.SVR.fit(dataset_X_train, dataset_y_train)
-            end_time = time.time()
-
-            r2_score = self.SVR.score(dataset_X_test, dataset_y_test)
-            elapsed_time = end_time - start_time
+            print("The result cache failed to open; results won't be cached.")
+            print("Here is the exception message:")
+            print(e)
+            self._cache = None
+
+    def _cache_key(self, name, attribute, mode):
+        """Helper method that returns the result cache key of a model."""
+        return self._cache.key(self._data_key, name, getattr(self, attribute),
+                               runner=type(self).__name__, mode=mode,
+                               test_size=self.test_size,
+                               random_state=self._split_seed, n_folds=5)
+
+    def _load_cached(self, name, attribute, mode):
+        """Helper method that restores the results and fitted estimator of
+        a model from the result cache. Returns whether they were found.
+        """
+        if self._cache is None:
+            return False
+
+        entry = self._cache.get(self._cache_key(name, attribute, mode))
+        if entry is None:
+            return False
+
+        results, estimator = entry
+        setattr(self, attribute, estimator)
+        self._regression_models[name] = results["regression"]
+        if "benchmark" in results:
+            self._benchmark_results[name] = results["benchmark"]
+        self._cached_models.append(name)
+        return True
+
+    def _store_cached(self, name, attribute, mode):
+        """Helper method that stores the results and fitted estimator of a
+        model in the result cache.
+        """
+        if self._cache is None:
+            return
 
-            self._regression_models["SVR"] = [r2_score, elapsed_time]
-        except Exception as e:
-            print("\nSVR failed. Exception message:")
-            print(e, "\n")
-            self._failures.append("SVR")
+        results = {"regression": self._regression_models[name]}
+        if mode == "benchmark":
+            results["benchmark"] = self._benchmark_results[name]
 
+        # Try to store the results
+        # Handle exception if the cache directory is full or unwritable
         try:
-            start_time = time.time()
-            self.nu_SVR.fit(dataset_X_train, dataset_y_train)
-            end_time = time.time()
-
-            r2_score = self.nu_SVR.score(dataset_X_test, dataset_y_test)
-            elapsed_time = end_time - start_time
-
-            self._regression_models["NuSVR"] = [r2_score, elapsed_time]
+            self._cache.put(self._cache_key(name, attribute, mode), name,
+                            results, getattr(self, attribute))
         except Exception as e:
-            print("\nNuSVR failed. Exception message:")
+            print("\nCaching", name, "failed. Exception message:")
             print(e, "\n")
-            self._failures.append("NuSVR")
-
-        try:
-            start_time = time.time()
-            self.linear_SVR.fit(dataset_X_train, dataset_y_train)
-            end_time = time.time()
 
-            r2_score = self.linear_SVR.score(dataset_X_test, dataset_y_test)
-            elapsed_time = end_time - start_time
+    def _close_cache(self):
+        """Helper method that lists the models loaded from the result
+        cache and evicts old entries.
+        """
+        if self._cache is None:
+            return
 
-            self._regression_models["LinearSVR"] = [r2_score, elapsed_time]
-        except Exception as e:
-            print("\nLinearSVR failed. Exception message:")
-            print(e, "\n")
-            self._failures.append("LinearSVR")
+        if len(self._cached_models) > 0:
+            print("Loaded from the result cache:",
+                  ", ".join(self._cached_models), "\n")
 
+        # Try to evict old entries
+        # Handle exception if another run removed them first
         try:
-            start_time = time.time()
-            self.XGB_regressor.fit(dataset_X_train, dataset_y_train)
-            end_time = time.time()
-
-            r2_score = self.XGB_regressor.score(dataset_X_test, dataset_y_test)
-            elapsed_time = end_time - start_time
-
-            self._regression_models["XGBRegressor"] = [r2_score, elapsed_time]
-        except Exception as e:
-            print("\nXGBRegressor failed. Exception message:")
-            print(e, "\n")
-            self._failures.append("XGBRegressor")
+            self._cache.evict()
+        except OSError as e:
+            print("The result cache failed to evict old entries.")
+            print("Here is the exception message:")
+            print(e)
 
     def _print_results(self):
         """Helper method that prints results of
         _all_regression_models_runner() in tabular form.
         """
+        self._print_header(self._regression_models["Model"])
+
         # Print models that didn't fail
+        for model, data in self._regression_models.items():
+            if model != "Model":
+                self._print_row(model, data)
+
+        self._print_failures()
+
+    def _print_header(self, columns):
+        """Helper method that prints the header of the results table."""
         print("\n===========")
         print("= Results =")
         print("===========")
 
-        for model, data in self._regression_models.items():
-            print("\n{:<20} {:<20} {:<20}".format(model, data[0], data[1]))
+        self._print_row("Model", columns)
+
+    def _print_row(self, model, data):
+        """Helper method that prints one row of the results table."""
+        row = "{:<20} " * len(data) + "{:<20}"
+        print("\n" + row.format(model, *[str(value) if value is None
+                                          else value for value in data]))
 
+    def _print_failures(self):
+        """Helper method that prints the models that failed, if any."""
         print()
 
         # Print failures, if any
@@ -0,0 +1,204 @@
+"""bulk_scoring predicts large datasets with the fitted models of the
+shallow learning wrappers.
+
+The predict methods of the wrappers print every prediction, which takes
+longer than predicting millions of rows, and they need the whole dataset
+in memory. Bulk scoring reads the dataset chunk by chunk, from arrays,
+sparse matrices, memory-mapped .npy files or a chunk iterator, predicts
+the chunks, optionally on several threads, and writes the predictions to
+an array, a memory-mapped .npy file or a CSV file as they arrive. Only a
+one-line summary is displayed.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Prediction methods that bulk scoring can call on a model
+METHODS = ("predict", "predict_proba", "decision_function")
+
+
+def iter_chunks(dataset_X, chunk_size=10000):
+    """Yields chunks of at most chunk_size rows of dataset_X.
+
+    dataset_X is an array or sparse matrix, the filename of a .npy file,
+    which is memory-mapped, or a callable returning a new iterator over
+    attribute chunks, such as a generator function reading a large file
+    in pieces. Chunks from a callable are used as they are.
+    """
+    if callable(dataset_X):
+        for X in dataset_X():
+            yield X
+        return
+
+    dataset_X = _open(dataset_X)
+    for start in range(0, dataset_X.shape[0], chunk_size):
+        yield dataset_X[start:start + chunk_size]
+
+
+def n_rows(dataset_X):
+    """Returns the number of rows of dataset_X, or None if it is read from
+    a chunk iterator.
+    """
+    if callable(dataset_X):
+        return None
+    return _open(dataset_X).shape[0]
+
+
+def _open(dataset_X):
+    """Memory-maps dataset_X if it is the filename of a .npy file."""
+    if isinstance(dataset_X, (str, os.PathLike)):
+        return np.load(dataset_X, mmap_mode="r")
+    return dataset_X
+
+
+class _Writer:
+    """Writes prediction chunks, in order, to an array or file."""
+
+    def __init__(self, output, total):
+        """Initializes a _Writer for total rows, or an unknown number of
+        rows if total is None. output is None, an array, or a filename.
+        """
+        self.output = output
+        self.total = total
+        self.result = None
+        self.parts = []
+        self.file = None
+        self.offset = 0
+
+        if isinstance(output, (str, os.PathLike)):
+            if str(output).endswith(".npy"):
+                if total is None:
+                    raise ValueError("A .npy output needs the number of rows;"
+                                     + " write chunk iterators to a CSV "
+                                     + "file instead.")
+            else:
+                self.file = open(output, "w")
+        elif output is not None:
+            self.result = output
+
+    def write(self, y):
+        """Writes the predictions of the next chunk."""
+        if self.file is not None:
+            np.savetxt(self.file, y, fmt="%s", delimiter=",")
+        elif self.output is None and self.total is None:
+            self.parts.append(y)
+        else:
+            if self.result is None:
+                shape = (self.total,) + y.shape[1:]
+                if self.output is None:
+                    self.result = np.empty(shape, dtype=y.dtype)
+                else:
+                    self.result = np.lib.format.open_memmap(
+                        self.output, mode="w+", dtype=y.dtype, shape=shape)
+            self.result[self.offset:self.offset + y.shape[0]] = y
+        self.offset += y.shape[0]
+
+    def abort(self):
+        """Closes the CSV file after a failed run."""
+        if self.file is not None:
+            self.file.close()
+
+    def close(self):
+        """Finishes writing. Returns the array of predictions, or the
+        filename for a CSV file.
+        """
+        if self.file is not None:
+            self.file.close()
+            return self.output
+        if self.output is None and self.total is None:
+            return np.concatenate(self.parts) if self.parts else np.empty(0)
+        if self.result is None:
+            return np.empty(0)
+        if isinstance(self.result, np.memmap):
+            self.result.flush()
+        if self.offset != self.result.shape[0]:
+            raise ValueError("output has " + str(self.result.shape[0])
+                             + " rows, but " + str(self.offset)
+                             + " were predicted.")
+        return self.result
+
+
+def score_bulk(predict, dataset_X, output=None, chunk_size=10000,
+               n_threads=1):
+    """Predicts dataset_X chunk by chunk with predict, a function of a
+    chunk of attributes, such as a fitted model's predict method.
+
+    output is None, for a new array; an array or memory-mapped array
+    with one row per datapoint, which is filled in place; or a filename,
+    written as a memory-mapped .npy file if it ends in .npy, and as a
+    CSV file otherwise. With n_threads above 1, that many chunks are
+    predicted at a time on a thread pool, and written in order. Returns
+    the predictions, or the filename of a CSV file, and a summary dict.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1.")
+    if n_threads < 1:
+        raise ValueError("n_threads must be at least 1.")
+
+    start = time.perf_counter()
+    writer = _Writer(output, n_rows(dataset_X))
+    n_chunks = 0
+
+    try:
+        if n_threads == 1:
+            for X in iter_chunks(dataset_X, chunk_size):
+                writer.write(np.asarray(predict(X)))
+                n_chunks += 1
+        else:
+            # At most two chunks per thread are read ahead, which bounds
+            # the memory taken by chunks waiting to be written
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                pending = deque()
+                for X in iter_chunks(dataset_X, chunk_size):
+                    pending.append(executor.submit(predict, X))
+                    if len(pending) >= 2 * n_threads:
+                        writer.write(np.asarray(pending.popleft().result()))
+                        n_chunks += 1
+                while pending:
+                    writer.write(np.asarray(pending.popleft().result()))
+                    n_chunks += 1
+    except BaseException:
+        writer.abort()
+        raise
+
+    result = writer.close()
+    seconds = time.perf_counter() - start
+    return result, {"rows": writer.offset, "chunks": n_chunks,
+                    "seconds": seconds,
+                    "rows_per_second": writer.offset / max(seconds, 1e-9)}
+
+
+def format_summary(name, summary, output=None):
+    """Returns the one-line summary of a bulk scoring run."""
+    destination = ""
+    if isinstance(output, (str, os.PathLike)):
+        destination = ", written to " + str(output)
+    return ("{} scored {} rows in {} chunks in {:.2f} seconds "
+            "({:,.0f} rows/s){}.").format(name, summary["rows"],
+                                          summary["chunks"],
+                                          summary["seconds"],
+                                          summary["rows_per_second"],
+                                          destination)
+
+
+def score_model(model, name, dataset_X, output=None, method="predict",
+                chunk_size=10000, n_threads=1):
+    """Scores dataset_X with the given method of model, as score_bulk()
+    does, and displays the summary. Returns the predictions, or the
+    filename of a CSV file.
+    """
+    if method not in METHODS:
+        raise ValueError("method must be one of " + ", ".join(METHODS) + ".")
+    if not hasattr(model, method):
+        raise ValueError(name + " has no " + method + "() method.")
+
+    result, summary = score_bulk(getattr(model, method), dataset_X, output,
+                                 chunk_size, n_threads)
+    print(format_summary(name, summary, output))
+    return result
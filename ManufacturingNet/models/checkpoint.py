@@ -0,0 +1,288 @@
+# Helpers for saving and resuming the training state of the deep learning wrappers
+
+import copy
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+
+import torch
+
+
+# Training-curve lists stored on every wrapper and carried through a checkpoint
+HISTORY_ATTRIBUTES = ('training_loss', 'training_acc', 'dev_loss', 'dev_accuracy',
+                      'dev_epochs', 'step_validation')
+
+
+def get_rng_state():
+
+    # Method for capturing the state of every random number generator used during training
+
+    return {'python': random.getstate(),
+            'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None}
+
+
+def set_rng_state(state):
+
+    # Method for restoring a state captured by get_rng_state()
+
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def _snapshot(obj):
+
+    # Method for copying a (nested) state dict to the cpu so that training can keep
+    # updating the live tensors while the copy is written in the background
+
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: _snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+def capture_training_state(wrapper, epoch, batch, counters, epoch_rng=None, split_rng=None):
+    """
+    Collects everything needed to continue training a wrapper: the model, optimizer and
+    scheduler states, the epoch/batch counters, the RNG states and the training curves.
+    epoch is the epoch being trained and batch the number of its batches already done.
+    """
+
+    scheduler = getattr(wrapper, 'scheduler', None)
+
+    return {'epoch': epoch,
+            'batch': batch,
+            'counters': dict(counters),
+            'model': _snapshot(wrapper.net.state_dict()),
+            'optimizer': _snapshot(wrapper.optimizer.state_dict()),
+            'scheduler': copy.deepcopy(scheduler.state_dict()) if scheduler is not None else None,
+            'rng': get_rng_state(),
+            'epoch_rng': epoch_rng,
+            'split_rng': split_rng,
+            'history': {name: list(getattr(wrapper, name, [])) for name in HISTORY_ATTRIBUTES}}
+
+
+def restore_training_state(wrapper, state):
+
+    # Method for loading a captured state back into a wrapper whose network,
+    # optimizer and scheduler have already been built with the same settings
+
+    wrapper.net.load_state_dict(state['model'])
+    wrapper.optimizer.load_state_dict(state['optimizer'])
+    if state['scheduler'] is not None and getattr(wrapper, 'scheduler', None) is not None:
+        wrapper.scheduler.load_state_dict(state['scheduler'])
+    for name, values in state['history'].items():
+        setattr(wrapper, name, list(values))
+
+
+def save_checkpoint(state, path):
+
+    # Method for writing a checkpoint atomically: the file is written next to the
+    # target and then renamed over it, so an interrupted write never corrupts it
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+
+    # Method for reading a checkpoint written by save_checkpoint()
+
+    # checkpoints hold RNG states and python counters, not only tensors
+    try:
+        return torch.load(path, map_location='cpu', weights_only=False)
+    except TypeError:               # torch versions without the weights_only argument
+        return torch.load(path, map_location='cpu')
+
+
+class CheckpointWriter():
+    """
+    Writes checkpoints on a background thread so that training does not wait on the disk.
+    If a new checkpoint arrives while the previous one is still queued, the stale one is dropped.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.error = None
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, state):
+
+        # Method for queueing a state snapshot for writing
+
+        while True:
+            try:
+                self._queue.put_nowait(state)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self):
+
+        # Method for waiting until the last queued checkpoint is on disk
+
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            print('An exception occurred while writing the checkpoint', self.path)
+            print('Here is the exception message:')
+            print(self.error)
+
+    def _run(self):
+
+        while True:
+            state = self._queue.get()
+            if state is None:
+                break
+            try:
+                save_checkpoint(state, self.path)
+            except Exception as e:
+                self.error = e
+
+
+class TrainingCheckpointer():
+    """
+    Drives periodic checkpointing and resuming inside a wrapper's train_model().
+
+    resume_from: path of a checkpoint to continue from.
+    checkpoint_path: where checkpoints are written, defaults to resume_from.
+    every: save after every n epochs.
+    every_batches: additionally save after every n batches inside an epoch.
+    """
+
+    def __init__(self, resume_from=None, checkpoint_path=None, every=1, every_batches=None):
+
+        self.resume_from = resume_from
+        self.path = checkpoint_path if checkpoint_path is not None else resume_from
+        self.every = max(1, int(every))
+        self.every_batches = every_batches
+        self.state = load_checkpoint(resume_from) if resume_from is not None else None
+        self.start_epoch = 0
+        self.start_batch = 0
+        self.num_epochs = 0
+        self.counters = {'running_loss': 0.0,
+                         'total_predictions': 0.0, 'correct_predictions': 0.0}
+        self.wrapper = None
+        self._writer = None
+        self._epoch_rng = None
+        self._split_rng = None
+
+    def seed_split(self):
+
+        # Method to call right before the train-validation split, so that a resumed
+        # run validates on exactly the same samples as the original one
+
+        if self.state is not None and self.state.get('split_rng') is not None:
+            np.random.set_state(self.state['split_rng'])
+        self._split_rng = np.random.get_state()
+
+    def start(self, wrapper):
+
+        # Method for restoring the wrapper from the checkpoint (if any) and starting the writer
+
+        self.wrapper = wrapper
+
+        if self.state is not None:
+            restore_training_state(wrapper, self.state)
+            self.start_epoch = self.state['epoch']
+            self.start_batch = self.state['batch']
+            self.counters.update(self.state['counters'])
+            if self.start_batch == 0:
+                set_rng_state(self.state['rng'])
+            print('Resuming training from', self.resume_from, 'at epoch',
+                  self.start_epoch, 'batch', self.start_batch)
+
+        if self.path is not None:
+            self._writer = CheckpointWriter(self.path)
+
+        return self.counters
+
+    def epochs(self, num_epochs):
+
+        # Method for getting the epochs that are left to train
+
+        self.num_epochs = num_epochs
+        return range(self.start_epoch, num_epochs)
+
+    def batches(self, loader):
+
+        # Method for iterating over (batch_idx, batch) of an epoch, skipping the batches
+        # already trained when resuming in the middle of an epoch
+
+        start_batch = 0
+        rng_state = None
+        if self.start_batch > 0:
+            # replaying the epoch RNG reproduces the shuffled order of the interrupted epoch
+            set_rng_state(self.state['epoch_rng'])
+            start_batch = self.start_batch
+            rng_state = self.state['rng']
+            self.start_batch = 0
+        self._epoch_rng = get_rng_state() if self.every_batches else None
+
+        return self._iterate(loader, start_batch, rng_state)
+
+    def _iterate(self, loader, start_batch, rng_state):
+
+        iterator = iter(loader)
+        for _ in range(start_batch):
+            next(iterator)
+        if rng_state is not None:
+            set_rng_state(rng_state)
+        for batch_idx, batch in enumerate(iterator, start_batch):
+            yield batch_idx, batch
+
+    def batch_done(self, epoch, batch_idx, running_loss, total_predictions, correct_predictions):
+
+        # Method to call after each optimizer step
+
+        if self._writer is None or not self.every_batches or (batch_idx + 1) % self.every_batches != 0:
+            return
+
+        counters = {'running_loss': running_loss, 'total_predictions': total_predictions,
+                    'correct_predictions': correct_predictions}
+        self._writer.submit(capture_training_state(
+            self.wrapper, epoch, batch_idx + 1, counters, self._epoch_rng, self._split_rng))
+
+    def epoch_done(self, epoch, total_predictions, correct_predictions):
+
+        # Method to call once an epoch, its validation and its scheduler step are finished
+
+        self.counters = {'running_loss': 0.0, 'total_predictions': total_predictions,
+                         'correct_predictions': correct_predictions}
+
+        if self._writer is None:
+            return
+        if (epoch + 1) % self.every == 0 or epoch + 1 == self.num_epochs:
+            self._writer.submit(capture_training_state(
+                self.wrapper, epoch + 1, 0, self.counters, None, self._split_rng))
+
+    def close(self):
+
+        # Method for flushing the last checkpoint to disk
+
+        if self._writer is not None:
+            self._writer.close()
+            print('Checkpoint saved to', self.path)
+            self._writer = None
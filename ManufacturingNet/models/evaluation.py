@@ -0,0 +1,110 @@
+# Inference-mode evaluation engine shared by the deep learning wrappers
+
+import torch
+
+
+# Validation keeps no activations for the backward pass, so it can afford larger batches than training
+EVAL_BATCH_MULTIPLIER = 4
+
+
+def inference_mode():
+
+    # Method for getting the cheapest gradient-free context available in the installed torch version
+
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def get_eval_batchsize(batchsize, eval_batchsize=None):
+
+    # Method for getting the batch size used by the validation dataloader
+
+    if eval_batchsize is not None:
+        return int(eval_batchsize)
+    return int(batchsize) * EVAL_BATCH_MULTIPLIER
+
+
+def is_validation_epoch(epoch, num_epochs, validate_every):
+
+    # Method for checking whether the model is validated at the end of this epoch.
+    # The final epoch is always validated so that the result graphs have data;
+    # a validate_every of 0 or None validates only the final epoch
+
+    if epoch + 1 == num_epochs:
+        return True
+    return bool(validate_every) and (epoch + 1) % validate_every == 0
+
+
+def is_validation_step(batch_idx, validate_every_steps):
+
+    # Method for checking whether the model is validated after this training batch
+
+    return bool(validate_every_steps) and (batch_idx + 1) % validate_every_steps == 0
+
+
+def evaluate(net, loader, criterion, classification, device, input_dtype=None):
+    """
+    Runs a full pass of net over loader without building autograd graphs.
+
+    Predictions and targets are written into tensors preallocated for the whole dataset on
+    the device, and the loss is summed on the device, so the only host synchronisation is
+    the copy of the results at the end.
+
+    Returns (loss, accuracy, predictions, targets) where loss is the mean of the batch losses,
+    accuracy is a percentage (0 for regression), and predictions and targets are numpy arrays.
+    """
+
+    was_training = net.training
+    net.eval()
+
+    num_samples = len(loader.dataset)
+    num_batches = 0
+    offset = 0
+    predictions = None
+    targets = None
+
+    with inference_mode():
+
+        total_loss = torch.zeros((), dtype=torch.float64, device=device)
+
+        for data, target in loader:
+
+            data = data.to(device, non_blocking=True)
+            if input_dtype is not None:
+                data = data.to(input_dtype)
+            target = target.to(device, non_blocking=True)
+            outputs = net(data)
+
+            if classification:
+                loss = criterion(outputs, target.long())
+                batch_predictions = outputs.argmax(1)
+            else:
+                loss = criterion(outputs, target)
+                batch_predictions = outputs
+
+            if predictions is None:
+                predictions = torch.empty((num_samples,) + tuple(batch_predictions.shape[1:]),
+                                          dtype=batch_predictions.dtype, device=device)
+                targets = torch.empty((num_samples,) + tuple(target.shape[1:]),
+                                      dtype=target.dtype, device=device)
+
+            batch_size = target.shape[0]
+            predictions[offset:offset + batch_size] = batch_predictions
+            targets[offset:offset + batch_size] = target
+            offset += batch_size
+            total_loss += loss
+            num_batches += 1
+
+        running_loss = total_loss.item() / max(num_batches, 1)
+
+        acc = 0
+        if classification and offset > 0:
+            acc = (predictions[:offset] == targets[:offset]).double().mean().item() * 100.0
+
+    net.train(was_training)
+
+    if predictions is None:
+        return running_loss, acc, None, None
+
+    return running_loss, acc, predictions[:offset].cpu().numpy(), targets[:offset].cpu().numpy()
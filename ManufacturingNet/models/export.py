@@ -0,0 +1,160 @@
+# Export of trained deep learning wrappers to standalone TorchScript or ONNX artifacts
+
+import copy
+import os
+
+import numpy as np
+
+import torch
+
+from ..runtime import write_metadata
+from .sequences import PackedSequence
+
+
+EXPORT_FORMATS = ('torchscript', 'onnx')
+MODEL_FILES = {'torchscript': 'model.pt', 'onnx': 'model.onnx'}
+
+
+def _to_list(values):
+
+    return np.asarray(values, dtype=float).reshape(-1).tolist()
+
+
+def normalization_stats(normalizer):
+    """
+    Gets the statistics of a fitted normalizer as {'shift': [...], 'scale': [...]}, so that the
+    loader can compute (x - shift) / scale over the last input dimension.
+
+    Supports the normalizers in ManufacturingNet.preprocessing, scikit-learn style scalers
+    and plain dicts with 'mean'/'std' or 'shift'/'scale' entries.
+    """
+
+    if normalizer is None:
+        return None
+
+    if isinstance(normalizer, dict):
+        if 'shift' in normalizer:
+            return {'shift': _to_list(normalizer['shift']), 'scale': _to_list(normalizer['scale'])}
+        return {'shift': _to_list(normalizer['mean']), 'scale': _to_list(normalizer['std'])}
+
+    # ManufacturingNet.preprocessing normalizers
+    if hasattr(normalizer, 'data_mean'):
+        return {'shift': _to_list(normalizer.data_mean), 'scale': _to_list(normalizer.data_std)}
+    if hasattr(normalizer, 'data_min'):
+        return {'shift': _to_list(normalizer.data_min),
+                'scale': _to_list(np.asarray(normalizer.data_max) - np.asarray(normalizer.data_min))}
+    if hasattr(normalizer, 'data_median'):
+        return {'shift': _to_list(normalizer.data_median), 'scale': _to_list(normalizer.IQR)}
+
+    # scikit-learn scalers
+    if hasattr(normalizer, 'mean_'):
+        return {'shift': _to_list(normalizer.mean_), 'scale': _to_list(normalizer.scale_)}
+    if hasattr(normalizer, 'data_min_'):
+        return {'shift': _to_list(normalizer.data_min_), 'scale': _to_list(normalizer.data_range_)}
+    if hasattr(normalizer, 'center_'):
+        return {'shift': _to_list(normalizer.center_), 'scale': _to_list(normalizer.scale_)}
+
+    raise ValueError('Unsupported normalizer: ' + type(normalizer).__name__)
+
+
+def architecture_config(net):
+
+    # Method for collecting the plain hyperparameters stored on the ManufacturingNet network
+    # and its ManufacturingNet submodules (torch and torchvision layers describe themselves)
+
+    config = {}
+    for name, module in net.named_modules():
+        if not type(module).__module__.startswith('ManufacturingNet'):
+            continue
+        values = {}
+        for key, value in vars(module).items():
+            if key.startswith('_') or key == 'training':
+                continue
+            if isinstance(value, (bool, int, float, str)) or value is None:
+                values[key] = value
+            elif isinstance(value, (list, tuple)) and all(isinstance(v, (bool, int, float, str)) for v in value):
+                values[key] = list(value)
+        if values:
+            config[name or type(net).__name__] = values
+    return config
+
+
+def _example_input(wrapper):
+
+    # Method for taking one validation sample as the example input used for tracing
+
+    data = next(iter(wrapper.dev_loader))[0]
+    if isinstance(data, PackedSequence):
+        raise ValueError('Models trained on variable-length sequences need a padded example_input '
+                         'of shape (1, length, ...) to be exported')
+    return data[:1]
+
+
+def export_model(wrapper, path, format='torchscript', example_input=None, normalizer=None,
+                 opset_version=13):
+    """
+    Writes a trained wrapper to the directory path as a standalone artifact:
+    the TorchScript or ONNX model plus metadata.json holding the task, the input shape and dtype,
+    the class mapping, the normalization statistics and the architecture config.
+    The artifact is loaded with ManufacturingNet.runtime.load(path).
+    """
+
+    if format not in EXPORT_FORMATS:
+        raise ValueError('format must be one of ' + ', '.join(EXPORT_FORMATS))
+
+    net = wrapper.net
+    parameter = next(net.parameters())
+
+    if example_input is None:
+        example_input = _example_input(wrapper)
+    elif not torch.is_tensor(example_input):
+        example_input = torch.from_numpy(np.asarray(example_input))
+    example_input = example_input.to(device=parameter.device, dtype=parameter.dtype)
+
+    # the model is exported on the cpu so that it loads on machines without a GPU
+    was_training = net.training
+    device = parameter.device
+    net.eval()
+    net.to('cpu')
+    example_input = example_input.cpu()
+    recurrent = hasattr(net, 'lstm')
+
+    # onnxruntime has no float64 kernels for layers such as Conv, so a float32 copy of the network is exported
+    if format == 'onnx':
+        example_input = example_input.float()
+
+    os.makedirs(path, exist_ok=True)
+    model_path = os.path.join(path, MODEL_FILES[format])
+
+    try:
+        with torch.no_grad():
+            if format == 'torchscript':
+                traced = torch.jit.trace(net, example_input)
+                torch.jit.save(traced, model_path)
+            else:
+                dynamic_axes = {0: 'batch', 1: 'time'} if recurrent else {0: 'batch'}
+                torch.onnx.export(copy.deepcopy(net).float(), example_input, model_path, input_names=['input'],
+                                  output_names=['output'], opset_version=opset_version,
+                                  dynamic_axes={'input': dynamic_axes, 'output': {0: 'batch'}})
+    finally:
+        net.to(device)
+        net.train(was_training)
+
+    mapping = wrapper.get_mapping() if hasattr(wrapper, 'get_mapping') else None
+    classification = getattr(wrapper, 'criterion_input', None) == '1'
+
+    metadata = {'format': format,
+                'model_file': MODEL_FILES[format],
+                'model_type': type(wrapper).__name__,
+                'task': 'classification' if classification else 'regression',
+                'input_shape': list(example_input.shape[1:]),
+                'variable_length': recurrent,
+                'dtype': str(example_input.dtype).replace('torch.', ''),
+                'classes': {str(index): label for label, index in mapping.items()} if mapping else None,
+                'normalization': normalization_stats(normalizer),
+                'config': architecture_config(net)}
+
+    write_metadata(path, metadata)
+
+    print('Model exported to', path)
+    return path
@@ -0,0 +1,202 @@
+"""incremental updates the shallow learning wrappers' trained models with
+newly arriving labeled data, without retraining them from scratch.
+
+Linear models are taken over by stochastic gradient descent models that
+start from their coefficients and learn from each new batch with
+partial_fit(). Kernel SVMs have no incremental form; their first update
+switches them to the kernel approximation of the SVM wrapper's large
+data mode, trained the same way. Random forests add a few trees fitted
+on the new batch and a bounded sample of the past data, dropping their
+oldest trees beyond a maximum. XGBoost models continue boosting from
+their booster for a few rounds on the new batch, with xgb_training's
+continue_boosting(). Each update therefore costs time proportional to
+the size of the new batch, not of the whole dataset.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import numpy as np
+from sklearn.base import is_classifier
+from sklearn.linear_model import (LogisticRegression, SGDClassifier,
+                                  SGDRegressor)
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVC, SVR, LinearSVC, LinearSVR, NuSVC, NuSVR
+
+from . import sparse_inputs
+from .kernel_approximation import approximate_model
+
+_KERNEL_SVMS = (SVC, NuSVC, SVR, NuSVR)
+
+
+def _online_linear_model(model, n_samples):
+    """Returns the SGD model equivalent to a fitted linear model,
+    starting from its coefficients, or None if there is none.
+    """
+    params = model.get_params()
+    # SGD's alpha plays the role of 1 / (C * n_samples)
+    alpha = 1.0 / (params.get("C", 1.0) * n_samples)
+
+    if isinstance(model, LogisticRegression):
+        online = SGDClassifier(loss="log_loss", alpha=alpha)
+    elif isinstance(model, LinearSVC):
+        online = SGDClassifier(loss=params["loss"], alpha=alpha)
+    elif isinstance(model, LinearSVR):
+        online = SGDRegressor(loss=params["loss"], alpha=alpha,
+                              epsilon=params["epsilon"])
+    else:
+        return None
+
+    online.coef_ = np.array(model.coef_, dtype=float)
+    online.intercept_ = np.atleast_1d(
+        np.array(model.intercept_, dtype=float))
+    if is_classifier(online):
+        online.classes_ = model.classes_
+    # Continue the learning rate schedule as if the model had already
+    # seen its training set once
+    online.t_ = float(n_samples)
+    return online
+
+
+def make_online(model, X, y, random_state=0):
+    """Returns an estimator taking over from the fitted model that learns
+    incrementally with partial_update(). X and y are the data model was
+    trained on.
+
+    Models with partial_fit() are returned as they are. Linear models are
+    replaced by equivalent SGD models starting from their coefficients.
+    Kernel SVMs and large data mode pipelines are replaced by a Nystroem
+    kernel approximation followed by an SGD model, trained on X and y.
+    """
+    if hasattr(model, "partial_fit"):
+        return model
+
+    if isinstance(model, Pipeline) \
+            and hasattr(model.steps[-1][1], "partial_fit"):
+        return model
+
+    online = _online_linear_model(model, len(y))
+    if online is not None:
+        return online
+
+    if isinstance(model, Pipeline):
+        # A large data mode pipeline; keep its kernel features
+        features = Pipeline(model.steps[:-1])
+        online = _online_linear_model(model.steps[-1][1], len(y))
+        if online is None:
+            # A calibrated LinearSVC has no single set of coefficients
+            online = SGDClassifier(loss="modified_huber", alpha=1.0 / len(y),
+                                   random_state=random_state)
+            online.fit(features.transform(X), np.ravel(y))
+        return Pipeline(model.steps[:-1] + [("linear", online)])
+
+    if not isinstance(model, _KERNEL_SVMS):
+        raise ValueError(type(model).__name__
+                         + " can't be updated incrementally.")
+
+    online = approximate_model(model, X, approximation="nystroem",
+                               linear_model="sgd", random_state=random_state)
+    return online.fit(X, np.ravel(y))
+
+
+def partial_update(model, X_new, y_new, epochs=1):
+    """Runs epochs passes of partial_fit() over the new data on a model
+    returned by make_online(). Returns model.
+    """
+    y_new = np.ravel(y_new)
+    if isinstance(model, Pipeline):
+        for _, step in model.steps[:-1]:
+            X_new = step.transform(X_new)
+        model = model.steps[-1][1]
+
+    kwargs = {}
+    if is_classifier(model):
+        kwargs["classes"] = model.classes_
+
+    for _ in range(epochs):
+        model.partial_fit(X_new, y_new, **kwargs)
+    return model
+
+
+class ReplayBuffer:
+    """Bounded uniform sample of the datapoints seen so far, kept with
+    reservoir sampling.
+
+    New trees of an updated random forest are trained on the new batch
+    together with this sample, so they don't forget the past data or its
+    classes, while the cost of an update stays bounded.
+    """
+
+    def __init__(self, size=10000, random_state=0):
+        """Initializes an empty ReplayBuffer."""
+        self.size = size
+        self.n_seen = 0
+        self.X = None
+        self.y = None
+        self._rng = np.random.RandomState(random_state)
+
+    def add(self, X, y):
+        """Adds the datapoints of X and y to the sample. A sparse X keeps
+        the sample sparse.
+        """
+        y = np.ravel(y)
+        if sparse_inputs.is_sparse(X):
+            X = sparse_inputs.to_sparse(X)
+        else:
+            X = np.asarray(X)
+        if self.X is None:
+            self.X = X[:0]
+            self.y = np.empty(0, dtype=y.dtype)
+
+        n_free = max(self.size - len(self.y), 0)
+        self.X = sparse_inputs.vstack([self.X, X[:n_free]])
+        self.y = np.concatenate([self.y, y[:n_free]])
+
+        # Reservoir sampling: the i-th datapoint replaces a random slot
+        # with probability size / i
+        rows = np.arange(n_free, len(y))
+        seen = self.n_seen + rows + 1
+        slots = (self._rng.random_sample(len(rows)) * seen).astype(int)
+        keep = slots < self.size
+        self.y[slots[keep]] = y[rows[keep]]
+        if not sparse_inputs.is_sparse(self.X):
+            self.X[slots[keep]] = X[rows[keep]]
+        elif keep.any():
+            # Sparse rows can't be assigned in place; gather the sample
+            # from itself and the replacing rows instead
+            source = np.arange(len(self.y))
+            source[slots[keep]] = len(self.y) + np.arange(keep.sum())
+            self.X = sparse_inputs.vstack([self.X,
+                                           X[rows[keep]]])[source]
+
+        self.n_seen += len(y)
+
+
+def update_forest(forest, buffer, X_new, y_new, n_trees=10, max_trees=1000):
+    """Adds n_trees trees to a fitted random forest, trained on the new
+    data and the replay buffer's sample, which the new data then joins.
+    Only the newest max_trees trees are kept. Returns forest.
+    """
+    y_new = np.ravel(y_new)
+    if not sparse_inputs.is_sparse(X_new):
+        X_new = np.asarray(X_new)
+    if buffer.X is not None:
+        X_fit = sparse_inputs.vstack([buffer.X, X_new])
+        y_fit = np.concatenate([buffer.y, y_new])
+    else:
+        X_fit, y_fit = X_new, y_new
+
+    if is_classifier(forest) and \
+            not np.array_equal(np.unique(y_fit), forest.classes_):
+        raise ValueError("The new data and the replay buffer must contain "
+                         + "exactly the classes the forest was trained on.")
+
+    forest.set_params(warm_start=True, oob_score=False,
+                      n_estimators=len(forest.estimators_) + n_trees)
+    forest.fit(X_fit, y_fit)
+
+    if len(forest.estimators_) > max_trees:
+        forest.estimators_ = forest.estimators_[-max_trees:]
+        forest.set_params(n_estimators=max_trees)
+
+    buffer.add(X_new, y_new)
+    return forest
@@ -0,0 +1,129 @@
+# Batched inference engine shared by the deep learning wrappers
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import torch
+
+from .evaluation import inference_mode
+
+
+OUTPUT_TYPES = ('class', 'proba', 'value')
+
+
+def _iter_batches(X, batch_size):
+
+    # Method for cutting arrays, memmaps or iterables of arrays into batches of batch_size samples
+
+    if hasattr(X, 'shape') and hasattr(X, '__getitem__'):
+        for start in range(0, X.shape[0], batch_size):
+            yield X[start:start + batch_size]
+        return
+
+    pending = []
+    pending_size = 0
+    for chunk in X:
+        chunk = np.asarray(chunk)
+        pending.append(chunk)
+        pending_size += chunk.shape[0]
+        while pending_size >= batch_size:
+            merged = np.concatenate(pending) if len(pending) > 1 else pending[0]
+            yield merged[:batch_size]
+            pending = [merged[batch_size:]]
+            pending_size -= batch_size
+    if pending_size > 0:
+        yield np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+
+def _load_batch(batch, dtype, pin_memory):
+
+    # Method for turning a numpy batch into a tensor ready to be copied to the device.
+    # Runs on the prefetch thread, so reading a memmap overlaps with the forward pass
+
+    tensor = torch.as_tensor(np.ascontiguousarray(batch)).to(dtype)
+    if pin_memory:
+        tensor = tensor.pin_memory()
+    return tensor
+
+
+def predict_batched(net, X, batch_size=1024, num_threads=None, output=None,
+                    classification=False, device=None):
+    """
+    Streams X through net in inference mode and returns a numpy array of predictions.
+
+    X: numpy array or memmap with samples on the first dimension, or an iterable of such arrays.
+    batch_size: number of samples sent to the device at once.
+    num_threads: number of CPU threads used by torch during the call. The next batch is always
+        prepared on a separate thread while the current one is running.
+    output: 'class' for class indices, 'proba' for softmax probabilities or 'value' for the raw
+        network output. Defaults to 'class' for classification and 'value' otherwise.
+    """
+
+    if output is None:
+        output = 'class' if classification else 'value'
+    if output not in OUTPUT_TYPES:
+        raise ValueError('output must be one of ' + ', '.join(OUTPUT_TYPES))
+
+    parameter = next(net.parameters(), None)
+    if parameter is None:
+        # quantized networks keep their weights in packed buffers and run on the cpu in float32
+        device = device if device is not None else 'cpu'
+        dtype = torch.float32
+    else:
+        device = device if device is not None else parameter.device
+        dtype = parameter.dtype
+    pin_memory = torch.device(device).type == 'cuda'
+
+    total = X.shape[0] if hasattr(X, 'shape') else None
+    result = None
+    parts = []
+    offset = 0
+
+    was_training = net.training
+    net.eval()
+    previous_threads = torch.get_num_threads()
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    try:
+        with ThreadPoolExecutor(max_workers=1) as prefetcher, inference_mode():
+
+            batches = _iter_batches(X, batch_size)
+            pending = None
+            first = next(batches, None)
+            if first is not None:
+                pending = prefetcher.submit(_load_batch, first, dtype, pin_memory)
+
+            while pending is not None:
+
+                inputs = pending.result()
+                following = next(batches, None)
+                pending = None
+                if following is not None:
+                    pending = prefetcher.submit(_load_batch, following, dtype, pin_memory)
+
+                outputs = net(inputs.to(device, non_blocking=pin_memory))
+                if output == 'class':
+                    outputs = outputs.argmax(1)
+                elif output == 'proba':
+                    outputs = torch.softmax(outputs, 1)
+                outputs = outputs.cpu().numpy()
+
+                if total is None:
+                    parts.append(outputs)
+                    continue
+
+                if result is None:
+                    result = np.empty((total,) + outputs.shape[1:], dtype=outputs.dtype)
+                result[offset:offset + outputs.shape[0]] = outputs
+                offset += outputs.shape[0]
+    finally:
+        torch.set_num_threads(previous_threads)
+        net.train(was_training)
+
+    if total is None:
+        return np.concatenate(parts) if parts else np.empty((0,))
+    if result is None:
+        return np.empty((0,))
+    return result
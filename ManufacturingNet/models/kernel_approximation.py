@@ -0,0 +1,183 @@
+"""kernel_approximation holds the large data mode of the SVM wrapper.
+
+Exact kernel SVMs take between quadratic and cubic time in the number of
+datapoints. In large data mode, the inputs are mapped to an explicit,
+approximate feature space of the SVM's kernel (Nystroem or random Fourier
+features) where a linear model, which trains in linear time, takes the
+place of the kernel SVM. The number of components is chosen
+automatically, and the gap to the exact SVM is measured on a subsample.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import time
+
+import numpy as np
+from sklearn.base import clone, is_classifier
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDClassifier, SGDRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.svm import LinearSVC, LinearSVR
+
+from . import sparse_inputs
+
+APPROXIMATIONS = ("nystroem", "rbf_sampler")
+LINEAR_MODELS = ("linear_svm", "sgd")
+N_COMPONENTS = (100, 200, 400, 800, 1600, 3200)
+
+
+def _gamma(model, X):
+    """Returns the numeric gamma of a kernel SVM, resolving 'scale' and
+    'auto' as libsvm does.
+    """
+    gamma = model.get_params()["gamma"]
+    if gamma == "scale":
+        variance = sparse_inputs.variance(X)
+        return 1.0 / (X.shape[1] * variance) if variance > 0 else 1.0
+    if gamma == "auto":
+        return 1.0 / X.shape[1]
+    return gamma
+
+
+def approximate_model(model, X, n_components=400, approximation="nystroem",
+                      linear_model="linear_svm", random_state=0):
+    """Returns a pipeline approximating model, an SVC, NuSVC, SVR or NuSVR,
+    with kernel features followed by a linear model.
+
+    The kernel, gamma, degree and coef0 of model are kept; X is only used
+    to resolve gamma='scale'. C and epsilon carry over to the linear
+    model; nu models have no linear equivalent and use C=1. Classifiers
+    predict probabilities, as SVC(probability=True) does.
+    """
+    if approximation not in APPROXIMATIONS:
+        raise ValueError("approximation must be one of "
+                         + ", ".join(APPROXIMATIONS))
+    if linear_model not in LINEAR_MODELS:
+        raise ValueError("linear_model must be one of "
+                         + ", ".join(LINEAR_MODELS))
+
+    params = model.get_params()
+    kernel = params["kernel"]
+    gamma = _gamma(model, X)
+
+    if approximation == "rbf_sampler" and kernel == "rbf":
+        features = RBFSampler(gamma=gamma, n_components=n_components,
+                              random_state=random_state)
+    else:
+        if approximation == "rbf_sampler":
+            print("Random Fourier features only approximate the rbf kernel;",
+                  "using Nystroem features for the", kernel, "kernel.")
+        kernel_params = None
+        if kernel in {"poly", "sigmoid"}:
+            kernel_params = {"coef0": params["coef0"]}
+            if kernel == "poly":
+                kernel_params["degree"] = params["degree"]
+        features = Nystroem(kernel=kernel,
+                            gamma=None if kernel == "linear" else gamma,
+                            kernel_params=kernel_params,
+                            n_components=min(n_components, X.shape[0]),
+                            random_state=random_state)
+
+    C = params.get("C", 1.0)
+    # SGD's alpha plays the role of 1 / (C * n_samples)
+    alpha = 1.0 / (C * X.shape[0])
+
+    if is_classifier(model):
+        if linear_model == "sgd":
+            linear = SGDClassifier(loss="modified_huber", alpha=alpha,
+                                   random_state=random_state)
+        else:
+            linear = CalibratedClassifierCV(LinearSVC(C=C, dual=False), cv=3)
+    else:
+        epsilon = params.get("epsilon", 0.0)
+        if linear_model == "sgd":
+            linear = SGDRegressor(loss="epsilon_insensitive", epsilon=epsilon,
+                                  alpha=alpha, random_state=random_state)
+        else:
+            linear = LinearSVR(C=C, epsilon=epsilon,
+                               loss="squared_epsilon_insensitive", dual=False)
+
+    return Pipeline([("features", features), ("linear", linear)])
+
+
+def _subsample(X, y, size, random_state=0):
+    """Returns at most size random rows of X and y."""
+    if len(y) <= size:
+        return X, y
+    index = np.random.RandomState(random_state).choice(len(y), size,
+                                                       replace=False)
+    return X[index], y[index]
+
+
+def select_n_components(model, X, y, approximation="nystroem",
+                        linear_model="linear_svm", tolerance=0.005,
+                        max_samples=20000, random_state=0):
+    """Chooses the number of kernel components for approximate_model().
+
+    Pipelines with 100, 200, 400... components are scored on a holdout
+    split of at most max_samples datapoints, and the first one that
+    scores less than tolerance below the next is returned.
+    """
+    y = np.ravel(y)
+    X, y = _subsample(X, y, max_samples, random_state)
+    X_train, X_test, y_train, y_test = \
+        train_test_split(X, y, test_size=0.2, random_state=random_state)
+
+    print("\n{:<20} {:<20}".format("Components", "Holdout Score"))
+    best_n, best_score = None, -np.inf
+    for n_components in N_COMPONENTS:
+        if best_n is not None and n_components > X_train.shape[0]:
+            break
+
+        pipeline = approximate_model(model, X_train, n_components,
+                                     approximation, linear_model,
+                                     random_state)
+        score = pipeline.fit(X_train, y_train).score(X_test, y_test)
+        print("{:<20} {:<20.4f}".format(n_components, score))
+
+        if best_n is not None and score - best_score < tolerance:
+            break
+        best_n, best_score = n_components, score
+
+    print("\nUsing", best_n, "components.")
+    return best_n
+
+
+def gap_report(exact_model, approximate, X_train, y_train, X_test, y_test,
+               max_samples=5000, random_state=0):
+    """Trains the exact kernel SVM and the approximation on the same
+    subsample of at most max_samples training datapoints and compares
+    their test scores and training times. Returns a dict of the results.
+    """
+    X_sample, y_sample = _subsample(X_train, np.ravel(y_train), max_samples,
+                                    random_state)
+    report = {"samples": len(y_sample)}
+
+    for name, model in (("exact", exact_model), ("approximate", approximate)):
+        model = clone(model)
+        start_time = time.time()
+        model.fit(X_sample, y_sample)
+        report[name + "_fit_time"] = time.time() - start_time
+        report[name + "_score"] = model.score(X_test, np.ravel(y_test))
+
+    report["score_gap"] = report["exact_score"] - report["approximate_score"]
+    report["speedup"] = report["exact_fit_time"] \
+        / max(report["approximate_fit_time"], 1e-9)
+    return report
+
+
+def print_gap_report(report):
+    """Prints a report returned by gap_report()."""
+    print("\nExact vs. approximate kernel on", report["samples"],
+          "training datapoints:")
+    print("{:<20} {:<20} {:<20}".format("", "Score", "Fit Time (s)"))
+    print("{:<20} {:<20.4f} {:<20.4f}".format("Exact",
+                                              report["exact_score"],
+                                              report["exact_fit_time"]))
+    print("{:<20} {:<20.4f} {:<20.4f}".format("Approximate",
+                                              report["approximate_score"],
+                                              report["approximate_fit_time"]))
+    print("\n{:<20} {:<20.4f}".format("Score Gap:", report["score_gap"]))
+    print("{:<20} {:<20.1f}".format("Speedup:", report["speedup"]))
@@ -0,0 +1,229 @@
+"""kernel_cache runs the SVM wrapper's GridSearch on precomputed kernel
+matrices.
+
+Only the kernel parameters (kernel, gamma, degree and coef0) change the
+Gram matrix of the training data; C, nu and epsilon don't. The Gram
+matrix of each kernel is computed once, kept in a bounded least recently
+used cache, optionally memory-mapped to disk, and sliced for every cross
+validation fold and every C, nu or epsilon value, which are fitted with
+kernel='precomputed'.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import check_scoring
+from sklearn.metrics.pairwise import pairwise_kernels
+from sklearn.model_selection import ParameterGrid, check_cv
+
+from . import sparse_inputs
+
+KERNEL_PARAMS = ("kernel", "gamma", "degree", "coef0")
+
+
+class GramCache:
+    """Least recently used cache of the Gram matrices of X.
+
+    Matrices are evicted once the cache holds more than max_memory_mb
+    megabytes. If directory is given, the matrices are memory-mapped .npy
+    files in it, so the operating system pages them in and out of memory
+    and worker processes share them instead of receiving copies.
+    """
+
+    def __init__(self, X, max_memory_mb=1024, directory=None,
+                 block_size=2048):
+        """Initializes a GramCache object."""
+        # Sparse attributes stay sparse; only their Gram matrices are dense
+        if sparse_inputs.is_sparse(X):
+            self.X = sparse_inputs.to_sparse(X)
+        else:
+            self.X = np.asarray(X, dtype=float)
+        self.max_memory_mb = max_memory_mb
+        self.directory = directory
+        self.block_size = block_size
+        self.hits = 0
+        self.misses = 0
+        self._matrices = OrderedDict()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def matrix_mb(self):
+        """Returns the size of one Gram matrix in megabytes."""
+        return self.X.shape[0] ** 2 * 8 / 1e6
+
+    def key(self, kernel="rbf", gamma="scale", degree=3, coef0=0.0):
+        """Returns the cache key of a kernel, keeping only the parameters
+        that kernel uses and resolving gamma='scale' and 'auto' as libsvm
+        does.
+        """
+        if kernel == "linear":
+            return ("linear",)
+
+        if gamma == "scale":
+            variance = sparse_inputs.variance(self.X)
+            gamma = 1.0 / (self.X.shape[1] * variance) if variance > 0 \
+                else 1.0
+        elif gamma == "auto":
+            gamma = 1.0 / self.X.shape[1]
+
+        if kernel == "rbf":
+            return ("rbf", float(gamma))
+        if kernel == "poly":
+            return ("poly", float(gamma), int(degree), float(coef0))
+        if kernel == "sigmoid":
+            return ("sigmoid", float(gamma), float(coef0))
+        raise ValueError("Unsupported kernel: " + str(kernel))
+
+    def get(self, key):
+        """Returns the Gram matrix of the kernel key, computing it if it
+        isn't cached.
+        """
+        if key in self._matrices:
+            self.hits += 1
+            self._matrices.move_to_end(key)
+            return self._matrices[key]
+
+        self.misses += 1
+        matrix = self._compute(key)
+        self._matrices[key] = matrix
+        self._evict()
+        return matrix
+
+    def _compute(self, key):
+        """Computes the Gram matrix of the kernel key, block of rows by
+        block of rows so that a memory-mapped matrix is never held in
+        memory as a whole.
+        """
+        kernel = key[0]
+        params = {}
+        if kernel in {"rbf", "poly", "sigmoid"}:
+            params["gamma"] = key[1]
+        if kernel == "poly":
+            params["degree"], params["coef0"] = key[2], key[3]
+        if kernel == "sigmoid":
+            params["coef0"] = key[2]
+
+        n_rows = self.X.shape[0]
+        if self.directory is None:
+            matrix = np.empty((n_rows, n_rows))
+        else:
+            filename = os.path.join(
+                self.directory,
+                "gram_" + "_".join(str(value) for value in key) + ".npy")
+            matrix = np.lib.format.open_memmap(filename, mode="w+",
+                                               shape=(n_rows, n_rows))
+
+        for start in range(0, n_rows, self.block_size):
+            stop = min(start + self.block_size, n_rows)
+            matrix[start:stop] = pairwise_kernels(
+                self.X[start:stop], self.X, metric=kernel, n_jobs=-1,
+                **params)
+
+        if self.directory is not None:
+            matrix.flush()
+            # Reopen read-only; workers receive the file name, not the data
+            matrix = np.load(matrix.filename, mmap_mode="r")
+        return matrix
+
+    def _evict(self):
+        """Drops least recently used matrices while the cache is over
+        budget, always keeping the most recent one.
+        """
+        while len(self._matrices) > 1 and \
+                len(self._matrices) * self.matrix_mb() > self.max_memory_mb:
+            _, matrix = self._matrices.popitem(last=False)
+            self._remove(matrix)
+
+    def _remove(self, matrix):
+        """Deletes the file of a memory-mapped matrix."""
+        if isinstance(matrix, np.memmap) and matrix.filename is not None:
+            filename = matrix.filename
+            del matrix
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Empties the cache."""
+        while self._matrices:
+            _, matrix = self._matrices.popitem(last=False)
+            self._remove(matrix)
+
+
+def _fit_and_score(estimator, params, gram, y, train, test, scorer):
+    """Fits a copy of estimator with params on the precomputed kernel of
+    the train rows and scores it on the test rows. Failed fits score NaN,
+    as in GridSearchCV.
+    """
+    estimator = clone(estimator).set_params(kernel="precomputed", **params)
+    try:
+        estimator.fit(gram[np.ix_(train, train)], y[train])
+        return scorer(estimator, gram[np.ix_(test, train)], y[test])
+    except Exception:
+        return np.nan
+
+
+def precomputed_grid_search(estimator, param_grid, X, y, scoring=None, cv=5,
+                            n_jobs=-1, max_memory_mb=1024, directory=None):
+    """Exhaustive GridSearch of a kernel SVM (SVC, NuSVC, SVR or NuSVR)
+    on precomputed Gram matrices. Returns the best parameters.
+
+    Candidates are grouped by kernel, so each Gram matrix is computed
+    once and shared by every fold and every C, nu or epsilon value of the
+    group, which are fitted in n_jobs parallel jobs. See GramCache for
+    max_memory_mb and directory.
+    """
+    y = np.ravel(y)
+    folds = list(check_cv(cv, y, classifier=is_classifier(estimator))
+                 .split(np.zeros((len(y), 1)), y))
+    scorer = check_scoring(estimator, scoring)
+
+    temporary = directory is None and \
+        len(y) ** 2 * 8 / 1e6 > max_memory_mb
+    if temporary:
+        # A single matrix is over budget; keep it on disk instead
+        directory = tempfile.mkdtemp(prefix="manufacturingnet_gram_")
+    cache = GramCache(X, max_memory_mb=max_memory_mb, directory=directory)
+
+    defaults = estimator.get_params()
+    groups = OrderedDict()
+    for params in ParameterGrid(param_grid):
+        kernel_params = {name: params.get(name, defaults[name])
+                         for name in KERNEL_PARAMS}
+        groups.setdefault(cache.key(**kernel_params), []).append(params)
+
+    candidates, scores = [], []
+    try:
+        with Parallel(n_jobs=n_jobs) as parallel:
+            for key, group in groups.items():
+                gram = cache.get(key)
+                other_params = [{name: value for name, value in params.items()
+                                 if name not in KERNEL_PARAMS}
+                                for params in group]
+                fold_scores = parallel(
+                    delayed(_fit_and_score)(estimator, params, gram, y, train,
+                                            test, scorer)
+                    for params in other_params for train, test in folds)
+                fold_scores = np.reshape(fold_scores, (len(group), len(folds)))
+
+                candidates.extend(group)
+                scores.extend(np.mean(fold_scores, axis=1))
+    finally:
+        cache.clear()
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print("Computed", cache.misses, "kernel matrices for", len(candidates),
+          "candidates and", len(folds), "folds.")
+
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    return candidates[int(np.argmax(scores))]
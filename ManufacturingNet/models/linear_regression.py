@@ -11,20 +11,33 @@ from math import sqrt
 import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error
-from sklearn.model_selection import cross_val_score, train_test_split
+from sklearn.model_selection import train_test_split
+
+from .bulk_scoring import score_model
+from .persistence import load_wrapper, save_wrapper
+from .shallow_evaluation import PhaseTimer, cross_validate_model
+from .sparse_inputs import is_sliceable, is_sparse
+from .streaming_regression import StreamingLinearRegression
 
 
 class LinRegression:
     """Class framework for linear regression model."""
 
-    def __init__(self, attributes=None, labels=None):
+    def __init__(self, attributes=None, labels=None, cv_n_jobs=None,
+                 estimate_only=False):
         """Initializes a LinearRegression object."""
         self.attributes = attributes
         self.labels = labels
+        self.cv_n_jobs = cv_n_jobs
+        self.estimate_only = estimate_only
+        self.cv_estimators = {}
+        self.training_times = {}
 
         self.test_size = None
         self.cv = None
         self.graph_results = None
+        self.streaming = False
+        self.chunk_size = 10000
 
         self.regression = None
         self.coefficients = None
@@ -72,6 +85,18 @@ class LinRegression:
         """Accessor method for cross_val_scores."""
         return self.cross_val_scores
 
+    def get_cv_estimators(self):
+        """Accessor method for cv_estimators, the fitted cross validation
+        fold estimators of each model.
+        """
+        return self.cv_estimators
+
+    def get_training_times(self):
+        """Accessor method for training_times, the wall-clock and compute
+        time of each training phase of each model.
+        """
+        return self.training_times
+
     # Modifier methods
 
     def set_attributes(self, new_attributes=None):
@@ -82,6 +107,26 @@ class LinRegression:
         """Modifier method for labels."""
         self.labels = new_labels
 
+    def set_cv_n_jobs(self, new_cv_n_jobs=None):
+        """Modifier method for cv_n_jobs, the number of cross validation
+        folds run in parallel.
+        """
+        self.cv_n_jobs = new_cv_n_jobs
+
+    def set_estimate_only(self, new_estimate_only=False):
+        """Modifier method for estimate_only. If True, cross validation is
+        skipped and the holdout score is the only estimate.
+        """
+        self.estimate_only = new_estimate_only
+
+    def set_streaming(self, new_streaming=False, new_chunk_size=10000):
+        """Modifier method for streaming and chunk_size. In streaming
+        mode, attributes may also be a callable returning an iterator over
+        (attributes, labels) chunks.
+        """
+        self.streaming = new_streaming
+        self.chunk_size = new_chunk_size
+
     # Wrapper for linear regression model
 
     def run(self):
@@ -92,6 +137,11 @@ class LinRegression:
             # Instantiate LinearRegression() object using helper method
             self.regression = self._create_model()
 
+            # Chunk iterators can only be read in streaming mode
+            if self.streaming or callable(self.attributes):
+                self._run_streaming()
+                return
+
             # Split into training and testing sets
             dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test = \
                 train_test_split(self.attributes, self.labels,
@@ -99,6 +149,7 @@ class LinRegression:
 
             # Train the model and get resultant coefficients
             # Handle exception if arguments aren't correct
+            timer = PhaseTimer()
             try:
                 self.regression.fit(dataset_X_train, dataset_y_train)
             except Exception as e:
@@ -109,6 +160,8 @@ class LinRegression:
                 self.regression = None
                 return
 
+            timer.mark("fit")
+
             # Get resultant coefficients and intercept of regression line
             self.coefficients = self.regression.coef_
             self.intercept = self.regression.intercept_
@@ -124,9 +177,12 @@ class LinRegression:
             if self.r2_score >= 0:
                 self.r_score = sqrt(self.r2_score)
 
-            self.cross_val_scores = \
-                cross_val_score(self.regression, self.attributes, self.labels,
-                                cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = self._cross_validate(self.regression, timer)
+            self.cross_val_scores = scores
+            self.cv_estimators["LinearRegression"] = estimators
+            self.training_times["LinearRegression"] = timer.get_times()
+            timer.print_times()
 
             # Output results
             self._output_results()
@@ -159,13 +215,110 @@ class LinRegression:
         print("\nLinRegression Predictions:\n", y_prediction, "\n")
         return y_prediction
 
+    # Wrapper for bulk scoring
+
+    def predict_bulk(self, dataset_X=None, output=None, chunk_size=10000,
+                     n_threads=1):
+        """Predicts the output of each datapoint in dataset_X using the
+        regression model on n_threads threads, chunk_size rows at a time,
+        without displaying them. dataset_X can be an array, a sparse matrix,
+        the filename of a .npy file, or a callable returning an iterator over
+        chunks. The predictions are written to output, an array or a .npy or
+        CSV filename, if given. Returns the predictions, or the CSV filename.
+        """
+        # Check that run() has already been called
+        if self.regression is None:
+            print("The regression model seems to be missing. Have you called",
+                  "run() yet?")
+            return None
+
+        # Try to score dataset_X
+        # Handle exception if dataset_X or output aren't valid
+        try:
+            return score_model(self.regression, "LinearRegression",
+                               dataset_X, output, "predict", chunk_size,
+                               n_threads)
+        except Exception as e:
+            print("The model failed to run. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+    # Persistence
+
+    def save(self, path):
+        """Writes the model to the directory path, without the dataset, its
+        splits or the results. Returns path.
+        """
+        return save_wrapper(self, path, ("regression",), "run()")
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Returns a LinRegression holding the model saved in the directory
+        path with save(). The model is read from disk the first time it is
+        used, with its arrays memory-mapped.
+        """
+        return load_wrapper(cls, path, mmap_mode)
+
     # Helper methods
 
+    def _cross_validate(self, model, timer):
+        """Cross validates model with the shared evaluation engine.
+        Returns the fold scores and the fitted fold estimators.
+        """
+        return cross_validate_model(model, self.attributes, self.labels,
+                                    cv=self.cv, n_jobs=self.cv_n_jobs,
+                                    estimate_only=self.estimate_only,
+                                    timer=timer)
+
+    def _run_streaming(self):
+        """Trains the model in streaming mode, reading the dataset in
+        chunks, and updates relevant instance data.
+        """
+        model = StreamingLinearRegression(
+            fit_intercept=self.regression.get_params()["fit_intercept"],
+            cv=self.cv or 5, test_size=self.test_size,
+            chunk_size=self.chunk_size)
+
+        timer = PhaseTimer()
+        try:
+            model.fit(self.attributes, self.labels)
+        except Exception as e:
+            print("An exception occurred while training the regression",
+                  "model. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            self.regression = None
+            return
+
+        timer.mark("fit")
+
+        self.regression = model
+        self.coefficients = model.coef_
+        self.intercept = model.intercept_
+        self.mean_squared_error = model.mean_squared_error_
+        self.r2_score = model.r2_score_
+        if self.r2_score >= 0:
+            self.r_score = sqrt(self.r2_score)
+        self.cross_val_scores = model.cross_val_scores_
+
+        # The fold models are solved from the fold statistics, not kept
+        self.cv_estimators["LinearRegression"] = None
+        self.training_times["LinearRegression"] = timer.get_times()
+        timer.print_times()
+
+        self._output_results()
+
+        if self.graph_results:
+            print("Graphing isn't supported in streaming mode.")
+
     def _create_model(self):
         """Runs UI for getting parameters and creating model."""
         print("\n==================================")
         print("= LinRegression Parameter Inputs =")
         print("==================================\n")
+
+        self._get_streaming()
         print("Default values:",
               "test_size = 0.25",
               "cv = 5",
@@ -356,6 +509,49 @@ class LinRegression:
                                 normalize=normalize, copy_X=copy_X,
                                 n_jobs=n_jobs)
 
+    def _get_streaming(self):
+        """Prompts for streaming mode and its chunk size. The values set
+        with set_streaming() are the defaults.
+        """
+        while True:
+            user_input = input("Use streaming mode: read the dataset in "
+                               + "chunks and never load it whole "
+                               + ("(Y/n)? " if self.streaming else "(y/N)? ")
+                               ).lower()
+            if user_input == "":
+                break
+            elif user_input == "y":
+                self.streaming = True
+                break
+            elif user_input == "n":
+                self.streaming = False
+                break
+            else:
+                print("Invalid input.")
+
+        print("streaming =", self.streaming)
+
+        while self.streaming:
+            user_input = input("\nEnter the number of rows per chunk "
+                               + "(default=" + str(self.chunk_size) + "): ")
+            try:
+                if user_input == "":
+                    break
+
+                user_input = int(user_input)
+                if user_input <= 0:
+                    raise Exception
+                else:
+                    self.chunk_size = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        if self.streaming:
+            print("chunk_size =", self.chunk_size)
+
+        print()
+
     def _output_results(self):
         """Outputs model metrics after run() finishes."""
         print("\n=========================")
@@ -385,6 +581,10 @@ class LinRegression:
             print("The model isn't available. Have you called run() yet?")
             return
 
+        # A single sparse column is small enough to plot densely
+        if is_sparse(X_test):
+            X_test = X_test.toarray()
+
         plt.scatter(X_test, y_test, color="black")
         plt.plot(X_test, y_pred, color="blue", linewidth=3)
         plt.xticks(())
@@ -402,6 +602,10 @@ class LinRegression:
                   "of independent variables.")
             return False
 
+        # A chunk iterator yields the labels with the attributes
+        if callable(self.attributes):
+            return True
+
         # Check if labels exists
         if self.labels is None:
             print("labels is missing; call set_labels(new_labels) to fix this!",
@@ -409,6 +613,13 @@ class LinRegression:
                   "variables.")
             return False
 
+        # Splitting needs sparse attributes in a row-sliceable format
+        if not is_sliceable(self.attributes):
+            print("attributes is a sparse matrix that can't be sliced by",
+                  "rows; call set_attributes(new_attributes.tocsr()) to",
+                  "fix this!")
+            return False
+
         # Check if attributes and labels have same number of rows (samples)
         if self.attributes.shape[0] != self.labels.shape[0]:
             print("attributes and labels don't have the same number of rows.",
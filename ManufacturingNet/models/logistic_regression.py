@@ -11,17 +11,29 @@ import numpy as np
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import (accuracy_score, confusion_matrix, make_scorer,
                              roc_auc_score, roc_curve)
-from sklearn.model_selection import (GridSearchCV, cross_val_score,
-                                     train_test_split)
+from sklearn.model_selection import train_test_split
+
+from .bulk_scoring import score_model
+from .incremental import make_online, partial_update
+from .persistence import load_wrapper, save_wrapper
+from .regularization_path import path_search, resolve_auto
+from .search import prompt_search_settings, run_search
+from .shallow_evaluation import PhaseTimer, cross_validate_model
+from .sparse_inputs import is_sliceable
 
 
 class LogRegression:
     """Class framework for logistic regression model."""
 
-    def __init__(self, attributes=None, labels=None):
+    def __init__(self, attributes=None, labels=None, cv_n_jobs=None,
+                 estimate_only=False):
         """Initializes a LogisticRegression object."""
         self.attributes = attributes
         self.labels = labels
+        self.cv_n_jobs = cv_n_jobs
+        self.estimate_only = estimate_only
+        self.cv_estimators = {}
+        self.training_times = {}
 
         self.test_size = None
         self.cv = None
@@ -32,6 +44,9 @@ class LogRegression:
         self.gridsearch = False
         self.gs_params = None
         self.gs_result = None
+        self.search_settings = {}
+        self.update_epochs = 1
+        self.update_scores = {}
 
         self.regression = None
         self.classes = None
@@ -87,6 +102,24 @@ class LogRegression:
         """Accessor method for cross_val_scores."""
         return self.cross_val_scores
 
+    def get_cv_estimators(self):
+        """Accessor method for cv_estimators, the fitted cross validation
+        fold estimators of each model.
+        """
+        return self.cv_estimators
+
+    def get_training_times(self):
+        """Accessor method for training_times, the wall-clock and compute
+        time of each training phase of each model.
+        """
+        return self.training_times
+
+    def get_update_scores(self):
+        """Accessor method for update_scores, the accuracy of each model on
+        each batch of new data before it was updated with it.
+        """
+        return self.update_scores
+
     # Modifier methods
 
     def set_attributes(self, new_attributes=None):
@@ -97,6 +130,24 @@ class LogRegression:
         """Modifier method for labels."""
         self.labels = new_labels
 
+    def set_cv_n_jobs(self, new_cv_n_jobs=None):
+        """Modifier method for cv_n_jobs, the number of cross validation
+        folds run in parallel.
+        """
+        self.cv_n_jobs = new_cv_n_jobs
+
+    def set_estimate_only(self, new_estimate_only=False):
+        """Modifier method for estimate_only. If True, cross validation is
+        skipped and the holdout score is the only estimate.
+        """
+        self.estimate_only = new_estimate_only
+
+    def set_update_epochs(self, new_update_epochs=1):
+        """Modifier method for update_epochs, the number of passes update()
+        makes over each batch of new data.
+        """
+        self.update_epochs = new_update_epochs
+
     # Wrapper for logistic regression model
 
     def run(self):
@@ -114,6 +165,7 @@ class LogRegression:
 
             # Train the model and get resultant coefficients
             # Handle exception if arguments are incorrect
+            timer = PhaseTimer()
             try:
                 self.regression.fit(dataset_X_train, np.ravel(dataset_y_train))
             except Exception as e:
@@ -124,6 +176,8 @@ class LogRegression:
                 self.regression = None
                 return
 
+            timer.mark("fit")
+
             # Get resultant model instance data
             self.classes = self.regression.classes_
             self.coefficients = self.regression.coef_
@@ -150,9 +204,12 @@ class LogRegression:
                 self.confusion_matrix = \
                     confusion_matrix(dataset_y_test, y_prediction)
 
-            self.cross_val_scores = cross_val_score(self.regression,
-                                                    self.attributes,
-                                                    self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = self._cross_validate(self.regression, timer)
+            self.cross_val_scores = scores
+            self.cv_estimators["LogisticRegression"] = estimators
+            self.training_times["LogisticRegression"] = timer.get_times()
+            timer.print_times()
 
             # Output results
             self._output_results()
@@ -180,8 +237,98 @@ class LogRegression:
         print("\nLogRegression Predictions:\n", y_prediction, "\n")
         return y_prediction
 
+    # Wrapper for bulk scoring
+
+    def predict_bulk(self, dataset_X=None, output=None, method="predict",
+                     chunk_size=10000, n_threads=1):
+        """Classifies each datapoint in dataset_X using the regression model's
+        method, "predict", "predict_proba" or "decision_function", on n_threads
+        threads, chunk_size rows at a time, without displaying them. dataset_X
+        can be an array, a sparse matrix, the filename of a .npy file, or a
+        callable returning an iterator over chunks. The predictions are written
+        to output, an array or a .npy or CSV filename, if given. Returns the
+        predictions, or the CSV filename.
+        """
+        # Check that run() has already been called
+        if self.regression is None:
+            print("The regression model seems to be missing. Have you called",
+                  "run() yet?")
+            return None
+
+        # Try to score dataset_X
+        # Handle exception if dataset_X or output aren't valid
+        try:
+            return score_model(self.regression, "LogisticRegression",
+                               dataset_X, output, method, chunk_size,
+                               n_threads)
+        except Exception as e:
+            print("The model failed to run. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+    # Wrapper for incremental learning
+
+    def update(self, X_new=None, y_new=None):
+        """Updates the model with a batch of new labeled data without
+        retraining it from scratch. The model's accuracy on the new data
+        is measured before it learns from it. Returns the accuracy.
+        """
+        # Check that run() has already been called
+        if self.regression is None:
+            print("The regression model seems to be missing. Have you called",
+                  "run() yet?")
+            return None
+
+        # Try to update the model
+        # Handle exception if X_new or y_new aren't valid inputs
+        try:
+            score = self.regression.score(X_new, np.ravel(y_new))
+            self.regression = make_online(self.regression, self.attributes,
+                                          self.labels)
+            partial_update(self.regression, X_new, y_new,
+                           epochs=self.update_epochs)
+        except Exception as e:
+            print("The model failed to update. Check your inputs and try",
+                  "again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+        self.coefficients = self.regression.coef_
+        self.intercept = self.regression.intercept_
+        self.update_scores.setdefault("LogisticRegression", []).append(score)
+
+        print("\nAccuracy on the new data before the update:", score, "\n")
+        return score
+
+    # Persistence
+
+    def save(self, path):
+        """Writes the model to the directory path, without the dataset, its
+        splits or the results. Returns path.
+        """
+        return save_wrapper(self, path, ("regression",), "run()")
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Returns a LogRegression holding the model saved in the directory
+        path with save(). The model is read from disk the first time it is
+        used, with its arrays memory-mapped.
+        """
+        return load_wrapper(cls, path, mmap_mode)
+
     # Helper methods
 
+    def _cross_validate(self, model, timer):
+        """Cross validates model with the shared evaluation engine.
+        Returns the fold scores and the fitted fold estimators.
+        """
+        return cross_validate_model(model, self.attributes, self.labels,
+                                    cv=self.cv, n_jobs=self.cv_n_jobs,
+                                    estimate_only=self.estimate_only,
+                                    timer=timer)
+
     def _create_model(self):
         """Runs UI for getting parameters and creating model."""
         print("\n==================================")
@@ -342,7 +489,8 @@ class LogRegression:
                 while True:
                     print("\nEnter the solvers to evaluate.")
                     print("Options: 1-'newton-cg', 2-'lbfgs', 3-'liblinear',",
-                          "4-'sag', 5-'saga'. Enter 'all' for all options.")
+                          "4-'sag', 5-'saga', 6-'auto'. Enter 'all' for all",
+                          "options.")
                     print("Example input: 1,2,3")
                     user_input = input().lower()
 
@@ -356,7 +504,7 @@ class LogRegression:
                         break
                     else:
                         sol_dict = {1: "newton-cg", 2: "lbfgs", 3: "liblinear",
-                                    4: "sag", 5: "saga"}
+                                    4: "sag", 5: "saga", 6: "auto"}
                         try:
                             sol_params_int = \
                                 list(map(int, list(user_input.split(","))))
@@ -379,11 +527,43 @@ class LogRegression:
                 params["solver"] = sol_params
                 print("solvers:", sol_params)
 
+                while True:
+                    print("\nEnter the list of regularization parameters to",
+                          "try out, or leave blank to keep C fixed.")
+                    print("Example input: 0.01,0.1,1,10")
+                    user_input = input().lower()
+
+                    if user_input == "q":
+                        self.gridsearch = False
+                        break_early = True
+                        break
+                    elif user_input == "":
+                        break
+
+                    try:
+                        C_params = \
+                            list(map(float, list(user_input.split(","))))
+                        for num in C_params:
+                            if num <= 0:
+                                raise Exception
+
+                        params["C"] = C_params
+                        print("C values:", C_params)
+                        break
+                    except Exception:
+                        print("Invalid input.")
+
+                if break_early:
+                    break
+
+                self.search_settings = prompt_search_settings()
+
                 print("\n= End of GridSearch inputs. =\n")
                 self.gs_params = params
                 best_params = self._run_gridsearch()
                 solver = best_params["solver"]
                 penalty = best_params["penalty"]
+                C = best_params.get("C", C)
                 break
 
             break_early = False
@@ -548,7 +728,7 @@ class LogRegression:
             if break_early:
                 break
 
-            while True:
+            while not self.gridsearch or "C" not in self.gs_params:
                 user_input = input("\nEnter a positive number for the inverse "
                                    + "of regularization strength C: ")
                 try:
@@ -844,12 +1024,24 @@ class LogRegression:
             train_test_split(self.attributes, self.labels,
                              test_size=self.test_size)
 
-        # Run GridSearch
-        grid_obj = GridSearchCV(clf, self.gs_params, scoring=acc_scorer)
-        grid_obj = grid_obj.fit(dataset_X_train, dataset_y_train)
+        # Run the hyperparameter search; an exhaustive search over C
+        # without a checkpoint follows a warm-started regularization path
+        settings = self.search_settings
+        if "C" in self.gs_params \
+                and settings.get("strategy", "grid") == "grid" \
+                and settings.get("checkpoint") is None:
+            best_params = path_search(clf, self.gs_params, dataset_X_train,
+                                      dataset_y_train, scoring=acc_scorer,
+                                      n_jobs=settings.get("n_jobs", -1))
+        else:
+            best_params = run_search(clf,
+                                     resolve_auto(self.gs_params,
+                                                  dataset_X_train),
+                                     dataset_X_train, dataset_y_train,
+                                     scoring=acc_scorer, **settings)
 
         # Set the clf to the best combination of parameters
-        clf = grid_obj.best_estimator_
+        clf.set_params(**best_params)
 
         # Fit the best algorithm to the data
         clf.fit(dataset_X_train, dataset_y_train)
@@ -857,8 +1049,8 @@ class LogRegression:
         self.gs_result = accuracy_score(dataset_y_test, predictions)
 
         # Return the best parameters
-        print("\nBest GridSearch Parameters:\n", grid_obj.best_params_, "\n")
-        return grid_obj.best_params_
+        print("\nBest GridSearch Parameters:\n", best_params, "\n")
+        return best_params
 
     def _check_inputs(self):
         """Verifies if the instance data is ready for use in logistic
@@ -878,6 +1070,13 @@ class LogRegression:
                   "dependent variables.")
             return False
 
+        # Splitting needs sparse attributes in a row-sliceable format
+        if not is_sliceable(self.attributes):
+            print("attributes is a sparse matrix that can't be sliced by",
+                  "rows; call set_attributes(new_attributes.tocsr()) to",
+                  "fix this!")
+            return False
+
         # Check if attributes and labels have same number of rows (samples)
         if self.attributes.shape[0] != self.labels.shape[0]:
             print("attributes and labels don't have the same number of rows.",
@@ -0,0 +1,396 @@
+"""parallel fits the models of AllClassificationModels and
+AllRegressionModels concurrently. Every holdout fit and every cross
+validation fold is a task run in its own worker process, so a model that
+runs over its time budget can be stopped without stopping the others.
+
+The dataset and the split indices are written once to memory-mapped
+files that every worker opens read-only, so they are shared between the
+workers instead of being copied into each of them.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from collections import deque
+from contextlib import redirect_stderr, redirect_stdout
+from multiprocessing.connection import wait
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import accuracy_score, r2_score
+from sklearn.model_selection import check_cv, train_test_split
+
+try:
+    import resource
+except ImportError:         # not available on Windows
+    resource = None
+
+
+class SharedArray:
+    """Reference to an array stored in a memory-mapped .npy file.
+
+    Only the file name travels to the worker processes, which map the
+    file read-only; the operating system shares its pages between them.
+    """
+
+    def __init__(self, filename):
+        """Initializes a SharedArray object."""
+        self.filename = filename
+
+    @classmethod
+    def create(cls, array, directory, name):
+        """Writes array to directory and returns a reference to it. Arrays
+        that are already memory-mapped .npy files are referenced in place.
+        """
+        if isinstance(array, np.memmap) and array.filename is not None \
+                and array.filename.endswith(".npy"):
+            mapped = np.load(array.filename, mmap_mode="r")
+            if mapped.shape == array.shape and mapped.dtype == array.dtype \
+                    and mapped.offset == array.offset \
+                    and array.flags.c_contiguous:
+                return cls(array.filename)
+
+        filename = os.path.join(directory, name + ".npy")
+        np.save(filename, np.asarray(array))
+        return cls(filename)
+
+    def load(self):
+        """Maps the array read-only."""
+        return np.load(self.filename, mmap_mode="r")
+
+
+class SharedSparseMatrix:
+    """Reference to a CSR or CSC matrix whose data, indices and indptr
+    arrays are stored as SharedArrays, so that sparse datasets are shared
+    between the workers like dense ones.
+    """
+
+    parts = ("data", "indices", "indptr")
+
+    def __init__(self, arrays, shape, format):
+        """Initializes a SharedSparseMatrix object."""
+        self.arrays = arrays
+        self.shape = shape
+        self.format = format
+
+    @classmethod
+    def create(cls, matrix, directory, name):
+        """Writes the arrays of matrix to directory and returns a
+        reference to them. Other sparse formats are converted to CSR.
+        """
+        if matrix.format not in {"csr", "csc"}:
+            matrix = matrix.tocsr()
+        arrays = [SharedArray.create(getattr(matrix, part), directory,
+                                     name + "_" + part)
+                  for part in cls.parts]
+        return cls(arrays, matrix.shape, matrix.format)
+
+    def load(self):
+        """Rebuilds the matrix on its read-only memory-mapped arrays."""
+        constructor = sparse.csr_matrix if self.format == "csr" \
+            else sparse.csc_matrix
+        return constructor(tuple(array.load() for array in self.arrays),
+                           shape=self.shape, copy=False)
+
+
+def _resolve(value):
+    """Returns the array behind a SharedArray or the matrix behind a
+    SharedSparseMatrix, or value itself.
+    """
+    if isinstance(value, (SharedArray, SharedSparseMatrix)):
+        return value.load()
+    return value
+
+
+class FoldCache:
+    """Train/test split and cross validation fold indices, computed once
+    and shared by every model and worker.
+
+    Folds are stratified for classification, as in cross_val_score.
+    """
+
+    def __init__(self, labels, test_size, n_folds=5, classifier=False,
+                 random_state=None):
+        """Computes the holdout split and the cross validation folds."""
+        indices = np.arange(len(labels))
+        self.train_index, self.test_index = train_test_split(
+            indices, test_size=test_size, random_state=random_state)
+        self.folds = list(check_cv(n_folds, labels, classifier=classifier)
+                          .split(indices.reshape(-1, 1), labels))
+        self.n_folds = n_folds
+
+    def share(self, directory):
+        """Writes the indices to directory; returns the shared holdout
+        split and the list of shared folds.
+        """
+        holdout = (SharedArray.create(self.train_index, directory, "train"),
+                   SharedArray.create(self.test_index, directory, "test"))
+        folds = [(SharedArray.create(train, directory,
+                                     "fold{}_train".format(fold)),
+                  SharedArray.create(test, directory,
+                                     "fold{}_test".format(fold)))
+                 for fold, (train, test) in enumerate(self.folds)]
+        return holdout, folds
+
+
+class ModelTask:
+    """A fit-and-score job: the holdout fit of a model (fold=None) or
+    one of its cross validation folds.
+    """
+
+    def __init__(self, name, estimator, train_index, test_index, fold=None):
+        """Initializes a ModelTask object."""
+        self.name = name
+        self.estimator = estimator
+        self.train_index = train_index
+        self.test_index = test_index
+        self.fold = fold
+
+
+def _limit_threads(estimator):
+    """Runs the estimator single-threaded, since the parallelism comes
+    from running several tasks at once.
+    """
+    params = estimator.get_params()
+    for param in ("n_jobs", "nthread"):
+        if param in params:
+            estimator.set_params(**{param: 1})
+    return estimator
+
+
+def _peak_memory_mb():
+    """Returns the peak resident memory of the process in megabytes, or
+    None if it can't be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1e6 if os.uname().sysname == "Darwin" else peak / 1e3
+
+
+def _fit_and_score(task, X, y, verbose):
+    """Fits task.estimator on the train rows and scores it on the test
+    rows. Returns a dict with the score, the fit and predict times and the
+    memory the task added to the worker's peak, plus the fitted estimator
+    for holdout tasks.
+    """
+    X, y = _resolve(X), _resolve(y)
+    train_index = _resolve(task.train_index)
+    test_index = _resolve(task.test_index)
+
+    def run():
+        start_memory = _peak_memory_mb()
+
+        start_time = time.time()
+        task.estimator.fit(X[train_index], y[train_index])
+        fit_time = time.time() - start_time
+
+        start_time = time.time()
+        y_prediction = task.estimator.predict(X[test_index])
+        predict_time = time.time() - start_time
+
+        if is_classifier(task.estimator):
+            score = accuracy_score(y[test_index], y_prediction)
+        else:
+            score = r2_score(y[test_index], y_prediction)
+
+        peak_memory = None
+        if start_memory is not None:
+            peak_memory = _peak_memory_mb() - start_memory
+
+        return {"score": score, "fit_time": fit_time,
+                "predict_time": predict_time, "peak_memory": peak_memory}
+
+    if verbose:
+        result = run()
+    else:
+        suppress_output = io.StringIO()
+        with redirect_stderr(suppress_output), \
+                redirect_stdout(suppress_output), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = run()
+
+    if task.fold is None:
+        result["estimator"] = task.estimator
+    return result
+
+
+def _worker(connection, task, X, y, verbose):
+    """Entry point of a worker process; sends back the result or the
+    exception message.
+    """
+    try:
+        connection.send(("ok", _fit_and_score(task, X, y, verbose)))
+    except Exception as e:
+        connection.send(("error", str(e)))
+    finally:
+        connection.close()
+
+
+def build_tasks(models, holdout, folds):
+    """Creates the holdout task and one task per cross validation fold
+    for every (name, estimator) pair in models. holdout is a (train, test)
+    pair of indices and folds a list of such pairs. Tasks are ordered
+    model by model so that the first models finish early.
+    """
+    tasks = []
+    for name, estimator in models:
+        tasks.append(ModelTask(name, _limit_threads(estimator), *holdout))
+        for fold, (fold_train, fold_test) in enumerate(folds):
+            tasks.append(ModelTask(name, _limit_threads(clone(estimator)),
+                                   fold_train, fold_test, fold))
+    return tasks
+
+
+def run_models(models, X, y, fold_cache, n_jobs=None, time_budget=None,
+               verbose=False, on_model_done=None):
+    """Runs the holdout fit and the cross validation folds of every
+    (name, estimator) pair in models in parallel worker processes.
+
+    Dense arrays, sparse matrices and the fold indices are shared
+    through memory-mapped files in a temporary directory that is removed
+    afterwards. See run_tasks() for time_budget and on_model_done.
+    """
+    directory = tempfile.mkdtemp(prefix="manufacturingnet_")
+    try:
+        if sparse.issparse(X):
+            X = SharedSparseMatrix.create(X, directory, "attributes")
+        elif isinstance(X, np.ndarray):
+            X = SharedArray.create(X, directory, "attributes")
+        y = SharedArray.create(y, directory, "labels")
+        holdout, folds = fold_cache.share(directory)
+
+        tasks = build_tasks(models, holdout, folds)
+        return run_tasks(tasks, X, y, n_jobs=n_jobs, time_budget=time_budget,
+                         verbose=verbose, on_model_done=on_model_done)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_tasks(tasks, X, y, n_jobs=None, time_budget=None, verbose=False,
+              on_model_done=None):
+    """Runs the tasks in up to n_jobs worker processes at a time.
+
+    time_budget is the number of seconds a model may run, counted from
+    the start of its first task; when it is exceeded, the model's running
+    tasks are terminated and its remaining tasks are dropped.
+    on_model_done(name, results, error) is called as soon as all the tasks
+    of a model are finished, where results maps each fold (None for the
+    holdout fit) to its result dict and error is None, the exception
+    message of a failed task or "time budget exceeded".
+
+    Returns a dict of model name to (results, error).
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    context = multiprocessing.get_context()
+
+    remaining = {}
+    for task in tasks:
+        remaining[task.name] = remaining.get(task.name, 0) + 1
+
+    pending = deque(tasks)
+    running = {}
+    started = {}
+    results = {name: {} for name in remaining}
+    errors = {}
+    done = {}
+
+    def finish(name):
+        done[name] = (results[name], errors.get(name))
+        if on_model_done is not None:
+            on_model_done(name, results[name], errors.get(name))
+
+    def stop(name, error):
+        errors.setdefault(name, error)
+        for connection, (task, process) in list(running.items()):
+            if task.name == name:
+                process.terminate()
+                process.join()
+                connection.close()
+                del running[connection]
+        finish(name)
+
+    while pending or running:
+        # Start tasks while there are free workers
+        while pending and len(running) < n_jobs:
+            task = pending.popleft()
+            if task.name in done:
+                continue
+
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_worker,
+                                      args=(sender, task, X, y, verbose),
+                                      daemon=True)
+            process.start()
+            sender.close()
+            running[receiver] = (task, process)
+            started.setdefault(task.name, time.time())
+
+        if not running:
+            continue
+
+        # Wait for a result, waking up in time to enforce the budgets
+        timeout = None
+        if time_budget is not None:
+            deadlines = [started[task.name] + time_budget - time.time()
+                         for task, _ in running.values()]
+            timeout = max(min(deadlines), 0)
+
+        for connection in wait(list(running), timeout):
+            if connection not in running:
+                continue
+            task, process = running.pop(connection)
+            try:
+                status, value = connection.recv()
+            except EOFError:
+                status, value = "error", "worker process exited unexpectedly"
+            connection.close()
+            process.join()
+
+            if task.name in done:
+                continue
+            if status == "ok":
+                results[task.name][task.fold] = value
+            else:
+                errors.setdefault(task.name, value)
+
+            remaining[task.name] -= 1
+            if task.name in errors:
+                stop(task.name, errors[task.name])
+            elif remaining[task.name] == 0:
+                finish(task.name)
+
+        # Stop the models that ran out of time
+        if time_budget is not None:
+            now = time.time()
+            for task, _ in list(running.values()):
+                if task.name not in done and \
+                        now - started[task.name] > time_budget:
+                    stop(task.name, "time budget exceeded")
+
+    return done
+
+
+def summarize(results, n_folds):
+    """Combines the task results of one model: the holdout score and
+    times, the mean cross validation score, and the largest peak memory
+    of its tasks.
+    """
+    holdout = results[None]
+    memory = [result["peak_memory"] for result in results.values()
+              if result["peak_memory"] is not None]
+    return {"score": holdout["score"],
+            "cv_score": np.mean([results[fold]["score"]
+                                 for fold in range(n_folds)]),
+            "fit_time": holdout["fit_time"],
+            "predict_time": holdout["predict_time"],
+            "peak_memory": max(memory) if memory else None,
+            "estimator": holdout["estimator"]}
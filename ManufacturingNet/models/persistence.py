@@ -0,0 +1,239 @@
+"""persistence saves the fitted models of the shallow learning wrappers
+and loads them back lazily.
+
+Only the estimators are written, not the dataset, its splits or the
+results, each to its own file in a directory: scikit-learn models with
+joblib, uncompressed so their arrays can be memory-mapped, and XGBoost
+models in XGBoost's native UBJSON format. Compiled tree ensembles (see
+tree_inference) are saved as .npy node arrays.
+
+Loading only reads the metadata. Each model is read from its file the
+first time it is used. The NumPy arrays stored by joblib, such as
+support vectors and coefficients, are memory-mapped read-only, so the
+operating system shares one copy of them between all the processes that
+load the same directory. Trees aren't shared this way: scikit-learn
+copies the node arrays of each tree when a forest is loaded, and XGBoost
+reads its models into memory. Compiled forests are memory-mapped as a
+whole, which makes them the way to share a large forest between workers.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import json
+import os
+
+import joblib
+import numpy as np
+import sklearn
+
+from ..runtime import METADATA_FILE, replace_file, write_metadata
+from .tree_inference import CompiledForest
+
+try:
+    import xgboost as xgb
+except ImportError:         # only needed for XGBoost models
+    xgb = None
+
+
+def _versions():
+    """Returns the versions of the libraries the saved models depend on."""
+    versions = {"numpy": np.__version__, "scikit-learn": sklearn.__version__}
+    if xgb is not None:
+        versions["xgboost"] = xgb.__version__
+    return versions
+
+
+def _is_xgboost(model):
+    """Returns whether model is an XGBoost model or booster."""
+    return xgb is not None and isinstance(model, (xgb.XGBModel, xgb.Booster))
+
+
+def _read_model(path, entry, mmap_mode):
+    """Reads the model described by a metadata entry. Only the arrays
+    that joblib stores as NumPy arrays are memory-mapped.
+    """
+    filename = os.path.join(path, entry["file"])
+    if entry["format"] == "xgboost":
+        if xgb is None:
+            raise ImportError("xgboost is required to load " + filename)
+        if entry["class"] == "Booster":
+            return xgb.Booster(model_file=filename)
+        model = getattr(xgb, entry["class"])()
+        model.load_model(filename)
+        return model
+    return joblib.load(filename, mmap_mode=mmap_mode)
+
+
+class LazyModel:
+    """Stand-in for a saved model that reads it on first use.
+
+    Attribute access, assignment and isinstance() are forwarded to the
+    model, which is only read the first time one of them happens. A
+    LazyModel that hasn't been read yet is pickled as its file name, so
+    worker processes read, and memory-map, the file themselves instead of
+    receiving a copy of the model.
+    """
+
+    def __init__(self, path, entry, mmap_mode="r"):
+        """Initializes a LazyModel for the metadata entry of a model saved
+        in the directory path.
+        """
+        object.__setattr__(self, "_path", path)
+        object.__setattr__(self, "_entry", entry)
+        object.__setattr__(self, "_mmap_mode", mmap_mode)
+        object.__setattr__(self, "_model", None)
+
+    def load(self):
+        """Returns the model, reading it if it hasn't been read yet."""
+        if self._model is None:
+            object.__setattr__(self, "_model", _read_model(
+                self._path, self._entry, self._mmap_mode))
+        return self._model
+
+    @property
+    def __class__(self):
+        """Makes isinstance() see the model's class."""
+        return type(self.load())
+
+    def __getattr__(self, name):
+        """Forwards attribute access to the model."""
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        """Forwards attribute assignment to the model."""
+        setattr(self.load(), name, value)
+
+    def __reduce_ex__(self, protocol):
+        """Pickles an unread model as its file name and a read one as
+        itself.
+        """
+        if self._model is None:
+            return LazyModel, (self._path, self._entry, self._mmap_mode)
+        return self._model.__reduce_ex__(protocol)
+
+    def __repr__(self):
+        """Returns the model's representation once it has been read."""
+        if self._model is None:
+            return "LazyModel(" + repr(os.path.join(self._path,
+                                                    self._entry["file"])) \
+                + ")"
+        return repr(self._model)
+
+
+def resolve(model):
+    """Returns the model behind a LazyModel, or model itself."""
+    return model.load() if type(model) is LazyModel else model
+
+
+def save_models(wrapper, path, attributes):
+    """Writes the fitted models stored in the given attributes of wrapper,
+    and their compiled forms, to the directory path. Returns the names of
+    the attributes that were saved; nothing is written if none of the
+    models has been fitted.
+    """
+    fitted = [attribute for attribute in attributes
+              if getattr(wrapper, attribute, None) is not None]
+    if not fitted:
+        return []
+
+    os.makedirs(path, exist_ok=True)
+    models, compiled = {}, {}
+    for attribute in fitted:
+        model = resolve(getattr(wrapper, attribute))
+
+        # Files are replaced whole, so models loaded from path, which may
+        # still be memory-mapping them, can be saved back to it
+        if _is_xgboost(model):
+            entry = {"format": "xgboost", "file": attribute + ".ubj",
+                     "class": type(model).__name__}
+            replace_file(os.path.join(path, entry["file"]), model.save_model)
+        else:
+            # Uncompressed, so that the arrays can be memory-mapped
+            entry = {"format": "joblib", "file": attribute + ".joblib"}
+            replace_file(os.path.join(path, entry["file"]),
+                         lambda filename, model=model: joblib.dump(model,
+                                                                   filename))
+        models[attribute] = entry
+
+        compiled_model = getattr(wrapper, "compiled_" + attribute, None)
+        if compiled_model is not None:
+            compiled[attribute] = "compiled_" + attribute
+            compiled_model.save(os.path.join(path, compiled[attribute]))
+
+    write_metadata(path, {"format": "manufacturingnet",
+                          "model_type": type(wrapper).__name__,
+                          "models": models,
+                          "compiled": compiled,
+                          "versions": _versions()})
+    return list(models)
+
+
+def load_models(wrapper, path, mmap_mode="r"):
+    """Sets the attributes of wrapper to LazyModels of the models saved in
+    the directory path, and its compiled models to memory-mapped
+    CompiledForests. Returns wrapper.
+    """
+    with open(os.path.join(path, METADATA_FILE)) as file:
+        metadata = json.load(file)
+
+    if metadata.get("format") != "manufacturingnet":
+        raise ValueError(path + " doesn't hold models saved with save().")
+    if metadata["model_type"] != type(wrapper).__name__:
+        raise ValueError(path + " holds " + metadata["model_type"]
+                         + " models, not " + type(wrapper).__name__
+                         + " models.")
+
+    versions = _versions()
+    for library, version in metadata.get("versions", {}).items():
+        if versions.get(library, version) != version:
+            print("The models were saved with", library, version,
+                  "but", library, versions[library], "is installed.")
+
+    for attribute, entry in metadata["models"].items():
+        setattr(wrapper, attribute, LazyModel(path, entry, mmap_mode))
+    for attribute, directory in metadata.get("compiled", {}).items():
+        setattr(wrapper, "compiled_" + attribute,
+                CompiledForest.load(os.path.join(path, directory),
+                                    mmap_mode))
+    return wrapper
+
+
+def save_wrapper(wrapper, path, attributes, run="run()"):
+    """Saves the fitted models stored in the given attributes of a
+    shallow learning wrapper with save_models(), displaying what was
+    saved. run names the runner methods in the message displayed when no
+    model has been fitted. Returns path, or None if nothing was saved.
+    """
+    # Try to save the models
+    # Handle exception if path isn't writable
+    try:
+        saved = save_models(wrapper, path, attributes)
+    except Exception as e:
+        print("The models failed to save.")
+        print("Here is the exception message:")
+        print(e)
+        return None
+
+    if not saved:
+        print("There are no fitted models to save. Have you called", run,
+              "yet?")
+        return None
+
+    print("Saved", ", ".join(saved), "to", path)
+    return path
+
+
+def load_wrapper(cls, path, mmap_mode="r"):
+    """Returns a new instance of the shallow learning wrapper class cls
+    holding the models saved in path, as load_models() sets them, or None
+    if they can't be loaded.
+    """
+    # Try to load the models
+    # Handle exception if path doesn't hold saved models
+    try:
+        return load_models(cls(), path, mmap_mode)
+    except Exception as e:
+        print("The models failed to load.")
+        print("Here is the exception message:")
+        print(e)
+        return None
@@ -0,0 +1,235 @@
+# Post-training int8 quantization of the deep learning wrappers for CPU inference
+
+import copy
+import io
+import time
+
+import numpy as np
+
+import torch
+import torch.nn as nn
+
+from .evaluation import inference_mode
+
+try:
+    from torch.ao.quantization import get_default_qconfig, quantize_dynamic
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+except ImportError:         # torch < 1.10
+    from torch.quantization import get_default_qconfig, quantize_dynamic
+    from torch.quantization.quantize_fx import convert_fx, prepare_fx
+
+try:
+    from torch.ao.quantization import get_default_qconfig_mapping
+except ImportError:         # torch < 1.13 takes a qconfig dict
+    get_default_qconfig_mapping = None
+
+
+QUANTIZATION_METHODS = ('dynamic', 'static')
+
+# layers replaced by their int8 versions in dynamic quantization
+DYNAMIC_LAYERS = {nn.Linear, nn.LSTM}
+
+
+def _float_copy(net):
+
+    # Method for getting a float32 copy of the network on the cpu, leaving the trained network untouched
+
+    return copy.deepcopy(net).cpu().float().eval()
+
+
+def _cast(data, dtype):
+
+    # Tensors and packed sequences both accept a dtype keyword
+
+    return data.to(dtype=dtype)
+
+
+def model_size_mb(net):
+
+    # Method for getting the size of the serialized weights of a network in megabytes
+
+    buffer = io.BytesIO()
+    torch.save(net.state_dict(), buffer)
+    return buffer.tell() / 1e6
+
+
+def dynamic_quantize(net):
+    """
+    Returns a copy of net whose Linear and LSTM layers have int8 weights. Activations are
+    quantized on the fly, so no calibration data is needed.
+    """
+
+    return quantize_dynamic(_float_copy(net), DYNAMIC_LAYERS, dtype=torch.qint8)
+
+
+def static_quantize(net, calibration_loader, calibration_batches=10, backend=None):
+    """
+    Returns a copy of net with int8 weights and activations, built with FX graph mode quantization.
+
+    The activation ranges are calibrated on the first calibration_batches batches of
+    calibration_loader. backend is the quantized engine ('fbgemm' or 'x86' for Intel and AMD
+    CPUs, 'qnnpack' for ARM); the engine selected in torch is used by default.
+    """
+
+    backend = backend or torch.backends.quantized.engine
+    torch.backends.quantized.engine = backend
+
+    model = _float_copy(net)
+    example = _cast(next(iter(calibration_loader))[0], torch.float32)
+
+    if get_default_qconfig_mapping is not None:
+        prepared = prepare_fx(model, get_default_qconfig_mapping(backend), (example,))
+    else:
+        prepared = prepare_fx(model, {'': get_default_qconfig(backend)})
+
+    with torch.no_grad():
+        for batch_idx, (data, _) in enumerate(calibration_loader):
+            if batch_idx >= calibration_batches:
+                break
+            prepared(_cast(data, torch.float32))
+
+    return convert_fx(prepared)
+
+
+def _score(net, loader, dtype, classification, max_batches):
+
+    # Method for running net over loader on the cpu, timing the forward passes
+
+    outputs_list = []
+    targets_list = []
+    elapsed = 0.0
+    num_samples = 0
+
+    with inference_mode():
+        for batch_idx, (data, target) in enumerate(loader):
+            if max_batches is not None and batch_idx >= max_batches:
+                break
+
+            data = _cast(data, dtype)
+            start = time.perf_counter()
+            outputs = net(data)
+            elapsed += time.perf_counter() - start
+
+            outputs = outputs.argmax(1) if classification else outputs.double()
+            outputs_list.append(outputs.numpy())
+            targets_list.append(target.numpy())
+            num_samples += target.shape[0]
+
+    return np.concatenate(outputs_list), np.concatenate(targets_list), elapsed, num_samples
+
+
+def _sample_latency(net, loader, dtype, runs):
+
+    # Method for measuring the median latency of a single-sample prediction in milliseconds
+
+    data = next(iter(loader))[0]
+    if not torch.is_tensor(data):       # packed sequences are timed per batch only
+        return None
+
+    sample = _cast(data[:1], dtype)
+    timings = []
+    with inference_mode():
+        net(sample)
+        for _ in range(runs):
+            start = time.perf_counter()
+            net(sample)
+            timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000.0
+
+
+def quantization_report(float_net, quantized_net, loader, classification, max_batches=None,
+                        latency_runs=50):
+    """
+    Compares a quantized network with the float network it was built from, on the cpu.
+
+    Returns a dict with a 'float' and a 'quantized' entry, each holding the accuracy (%) for
+    classification or the mean squared error for regression, the time per sample when scoring
+    loader in batches, the median latency of a single-sample prediction and the size of the
+    weights. For classification, 'agreement' is the percentage of samples on which both networks
+    predict the same class; for regression, 'max_abs_difference' is the largest output difference.
+    """
+
+    float_net = copy.deepcopy(float_net).cpu().eval()
+    float_dtype = next(float_net.parameters()).dtype
+
+    results = {}
+    predictions = {}
+    for name, net, dtype in (('float', float_net, float_dtype),
+                             ('quantized', quantized_net, torch.float32)):
+
+        outputs, targets, elapsed, num_samples = _score(net, loader, dtype, classification,
+                                                        max_batches)
+        predictions[name] = outputs
+
+        entry = {}
+        if classification:
+            entry['accuracy'] = float((outputs == targets).mean() * 100.0)
+        else:
+            entry['mse'] = float(((outputs.reshape(targets.shape) - targets) ** 2).mean())
+        entry['batched_ms_per_sample'] = elapsed * 1000.0 / max(num_samples, 1)
+        entry['sample_latency_ms'] = _sample_latency(net, loader, dtype, latency_runs)
+        entry['size_mb'] = model_size_mb(net)
+        results[name] = entry
+
+    if classification:
+        results['agreement'] = float((predictions['float'] == predictions['quantized']).mean() * 100.0)
+    else:
+        results['max_abs_difference'] = float(np.abs(predictions['float'] - predictions['quantized']).max())
+
+    return results
+
+
+def print_quantization_report(report):
+
+    # Method for printing the accuracy-vs-latency comparison
+
+    metric = 'accuracy' if 'accuracy' in report['float'] else 'mse'
+    rows = [(metric, '{:.4f}'), ('batched_ms_per_sample', '{:.4f}'),
+            ('sample_latency_ms', '{:.4f}'), ('size_mb', '{:.2f}')]
+
+    print('{:<24}{:>14}{:>14}'.format('', 'float', 'quantized'))
+    for key, fmt in rows:
+        values = [report[name][key] for name in ('float', 'quantized')]
+        values = ['-' if value is None else fmt.format(value) for value in values]
+        print('{:<24}{:>14}{:>14}'.format(key, *values))
+
+    if 'agreement' in report:
+        print('Prediction agreement: {:.2f}%'.format(report['agreement']))
+    else:
+        print('Largest output difference: {:.6f}'.format(report['max_abs_difference']))
+
+
+def quantize_model(wrapper, method, calibration_batches=10, backend=None, report=True):
+    """
+    Quantizes the trained network of a wrapper with the given method ('dynamic' or 'static'),
+    calibrating static quantization on the validation loader.
+
+    Static quantization falls back to dynamic quantization when the network cannot be traced
+    into an FX graph, for example for networks fed with packed sequences.
+    Returns the quantized network and, if report is True, the comparison with the float network.
+    """
+
+    if method not in QUANTIZATION_METHODS:
+        raise ValueError('method must be one of ' + ', '.join(QUANTIZATION_METHODS))
+
+    net = wrapper.net
+    if method == 'static':
+        try:
+            quantized_net = static_quantize(net, wrapper.dev_loader, calibration_batches, backend)
+        except Exception as e:
+            print('Static quantization is not supported by this network, using dynamic quantization')
+            print('Here is the exception message:')
+            print(e)
+            method = 'dynamic'
+
+    if method == 'dynamic':
+        quantized_net = dynamic_quantize(net)
+
+    if not report:
+        return quantized_net, None
+
+    classification = getattr(wrapper, 'criterion_input', None) == '1'
+    results = quantization_report(net, quantized_net, wrapper.dev_loader, classification)
+    results['method'] = method
+    print_quantization_report(results)
+    return quantized_net, results
@@ -10,11 +10,19 @@ View the documentation at https://manufacturingnet.readthedocs.io/.
 from math import sqrt
 
 import matplotlib.pyplot as plt
+import numpy as np
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.metrics import (accuracy_score, confusion_matrix, make_scorer,
                              mean_squared_error, roc_auc_score, roc_curve)
-from sklearn.model_selection import (GridSearchCV, cross_val_score,
-                                     train_test_split)
+from sklearn.model_selection import train_test_split
+
+from .bulk_scoring import score_model
+from .incremental import ReplayBuffer, update_forest
+from .persistence import load_wrapper, save_wrapper
+from .search import prompt_search_settings, run_search
+from .shallow_evaluation import PhaseTimer, cross_validate_model
+from .sparse_inputs import is_sliceable
+from .tree_inference import compile_attribute, predictor
 
 
 class RandomForest:
@@ -22,10 +30,15 @@ class RandomForest:
     models.
     """
 
-    def __init__(self, attributes=None, labels=None):
+    def __init__(self, attributes=None, labels=None, cv_n_jobs=None,
+                 estimate_only=False):
         """Initializes a RandomForest object."""
         self.attributes = attributes
         self.labels = labels
+        self.cv_n_jobs = cv_n_jobs
+        self.estimate_only = estimate_only
+        self.cv_estimators = {}
+        self.training_times = {}
 
         self.test_size = None
         self.cv = None
@@ -36,6 +49,17 @@ class RandomForest:
         self.gridsearch = False
         self.gs_params = None
         self.gs_result = None
+        self.search_settings = {}
+        self.fast_evaluation = False
+        self.tree_step = 25
+        self.max_trees = 1000
+        self.oob_tolerance = 0.001
+        self.update_trees = 10
+        self.buffer_size = 10000
+        self.replay_buffers = {}
+        self.update_scores = {}
+        self.compiled_classifier = None
+        self.compiled_regressor = None
 
         self.classifier = None
         self.accuracy = None
@@ -43,6 +67,8 @@ class RandomForest:
         self.confusion_matrix = None
         self.cross_val_scores_classifier = None
         self.feature_importances_classifier = None
+        self.oob_scores_classifier = None
+        self.n_trees_classifier = None
 
         self.regressor = None
         self.r2_score = None
@@ -50,6 +76,8 @@ class RandomForest:
         self.mean_squared_error = None
         self.cross_val_scores_regressor = None
         self.feature_importances_regressor = None
+        self.oob_scores_regressor = None
+        self.n_trees_regressor = None
 
     # Accessor methods
 
@@ -109,6 +137,48 @@ class RandomForest:
         """Accessor method for feature_importances_regressor."""
         return self.feature_importances_regressor
 
+    def get_oob_scores_classifier(self):
+        """Accessor method for oob_scores_classifier."""
+        return self.oob_scores_classifier
+
+    def get_n_trees_classifier(self):
+        """Accessor method for n_trees_classifier."""
+        return self.n_trees_classifier
+
+    def get_oob_scores_regressor(self):
+        """Accessor method for oob_scores_regressor."""
+        return self.oob_scores_regressor
+
+    def get_n_trees_regressor(self):
+        """Accessor method for n_trees_regressor."""
+        return self.n_trees_regressor
+
+    def get_cv_estimators(self):
+        """Accessor method for cv_estimators, the fitted cross validation
+        fold estimators of each model.
+        """
+        return self.cv_estimators
+
+    def get_training_times(self):
+        """Accessor method for training_times, the wall-clock and compute
+        time of each training phase of each model.
+        """
+        return self.training_times
+
+    def get_update_scores(self):
+        """Accessor method for update_scores, the score of each model on
+        each batch of new data before it was updated with it.
+        """
+        return self.update_scores
+
+    def get_compiled_classifier(self):
+        """Accessor method for compiled_classifier."""
+        return self.compiled_classifier
+
+    def get_compiled_regressor(self):
+        """Accessor method for compiled_regressor."""
+        return self.compiled_regressor
+
     # Modifier methods
 
     def set_attributes(self, new_attributes=None):
@@ -119,6 +189,38 @@ class RandomForest:
         """Modifier method for labels."""
         self.labels = new_labels
 
+    def set_cv_n_jobs(self, new_cv_n_jobs=None):
+        """Modifier method for cv_n_jobs, the number of cross validation
+        folds run in parallel.
+        """
+        self.cv_n_jobs = new_cv_n_jobs
+
+    def set_estimate_only(self, new_estimate_only=False):
+        """Modifier method for estimate_only. If True, cross validation is
+        skipped and the holdout score is the only estimate.
+        """
+        self.estimate_only = new_estimate_only
+
+    def set_fast_evaluation(self, new_fast_evaluation=False,
+                            new_tree_step=25, new_max_trees=1000,
+                            new_oob_tolerance=0.001):
+        """Modifier method for fast_evaluation, tree_step, max_trees and
+        oob_tolerance.
+        """
+        self.fast_evaluation = new_fast_evaluation
+        self.tree_step = new_tree_step
+        self.max_trees = new_max_trees
+        self.oob_tolerance = new_oob_tolerance
+
+    def set_update_settings(self, new_update_trees=10,
+                            new_buffer_size=10000):
+        """Modifier method for update_trees, the number of trees added by
+        each update, and buffer_size, the number of past datapoints they
+        are trained on along with the new data.
+        """
+        self.update_trees = new_update_trees
+        self.buffer_size = new_buffer_size
+
     # Wrappers for RandomForest classes
 
     def run_classifier(self):
@@ -126,6 +228,7 @@ class RandomForest:
         if self._check_inputs():
             # Initialize classifier
             self.classifier = self._create_model(classifier=True)
+            self.compiled_classifier = None
 
             # Split attributes and labels into training/testing data
             dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test = \
@@ -134,8 +237,11 @@ class RandomForest:
 
             # Train classifier
             # Handle exception if arguments are incorrect
+            timer = PhaseTimer()
             try:
-                self.classifier.fit(dataset_X_train, dataset_y_train)
+                self.oob_scores_classifier, self.n_trees_classifier = \
+                    self._fit(self.classifier, dataset_X_train,
+                              dataset_y_train)
             except Exception as e:
                 print("An exception occurred while training the",
                       "classification model. Check your arguments and try",
@@ -145,6 +251,8 @@ class RandomForest:
                 self.classifier = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             self.accuracy = self.classifier.score(dataset_X_test,
                                                   dataset_y_test)
@@ -164,9 +272,12 @@ class RandomForest:
                 self.confusion_matrix = confusion_matrix(dataset_y_test,
                                                          y_prediction)
 
-            self.cross_val_scores_classifier = \
-                cross_val_score(self.classifier, self.attributes, self.labels,
-                                cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = self._cross_validate(self.classifier, timer)
+            self.cross_val_scores_classifier = scores
+            self.cv_estimators["RandomForestClassifier"] = estimators
+            self.training_times["RandomForestClassifier"] = timer.get_times()
+            timer.print_times()
             self.feature_importances_classifier = \
                 self.classifier.feature_importances_
 
@@ -178,6 +289,7 @@ class RandomForest:
         if self._check_inputs():
             # Initialize regressor
             self.regressor = self._create_model(classifier=False)
+            self.compiled_regressor = None
 
             # Split attributes and labels into training/testing data
             dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test =\
@@ -187,8 +299,10 @@ class RandomForest:
             # Train regressor
             # Handle exception if arguments are incorrect and/or labels
             # isn't quantitative
+            timer = PhaseTimer()
             try:
-                self.regressor.fit(dataset_X_train, dataset_y_train)
+                self.oob_scores_regressor, self.n_trees_regressor = \
+                    self._fit(self.regressor, dataset_X_train, dataset_y_train)
             except Exception as e:
                 print("An exception occurred while training the regressor",
                       "model. Check your arguments and try again.")
@@ -198,6 +312,8 @@ class RandomForest:
                 self.regressor = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             self.r2_score = self.regressor.score(
                 dataset_X_test, dataset_y_test)
@@ -207,9 +323,12 @@ class RandomForest:
             self.mean_squared_error = \
                 mean_squared_error(dataset_y_test,
                                    self.regressor.predict(dataset_X_test))
-            self.cross_val_scores_regressor = \
-                cross_val_score(self.regressor, self.attributes, self.labels,
-                                cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = self._cross_validate(self.regressor, timer)
+            self.cross_val_scores_regressor = scores
+            self.cv_estimators["RandomForestRegressor"] = estimators
+            self.training_times["RandomForestRegressor"] = timer.get_times()
+            timer.print_times()
             self.feature_importances_regressor = \
                 self.regressor.feature_importances_
 
@@ -229,7 +348,7 @@ class RandomForest:
         # Try to make the prediction
         # Handle exception if dataset_X isn't a valid input
         try:
-            y_prediction = self.classifier.predict(dataset_X)
+            y_prediction = predictor(self, "classifier").predict(dataset_X)
         except Exception as e:
             print("The model failed to run. Check your inputs and try again.")
             print("Here is the exception message:")
@@ -252,7 +371,7 @@ class RandomForest:
         # Try to make the prediction
         # Handle exception if dataset_X isn't a valid input
         try:
-            y_prediction = self.regressor.predict(dataset_X)
+            y_prediction = predictor(self, "regressor").predict(dataset_X)
         except Exception as e:
             print("The model failed to run. Check your inputs and try again.")
             print("Here is the exception message:")
@@ -262,8 +381,199 @@ class RandomForest:
         print("\nRandomForestRegressor Predictions:\n", y_prediction, "\n")
         return y_prediction
 
+    # Wrapper for bulk scoring
+
+    def predict_bulk(self, dataset_X=None, model="classifier", output=None,
+                     method="predict", chunk_size=10000, n_threads=1):
+        """Predicts each datapoint in dataset_X using the given model,
+        "classifier" or "regressor", and its method, "predict" or
+        "predict_proba", on n_threads threads, chunk_size rows at a time,
+        without displaying them. dataset_X can be an array, a sparse matrix,
+        the filename of a .npy file, or a callable returning an iterator over
+        chunks. The predictions are written to output, an array or a .npy or
+        CSV filename, if given. Returns the predictions, or the CSV filename.
+        """
+        if model not in ("classifier", "regressor"):
+            print("model must be \"classifier\" or \"regressor\".")
+            return None
+
+        # Check that the runner method has already been called
+        if getattr(self, model) is None:
+            print("The", model, "model seems to be missing.",
+                  "Have you called run_" + model + "() yet?")
+            return None
+
+        # Try to score dataset_X, with the compiled model if there is one
+        # Handle exception if dataset_X or output aren't valid
+        try:
+            return score_model(predictor(self, model),
+                               "RandomForest" + model.title(),
+                               dataset_X, output, method, chunk_size,
+                               n_threads)
+        except Exception as e:
+            print("The model failed to run. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+    # Wrappers for compiled inference
+
+    def compile_classifier(self):
+        """Compiles the classifier model into flat NumPy node arrays, which
+        predict_classifier() then uses. Returns the compiled model.
+        """
+        return compile_attribute(self, "classifier", "run_classifier")
+
+    def compile_regressor(self):
+        """Compiles the regressor model into flat NumPy node arrays, which
+        predict_regressor() then uses. Returns the compiled model.
+        """
+        return compile_attribute(self, "regressor", "run_regressor")
+
+    # Wrappers for incremental learning
+
+    def update_classifier(self, X_new=None, y_new=None):
+        """Updates the classifier model with a batch of new labeled data
+        without retraining it from scratch. Returns its accuracy on the new
+        data before the update.
+        """
+        return self._update("classifier", "RandomForestClassifier",
+                            "run_classifier", X_new, y_new)
+
+    def update_regressor(self, X_new=None, y_new=None):
+        """Updates the regressor model with a batch of new labeled data
+        without retraining it from scratch. Returns its R2 score on the new
+        data before the update.
+        """
+        return self._update("regressor", "RandomForestRegressor",
+                            "run_regressor", X_new, y_new)
+
+    # Persistence
+
+    def save(self, path):
+        """Writes the fitted classifier and regressor, and their compiled
+        forms, to the directory path, without the dataset, its splits or the
+        results. Returns path.
+        """
+        return save_wrapper(self, path, ("classifier", "regressor"),
+                            "run_classifier() or run_regressor()")
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Returns a RandomForest holding the models saved in the directory
+        path with save(). Each model is read from disk the first time it is
+        used, with its arrays memory-mapped.
+        """
+        return load_wrapper(cls, path, mmap_mode)
+
     # Helper methods
 
+    def _update(self, attribute, name, run, X_new, y_new):
+        """Adds update_trees trees, trained on the new data and a replay
+        buffer of past data, to the model stored in attribute. The forest
+        keeps its newest max_trees trees. Returns the model's score on the
+        new data before the update.
+        """
+        # Check that the runner method has already been called
+        model = getattr(self, attribute)
+        if model is None:
+            print("The", attribute, "model seems to be missing.",
+                  "Have you called " + run + "() yet?")
+            return None
+
+        # The buffer starts with a sample of the training dataset
+        if name not in self.replay_buffers:
+            self.replay_buffers[name] = ReplayBuffer(self.buffer_size)
+            self.replay_buffers[name].add(self.attributes, self.labels)
+
+        # Try to update the model
+        # Handle exception if X_new or y_new aren't valid inputs
+        try:
+            score = model.score(X_new, np.ravel(y_new))
+            update_forest(model, self.replay_buffers[name], X_new, y_new,
+                          n_trees=self.update_trees,
+                          max_trees=self.max_trees)
+        except Exception as e:
+            print("The", attribute, "model failed to update.",
+                  "Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+        self.update_scores.setdefault(name, []).append(score)
+        # The compiled model no longer matches the updated one
+        setattr(self, "compiled_" + attribute, None)
+        setattr(self, "feature_importances_" + attribute,
+                model.feature_importances_)
+
+        print("\n" + name, "score on the new data before the update:", score,
+              "\n")
+        return score
+
+    def _cross_validate(self, model, timer):
+        """Cross validates model with the shared evaluation engine.
+        Returns the fold scores and the fitted fold estimators.
+
+        In fast evaluation mode, the out-of-bag score replaces cross
+        validation and (None, None) is returned.
+        """
+        return cross_validate_model(model, self.attributes, self.labels,
+                                    cv=self.cv, n_jobs=self.cv_n_jobs,
+                                    estimate_only=self.estimate_only
+                                    or self.fast_evaluation,
+                                    timer=timer)
+
+    def _fit(self, model, dataset_X, dataset_y):
+        """Fits model. In fast evaluation mode, the forest is grown
+        tree_step trees at a time on all cores until its out-of-bag score
+        improves by less than oob_tolerance twice in a row, or it has
+        max_trees trees.
+
+        Returns the (number of trees, OOB score) pairs of the growth and
+        the number of trees after which adding more stopped paying off,
+        or (None, None) outside fast evaluation mode.
+        """
+        if not self.fast_evaluation:
+            model.fit(dataset_X, dataset_y)
+            return None, None
+
+        model.set_params(n_jobs=-1, bootstrap=True, oob_score=True,
+                         warm_start=True, n_estimators=0)
+        dataset_y = np.ravel(dataset_y)
+
+        oob_scores = []
+        n_trees = None
+        stalled = 0
+        while model.get_params()["n_estimators"] < self.max_trees:
+            model.set_params(n_estimators=min(
+                model.get_params()["n_estimators"] + self.tree_step,
+                self.max_trees))
+            model.fit(dataset_X, dataset_y)
+            oob_scores.append((model.get_params()["n_estimators"],
+                               model.oob_score_))
+
+            if len(oob_scores) > 1 and \
+                    oob_scores[-1][1] - oob_scores[-2][1] < self.oob_tolerance:
+                stalled += 1
+                if stalled == 2:
+                    break
+            else:
+                stalled = 0
+                n_trees = oob_scores[-1][0]
+
+        # Later calls to fit() should train a new forest
+        model.set_params(warm_start=False)
+
+        print("\n{:<20} {:<20}".format("Trees", "OOB Score"))
+        for trees, score in oob_scores:
+            print("{:<20} {:<20.4f}".format(trees, score))
+        if len(oob_scores) > 1 and stalled == 2:
+            print("\nThe OOB score plateaued after", n_trees, "trees.")
+        else:
+            print("\nThe OOB score was still improving at", oob_scores[-1][0],
+                  "trees; increase max_trees to grow the forest further.")
+        return oob_scores, n_trees
+
     def _create_model(self, classifier):
         """Runs UI for getting parameters and creating classifier or
         regression model.
@@ -277,6 +587,8 @@ class RandomForest:
             print("= RandomForestRegressor Parameter Inputs =")
             print("==========================================\n")
 
+        self._get_fast_evaluation()
+
         print("Default values:", "test_size = 0.25", "cv = 5", sep="\n")
         if classifier:
             print("graph_results = False", "criterion = 'gini'",
@@ -560,6 +872,8 @@ class RandomForest:
                 params["max_depth"] = max_dep_params
                 print("max_depths:", max_dep_params)
 
+                self.search_settings = prompt_search_settings()
+
                 print("\n= End of GridSearch inputs. =\n")
                 self.gs_params = params
                 best_params = self._run_gridsearch(classifier)
@@ -1099,6 +1413,85 @@ class RandomForest:
                                      ccp_alpha=ccp_alpha,
                                      max_samples=max_samples)
 
+    def _get_fast_evaluation(self):
+        """Prompts for fast evaluation mode and its growth settings."""
+        while True:
+            user_input = input("Use fast evaluation: all CPU cores, OOB "
+                               + "scoring instead of CV, and growing the "
+                               + "forest until the OOB score plateaus "
+                               + "(y/N)? ").lower()
+            if user_input == "y":
+                self.fast_evaluation = True
+                break
+            elif user_input in {"n", ""}:
+                self.fast_evaluation = False
+                break
+            else:
+                print("Invalid input.")
+
+        print("fast_evaluation =", self.fast_evaluation)
+
+        if not self.fast_evaluation:
+            print()
+            return
+
+        while True:
+            user_input = input("\nEnter the number of trees added per step "
+                               + "(default=25): ")
+            try:
+                if user_input == "":
+                    self.tree_step = 25
+                    break
+
+                user_input = int(user_input)
+                if user_input <= 0:
+                    raise Exception
+                else:
+                    self.tree_step = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("tree_step =", self.tree_step)
+
+        while True:
+            user_input = input("\nEnter the maximum number of trees "
+                               + "(default=1000): ")
+            try:
+                if user_input == "":
+                    self.max_trees = 1000
+                    break
+
+                user_input = int(user_input)
+                if user_input < self.tree_step:
+                    raise Exception
+                else:
+                    self.max_trees = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("max_trees =", self.max_trees)
+
+        while True:
+            user_input = input("\nEnter the smallest OOB score gain per step "
+                               + "worth growing for (default=0.001): ")
+            try:
+                if user_input == "":
+                    self.oob_tolerance = 0.001
+                    break
+
+                user_input = float(user_input)
+                if user_input < 0:
+                    raise Exception
+                else:
+                    self.oob_tolerance = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("oob_tolerance =", self.oob_tolerance, "\n")
+
     def _output_classifier_results(self):
         """Outputs model metrics after run_classifier() finishes."""
         print("\n==================================")
@@ -1113,7 +1506,14 @@ class RandomForest:
         else:
             print("\nConfusion Matrix:\n", self.confusion_matrix)
 
-        print("\nCross Validation Scores:", self.cross_val_scores_classifier)
+        if self.fast_evaluation:
+            print("\n{:<20} {:<20}".format("OOB Score:",
+                                           self.classifier.oob_score_))
+            print("\n{:<20} {:<20}".format("Plateau Trees:",
+                                           str(self.n_trees_classifier)))
+        else:
+            print("\nCross Validation Scores:",
+                  self.cross_val_scores_classifier)
         print("\nFeature Importances:", self.feature_importances_classifier)
 
         if self.gridsearch:
@@ -1144,7 +1544,14 @@ class RandomForest:
                                      self.mean_squared_error))
         print("\n{:<20} {:<20}".format("R2 Score:", self.r2_score))
         print("\n{:<20} {:<20}".format("R Score:", str(self.r_score)))
-        print("\nCross Validation Scores:", self.cross_val_scores_regressor)
+        if self.fast_evaluation:
+            print("\n{:<20} {:<20}".format("OOB Score:",
+                                           self.regressor.oob_score_))
+            print("\n{:<20} {:<20}".format("Plateau Trees:",
+                                           str(self.n_trees_regressor)))
+        else:
+            print("\nCross Validation Scores:",
+                  self.cross_val_scores_regressor)
         print("\nFeature Importances:", self.feature_importances_regressor)
 
         if self.gridsearch:
@@ -1167,12 +1574,13 @@ class RandomForest:
             acc_scorer = make_scorer(accuracy_score)
             clf = RandomForestClassifier()
 
-            # Run GridSearch
-            grid_obj = GridSearchCV(clf, self.gs_params, scoring=acc_scorer)
-            grid_obj = grid_obj.fit(dataset_X_train, dataset_y_train)
+            # Run the hyperparameter search
+            best_params = run_search(clf, self.gs_params, dataset_X_train,
+                                     dataset_y_train, scoring=acc_scorer,
+                                     **self.search_settings)
 
             # Set the clf to the best combination of parameters
-            clf = grid_obj.best_estimator_
+            clf.set_params(**best_params)
 
             # Fit the best algorithm to the data
             clf.fit(dataset_X_train, dataset_y_train)
@@ -1181,12 +1589,13 @@ class RandomForest:
         else:
             clf = RandomForestRegressor()
 
-            # Run GridSearch
-            grid_obj = GridSearchCV(clf, self.gs_params, scoring="r2")
-            grid_obj = grid_obj.fit(dataset_X_train, dataset_y_train)
+            # Run the hyperparameter search
+            best_params = run_search(clf, self.gs_params, dataset_X_train,
+                                     dataset_y_train, scoring="r2",
+                                     **self.search_settings)
 
             # Set the clf to the best combination of parameters
-            clf = grid_obj.best_estimator_
+            clf.set_params(**best_params)
 
             # Fit the best algorithm to the data
             clf.fit(dataset_X_train, dataset_y_train)
@@ -1194,8 +1603,8 @@ class RandomForest:
             self.gs_result = clf.score(dataset_X_test, dataset_y_test)
 
         # Return the best parameters
-        print("\nBest GridSearch Parameters:\n", grid_obj.best_params_, "\n")
-        return grid_obj.best_params_
+        print("\nBest GridSearch Parameters:\n", best_params, "\n")
+        return best_params
 
     def _check_inputs(self):
         """Verifies if instance data is ready for use in RandomForest
@@ -1215,6 +1624,13 @@ class RandomForest:
                   "classification) or dependent variables (for regression).")
             return False
 
+        # Splitting needs sparse attributes in a row-sliceable format
+        if not is_sliceable(self.attributes):
+            print("attributes is a sparse matrix that can't be sliced by",
+                  "rows; call set_attributes(new_attributes.tocsr()) to",
+                  "fix this!")
+            return False
+
         # Check if attributes and labels have same number of rows (samples)
         if self.attributes.shape[0] != self.labels.shape[0]:
             print("attributes and labels don't have the same number of rows.",
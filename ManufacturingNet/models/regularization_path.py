@@ -0,0 +1,162 @@
+"""regularization_path tunes the regularization parameter C of linear
+models along a warm-started regularization path.
+
+Instead of solving every C value of a GridSearch from scratch, the C
+values are sorted from the strongest to the weakest regularization and
+each fit starts from the coefficients of the previous one, which is
+usually close to the next solution. The solver of LogisticRegression,
+and the formulation of LinearSVC, are chosen automatically from the
+number of datapoints and features and the sparsity of the data.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.sparse import issparse
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid, check_cv
+from sklearn.utils import _safe_indexing
+
+# Above this many datapoints, the stochastic average gradient solver
+# outpaces the batch solvers
+LARGE_DATASET = 10000
+# Below this fraction of nonzero entries, a sparse dataset favors saga
+SPARSE_DENSITY = 0.1
+
+
+def select_solver(X, penalty="l2"):
+    """Returns the LogisticRegression solver suited to X and penalty.
+
+    saga is used for elasticnet, for large datasets and for very sparse
+    ones, liblinear for small datasets with the l1 penalty, and lbfgs
+    otherwise. liblinear can't be warm-started, so it is only chosen
+    where no other solver supports the penalty as well.
+    """
+    n_samples, n_features = X.shape
+    sparse = issparse(X) and X.nnz / max(n_samples * n_features, 1) \
+        < SPARSE_DENSITY
+
+    if penalty == "elasticnet":
+        return "saga"
+    if penalty == "l1":
+        return "saga" if n_samples > LARGE_DATASET or sparse \
+            else "liblinear"
+    if n_samples > LARGE_DATASET or sparse:
+        return "saga"
+    return "lbfgs"
+
+
+def select_dual(X, penalty="l2", loss="squared_hinge"):
+    """Returns the LinearSVC formulation suited to X: the dual problem
+    when there are more features than datapoints, the primal otherwise.
+    """
+    if penalty == "l1":
+        return False
+    if loss == "hinge":
+        return True
+    n_samples, n_features = X.shape
+    return n_samples <= n_features
+
+
+def resolve_auto(param_grid, X):
+    """Returns param_grid as a list of grids in which solver='auto' and
+    dual='auto' are replaced by select_solver() and select_dual(). A grid
+    without 'auto' values is returned unchanged.
+    """
+    grids = [param_grid] if isinstance(param_grid, dict) else param_grid
+    if not any("auto" in grid.get(key, ()) for grid in grids
+               for key in ("solver", "dual")):
+        return param_grid
+
+    resolved = []
+    for grid in grids:
+        for params in ParameterGrid({key: value for key, value in grid.items()
+                                     if key != "C"}):
+            params = dict(params)
+            if params.get("solver") == "auto":
+                params["solver"] = select_solver(X,
+                                                 params.get("penalty", "l2"))
+            if params.get("dual") == "auto":
+                params["dual"] = select_dual(X, params.get("penalty", "l2"),
+                                             params.get("loss",
+                                                        "squared_hinge"))
+
+            params = {key: [value] for key, value in params.items()}
+            if "C" in grid:
+                params["C"] = list(grid["C"])
+            if params not in resolved:
+                resolved.append(params)
+    return resolved
+
+
+def _fit_path(estimator, params, C_values, X, y, train, test, scorer):
+    """Fits estimator with params along C_values on the train rows,
+    warm-starting each fit from the previous one when the estimator
+    supports it. Returns the test score of every C value; failed fits
+    score NaN, as in GridSearchCV.
+    """
+    X_train, y_train = _safe_indexing(X, train), y[train]
+    X_test, y_test = _safe_indexing(X, test), y[test]
+
+    model = clone(estimator).set_params(**params)
+    if "warm_start" in model.get_params():
+        model.set_params(warm_start=True)
+
+    scores = []
+    for C in C_values:
+        try:
+            model.set_params(C=C).fit(X_train, y_train)
+            scores.append(scorer(model, X_test, y_test))
+        except Exception:
+            # Restart the path from scratch after a failed fit
+            model = clone(model)
+            scores.append(np.nan)
+    return scores
+
+
+def path_search(estimator, param_grid, X, y, scoring=None, cv=5, n_jobs=-1):
+    """Exhaustive GridSearch of a linear model in which the C values are
+    fitted along a warm-started regularization path. Returns the best
+    parameters, with any solver='auto' or dual='auto' resolved.
+
+    param_grid must list the C values to try; every combination of the
+    other parameters and every cross validation fold is one path, and the
+    paths are run in n_jobs parallel jobs.
+    """
+    y = np.ravel(y)
+    folds = list(check_cv(cv, y, classifier=is_classifier(estimator))
+                 .split(np.zeros((len(y), 1)), y))
+    scorer = check_scoring(estimator, scoring)
+
+    grids = resolve_auto(param_grid, X)
+    if isinstance(grids, dict):
+        grids = [grids]
+
+    paths = []
+    for grid in grids:
+        grid = dict(grid)
+        # Small C is strong regularization; its solution is the simplest
+        C_values = sorted(grid.pop("C"))
+        for params in ParameterGrid(grid):
+            paths.append((params, C_values))
+
+    fold_scores = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_path)(estimator, params, C_values, X, y, train, test,
+                           scorer)
+        for params, C_values in paths for train, test in folds)
+
+    candidates, scores = [], []
+    for i, (params, C_values) in enumerate(paths):
+        path_scores = np.mean(fold_scores[i * len(folds):
+                                          (i + 1) * len(folds)], axis=0)
+        for C, score in zip(C_values, path_scores):
+            candidates.append(dict(params, C=C))
+            scores.append(score)
+
+    print("Fitted", len(paths) * len(folds), "regularization paths over",
+          len(candidates), "candidates.")
+
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    return candidates[int(np.argmax(scores))]
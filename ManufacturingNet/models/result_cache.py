@@ -0,0 +1,223 @@
+"""result_cache memoizes the results of AllClassificationModels and
+AllRegressionModels on disk.
+
+Every model's results are stored under a key hashing the attributes,
+the labels, the model's parameters, the test size, the split seed, the
+runner mode and the versions of the libraries, so a run on the same
+data only fits the models whose inputs changed. The fitted estimators
+are stored next to their results. Entries created more than
+max_age_days ago are removed, however often they are used, and then the
+least recently used ones, until the cache is smaller than max_size_mb.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+import sklearn
+from scipy import sparse
+
+try:
+    import xgboost as xgb
+except ImportError:         # only needed for XGBoost models
+    xgb = None
+
+# Parameters that change what a model prints or how many cores it uses,
+# but not its results
+IGNORED_PARAMETERS = ("verbose", "verbosity", "n_jobs", "nthread")
+
+# Number of bytes hashed at a time
+_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def library_versions():
+    """Returns the versions of Python and of the libraries the results
+    depend on.
+    """
+    versions = {"python": sys.version.split()[0], "numpy": np.__version__,
+                "scikit-learn": sklearn.__version__}
+    if xgb is not None:
+        versions["xgboost"] = xgb.__version__
+    return versions
+
+
+def _update(hasher, X):
+    """Adds a dense array to hasher, a block of rows at a time so that
+    memory-mapped arrays aren't read into memory at once.
+    """
+    X = np.asarray(X)
+    hasher.update(repr((X.shape, X.dtype.str)).encode())
+    if X.dtype.hasobject:
+        hasher.update(repr(X.tolist()).encode())
+        return
+    if X.ndim == 0 or X.size == 0:
+        hasher.update(X.tobytes())
+        return
+
+    rows = max(_BLOCK_BYTES // max(X[0].nbytes, 1), 1)
+    for start in range(0, X.shape[0], rows):
+        hasher.update(np.ascontiguousarray(X[start:start + rows]).data)
+
+
+def fingerprint(X):
+    """Returns a hash of the contents of an array or sparse matrix."""
+    hasher = hashlib.blake2b(digest_size=16)
+    if sparse.issparse(X):
+        hasher.update(X.format.encode())
+        hasher.update(repr(X.shape).encode())
+        X = X.tocsr() if X.format not in ("csr", "csc") else X
+        for part in (X.data, X.indices, X.indptr):
+            _update(hasher, part)
+    else:
+        _update(hasher, X)
+    return hasher.hexdigest()
+
+
+def model_config(estimator):
+    """Returns the parameters of estimator that affect its results, as a
+    string.
+    """
+    params = estimator.get_params()
+    return repr(sorted((name, repr(value)) for name, value in params.items()
+                       if name not in IGNORED_PARAMETERS))
+
+
+class ResultCache:
+    """Directory of cached model results, each stored as a JSON file
+    with the fitted estimator in a joblib file next to it.
+    """
+
+    def __init__(self, directory, max_size_mb=1024, max_age_days=30):
+        """Initializes a ResultCache in directory, creating it if
+        needed.
+        """
+        if max_size_mb is not None and max_size_mb < 0:
+            raise ValueError("max_size_mb must be positive or None.")
+        if max_age_days is not None and max_age_days < 0:
+            raise ValueError("max_age_days must be positive or None.")
+
+        self.directory = directory
+        self.max_size_mb = max_size_mb
+        self.max_age_days = max_age_days
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, data_key, name, estimator, **settings):
+        """Returns the key of a model's results: a hash of data_key, the
+        fingerprint of the attributes and labels, the model's name and
+        parameters, the runner settings, and the library versions.
+        """
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(json.dumps(
+            [data_key, name, model_config(estimator), sorted(
+                (setting, repr(value)) for setting, value in
+                settings.items()), library_versions()]).encode())
+        return hasher.hexdigest()
+
+    def get(self, key):
+        """Returns the results and fitted estimator stored under key, or
+        None if there are none.
+        """
+        filename = os.path.join(self.directory, key + ".json")
+        try:
+            with open(filename) as file:
+                entry = json.load(file)
+            estimator = joblib.load(os.path.join(self.directory,
+                                                 key + ".joblib"))
+        except (OSError, ValueError, EOFError):
+            return None
+
+        # Mark the entry as recently used
+        os.utime(filename)
+        return entry["results"], estimator
+
+    def put(self, key, name, results, estimator):
+        """Stores the results, a dict of lists of numbers, and the fitted
+        estimator of a model under key.
+        """
+        results = {table: [None if value is None else float(value)
+                           for value in row]
+                   for table, row in results.items()}
+        path = os.path.join(self.directory, key)
+
+        # Write to temporary files first, so that runs sharing the cache
+        # never read a partial entry
+        joblib.dump(estimator, path + ".joblib.tmp")
+        with open(path + ".json.tmp", "w") as file:
+            json.dump({"model": name, "results": results,
+                       "created": time.time()}, file)
+        os.replace(path + ".joblib.tmp", path + ".joblib")
+        os.replace(path + ".json.tmp", path + ".json")
+
+    def entries(self):
+        """Returns (key, creation time, last used time, size in bytes) for
+        every entry, least recently used first.
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            key = filename[:-len(".json")]
+            path = os.path.join(self.directory, filename)
+            try:
+                used = os.path.getmtime(path)
+                size = sum(os.path.getsize(os.path.join(self.directory,
+                                                        key + extension))
+                           for extension in (".json", ".joblib"))
+                with open(path) as file:
+                    created = json.load(file).get("created", used)
+            except (OSError, ValueError):
+                continue
+            entries.append((key, created, used, size))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        """Returns the size of the cache in bytes."""
+        return sum(entry[3] for entry in self.entries())
+
+    def remove(self, key):
+        """Removes the entry stored under key."""
+        for extension in (".json", ".joblib"):
+            try:
+                os.remove(os.path.join(self.directory, key + extension))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Removes the entries created more than max_age_days ago, then
+        the least recently used ones until the cache is smaller than
+        max_size_mb. Returns the number of entries removed.
+        """
+        entries = self.entries()
+        removed = 0
+
+        if self.max_age_days is not None:
+            # Age counts from creation, since get() refreshes the last
+            # used time of stale entries that keep being hit
+            oldest = time.time() - self.max_age_days * 24 * 60 * 60
+            for key, created, _, _ in entries:
+                if created < oldest:
+                    self.remove(key)
+                    removed += 1
+            entries = [entry for entry in entries if entry[1] >= oldest]
+
+        if self.max_size_mb is not None:
+            total = sum(entry[3] for entry in entries)
+            for key, _, _, size in entries:
+                if total <= self.max_size_mb * 1024 * 1024:
+                    break
+                self.remove(key)
+                total -= size
+                removed += 1
+
+        return removed
+
+    def clear(self):
+        """Removes every entry."""
+        for key, _, _, _ in self.entries():
+            self.remove(key)
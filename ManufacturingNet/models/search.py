@@ -0,0 +1,379 @@
+"""search runs the hyperparameter searches of the shallow learning
+wrappers. Besides the exhaustive GridSearch, it supports successive
+halving over the grid or over a random sample of it, a randomized search
+with a fixed budget of candidates, and a Bayesian search when
+scikit-optimize is installed.
+
+The cross validation folds are computed once and shared by every
+candidate and every halving round, and the candidates are fitted in
+parallel worker processes. The scores of finished candidates can be
+saved to a checkpoint file, so that an interrupted search resumes where
+it stopped instead of starting over.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid, ParameterSampler, check_cv
+from sklearn.utils import _safe_indexing
+
+try:
+    from skopt import Optimizer
+    from skopt.space import Categorical
+except ImportError:         # Bayesian search is optional
+    Optimizer = None
+
+from .result_cache import fingerprint
+
+SEARCH_STRATEGIES = ("grid", "halving_grid", "halving_random", "random",
+                     "bayesian")
+
+
+class SearchCheckpoint:
+    """Mean cross validation scores of the evaluated candidates, saved to
+    a JSON file so that an interrupted search can resume.
+
+    Scores are only reused by a search of the same estimator class with
+    the same scoring, strategy and number of folds on the same data;
+    otherwise the search starts over.
+    """
+
+    def __init__(self, filename=None, signature=None):
+        """Loads the scores saved in filename, if any."""
+        self.filename = filename
+        self.signature = signature
+        self.scores = {}
+
+        if filename is None or not os.path.exists(filename):
+            return
+
+        with open(filename) as f:
+            saved = json.load(f)
+
+        if saved.get("signature") == signature:
+            self.scores = saved["scores"]
+            print("Resuming search with", len(self.scores),
+                  "evaluated candidates from", filename)
+        else:
+            print("Checkpoint", filename, "was saved for a different",
+                  "dataset or search; starting the search over.")
+
+    def get(self, key):
+        """Returns the saved score of key, or None."""
+        return self.scores.get(key)
+
+    def add(self, key, score):
+        """Records the score of key."""
+        self.scores[key] = score
+
+    def save(self):
+        """Writes the scores to the checkpoint file, if there is one."""
+        if self.filename is None:
+            return
+
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w") as f:
+            json.dump({"signature": self.signature, "scores": self.scores}, f)
+        os.replace(temp_filename, self.filename)
+
+
+def _signature(estimator, X, y, scoring, n_folds, strategy, random_state):
+    """Returns what a checkpoint's scores depend on besides the
+    candidates: the estimator class, the scoring, a fingerprint of the
+    data, the number of folds, the strategy and the random state.
+    """
+    estimator = type(estimator).__module__ + "." + \
+        type(estimator).__qualname__
+    # Functions are named, since their repr holds their memory address
+    scoring = getattr(scoring, "__qualname__", None) or repr(scoring)
+    return {"estimator": estimator, "scoring": scoring,
+            "shape": list(np.shape(X)),
+            "data": fingerprint(X) + fingerprint(y), "folds": n_folds,
+            "strategy": strategy, "random_state": random_state}
+
+
+def _candidate_key(params, n_samples):
+    """Returns the checkpoint key of a candidate evaluated on n_samples
+    datapoints.
+    """
+    return json.dumps([n_samples, params], sort_keys=True, default=str)
+
+
+def _fit_and_score(estimator, params, X, y, train, test, scorer):
+    """Fits a copy of estimator with params on the train rows and scores
+    it on the test rows. Failed fits score NaN, as in GridSearchCV.
+    """
+    estimator = clone(estimator).set_params(**params)
+    try:
+        estimator.fit(_safe_indexing(X, train), y[train])
+        return scorer(estimator, _safe_indexing(X, test), y[test])
+    except Exception:
+        return np.nan
+
+
+class _Evaluator:
+    """Scores candidates on the shared folds, in parallel, reusing the
+    scores saved in the checkpoint.
+    """
+
+    def __init__(self, estimator, X, y, folds, scorer, parallel, checkpoint,
+                 random_state):
+        """Initializes an _Evaluator object."""
+        self.estimator = estimator
+        self.X = X
+        self.y = y
+        self.folds = folds
+        self.scorer = scorer
+        self.parallel = parallel
+        self.checkpoint = checkpoint
+        self.batch_size = max(effective_n_jobs(parallel.n_jobs), 1)
+        # Halving rounds train on growing prefixes of one permutation
+        self.order = np.random.RandomState(random_state).permutation(len(y))
+        self.results = []
+
+    def _subsample(self, n_samples):
+        """Returns the folds restricted to the first n_samples
+        datapoints of the permutation.
+        """
+        if n_samples >= len(self.y):
+            return self.folds
+
+        allowed = np.zeros(len(self.y), dtype=bool)
+        allowed[self.order[:n_samples]] = True
+        return [(train[allowed[train]], test[allowed[test]])
+                for train, test in self.folds]
+
+    def evaluate(self, candidates, n_samples=None):
+        """Returns the mean fold score of each candidate, trained on
+        n_samples datapoints (all of them by default).
+        """
+        n_samples = n_samples or len(self.y)
+        folds = self._subsample(n_samples)
+        keys = [_candidate_key(params, n_samples) for params in candidates]
+
+        missing = [i for i, key in enumerate(keys)
+                   if self.checkpoint.get(key) is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            scores = self.parallel(
+                delayed(_fit_and_score)(self.estimator, candidates[i], self.X,
+                                        self.y, train, test, self.scorer)
+                for i in batch for train, test in folds)
+            scores = np.reshape(scores, (len(batch), len(folds)))
+
+            for i, fold_scores in zip(batch, scores):
+                # NaN isn't valid JSON; a failed candidate is saved as "nan"
+                mean = float(np.mean(fold_scores))
+                self.checkpoint.add(keys[i], "nan" if np.isnan(mean) else mean)
+            self.checkpoint.save()
+
+        means = [float(self.checkpoint.get(key)) for key in keys]
+        self.results.extend({"params": params, "n_samples": n_samples,
+                             "mean_test_score": mean}
+                            for params, mean in zip(candidates, means))
+        return means
+
+
+def _best(candidates, scores):
+    """Returns the candidates sorted from best to worst score."""
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    return [candidates[i] for i in np.argsort(-scores, kind="stable")]
+
+
+def _halving(evaluator, candidates, n_samples, min_samples, factor):
+    """Successive halving: evaluates all candidates on few datapoints and
+    keeps the best 1/factor of them for the next round, which uses factor
+    times as many datapoints. The last round uses all n_samples.
+    """
+    n_rounds = 1
+    while factor ** (n_rounds - 1) < len(candidates):
+        n_rounds += 1
+    while n_rounds > 1 and n_samples // factor ** (n_rounds - 1) < min_samples:
+        n_rounds -= 1
+
+    for round_ in range(n_rounds):
+        resources = n_samples // factor ** (n_rounds - 1 - round_)
+        scores = evaluator.evaluate(candidates, resources)
+        print("Halving round {}: {} candidates on {} datapoints".format(
+            round_ + 1, len(candidates), resources))
+
+        if round_ < n_rounds - 1:
+            candidates = _best(candidates, scores)[
+                :max(math.ceil(len(candidates) / factor), 1)]
+
+    return candidates, scores
+
+
+def _bayesian(evaluator, param_grid, n_iter, random_state):
+    """Bayesian search over the values of param_grid with a Gaussian
+    process surrogate, proposing batch_size candidates at a time.
+    """
+    names = sorted(param_grid)
+    dimensions = [Categorical(list(range(len(param_grid[name]))))
+                  for name in names]
+    optimizer = Optimizer(dimensions, random_state=random_state,
+                          n_initial_points=min(10, n_iter))
+
+    candidates, scores = [], []
+    while len(candidates) < n_iter:
+        n_points = min(evaluator.batch_size, n_iter - len(candidates))
+        points = optimizer.ask(n_points=n_points)
+        batch = [{name: param_grid[name][index]
+                  for name, index in zip(names, point)} for point in points]
+
+        # With the same random_state, the proposals of a resumed search
+        # repeat and their scores are read from the checkpoint
+        batch_scores = evaluator.evaluate(batch)
+        optimizer.tell(points, [-score if np.isfinite(score) else 1e10
+                                for score in batch_scores])
+        candidates.extend(batch)
+        scores.extend(batch_scores)
+
+    return candidates, scores
+
+
+def run_search(estimator, param_grid, X, y, scoring=None, strategy="grid",
+               n_iter=20, n_jobs=-1, cv=5, checkpoint=None, factor=3,
+               random_state=0):
+    """Searches param_grid for the parameters of estimator with the best
+    mean cross validation score on X and y, and returns them.
+
+    strategy is one of SEARCH_STRATEGIES. The random, halving_random and
+    bayesian strategies try n_iter candidates. n_jobs candidates are
+    fitted at a time, and checkpoint names a JSON file where the scores
+    are saved after every batch to resume an interrupted search.
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError("strategy must be one of "
+                         + ", ".join(SEARCH_STRATEGIES))
+
+    if strategy == "bayesian" and Optimizer is None:
+        print("scikit-optimize is not installed; running a randomized",
+              "search instead.")
+        strategy = "random"
+    if strategy == "bayesian" and not isinstance(param_grid, dict):
+        print("Bayesian search needs a single parameter grid; running a",
+              "randomized search instead.")
+        strategy = "random"
+
+    y = np.ravel(y)
+    classifier = is_classifier(estimator)
+    folds = list(check_cv(cv, y, classifier=classifier)
+                 .split(np.zeros((len(y), 1)), y))
+    signature = None
+    if checkpoint is not None:
+        signature = _signature(estimator, X, y, scoring, len(folds), strategy,
+                               random_state)
+
+    grid = ParameterGrid(param_grid)
+    n_iter = min(n_iter, len(grid))
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        evaluator = _Evaluator(estimator, X, y, folds,
+                               check_scoring(estimator, scoring), parallel,
+                               SearchCheckpoint(checkpoint, signature),
+                               random_state)
+
+        if strategy == "bayesian":
+            candidates, scores = _bayesian(evaluator, param_grid, n_iter,
+                                           random_state)
+        else:
+            if strategy in {"grid", "halving_grid"}:
+                candidates = list(grid)
+            else:
+                candidates = list(ParameterSampler(param_grid, n_iter,
+                                                   random_state=random_state))
+
+            if strategy.startswith("halving"):
+                # Every training fold needs a few datapoints of each class
+                n_classes = len(np.unique(y)) if classifier else 1
+                candidates, scores = _halving(
+                    evaluator, candidates, len(y),
+                    2 * len(folds) * n_classes, factor)
+            else:
+                scores = evaluator.evaluate(candidates)
+
+    print("Evaluated", len(evaluator.results), "candidate fits; best mean",
+          "CV score:", np.nanmax(scores) if np.isfinite(scores).any()
+          else np.nan)
+    return _best(candidates, scores)[0]
+
+
+def prompt_search_settings():
+    """Prompts for the search strategy and its settings. Returns them as
+    keyword arguments for run_search().
+    """
+    settings = {}
+
+    while True:
+        print("\nChoose the search strategy.")
+        print("Options: 1-grid, 2-halving grid, 3-halving random,",
+              "4-random, 5-bayesian")
+        user_input = input("Enter a number (default=1): ")
+        try:
+            if user_input == "":
+                settings["strategy"] = "grid"
+                break
+
+            user_input = int(user_input)
+            if user_input < 1 or user_input > len(SEARCH_STRATEGIES):
+                raise Exception
+            else:
+                settings["strategy"] = SEARCH_STRATEGIES[user_input - 1]
+                break
+        except Exception:
+            print("Invalid input.")
+
+    print("strategy =", settings["strategy"])
+
+    if settings["strategy"] in {"halving_random", "random", "bayesian"}:
+        while True:
+            user_input = input("\nNumber of candidates to try (default=20): ")
+            try:
+                if user_input == "":
+                    settings["n_iter"] = 20
+                    break
+
+                user_input = int(user_input)
+                if user_input <= 0:
+                    raise Exception
+                else:
+                    settings["n_iter"] = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("n_iter =", settings["n_iter"])
+
+    while True:
+        user_input = input("\nNumber of parallel workers "
+                           + "(default=all cores): ")
+        try:
+            if user_input == "":
+                settings["n_jobs"] = -1
+                break
+
+            user_input = int(user_input)
+            if user_input <= 0:
+                raise Exception
+            else:
+                settings["n_jobs"] = user_input
+                break
+        except Exception:
+            print("Invalid input.")
+
+    print("n_jobs =", settings["n_jobs"])
+
+    user_input = input("\nCheckpoint file to save and resume the search "
+                       + "(leave blank for none): ")
+    settings["checkpoint"] = user_input or None
+    print("checkpoint =", settings["checkpoint"])
+
+    return settings
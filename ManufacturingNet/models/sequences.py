@@ -0,0 +1,117 @@
+# Helpers for training the recurrent wrappers on sequences of different lengths
+
+import numpy as np
+
+import torch
+import torch.utils.data as data
+# PackedSequence is re-exported for the recurrent wrappers and export
+from torch.nn.utils.rnn import PackedSequence, pack_sequence, pad_packed_sequence
+
+
+def is_variable_length(X, lengths=None):
+
+    # Method for checking whether the inputs have to be handled as variable-length sequences
+
+    if lengths is not None or isinstance(X, (list, tuple)):
+        return True
+    return isinstance(X, np.ndarray) and X.dtype == object
+
+
+def to_sequence_list(X, lengths=None):
+    """
+    Converts the supported variable-length inputs into a list of arrays of shape (length, ...).
+
+    X can be a list or an object array of sequences, or a padded array together with
+    the valid length of every sequence in lengths. Trimming a padded array returns views,
+    so no data is copied.
+    """
+
+    if lengths is not None:
+        lengths = np.asarray(lengths).astype(int)
+        if len(lengths) != len(X):
+            raise ValueError('lengths must contain one entry per sequence')
+        return [X[i][:lengths[i]] for i in range(len(X))]
+
+    return [np.asarray(x) for x in X]
+
+
+def collate_packed(batch):
+
+    # Method for turning a list of (sequence, target) pairs into a packed batch.
+    # The packed sequence keeps the original order of the batch through its sorted_indices
+
+    sequences, targets = zip(*batch)
+    packed = pack_sequence(list(sequences), enforce_sorted=False)
+    return packed, torch.stack(targets)
+
+
+def last_valid_output(packed_output):
+
+    # Method for getting the output at the last valid timestep of every sequence in a
+    # packed recurrent output, in the original order of the batch
+
+    padded, lengths = pad_packed_sequence(packed_output, batch_first=True)
+    index = (lengths - 1).to(padded.device)
+    return padded[torch.arange(padded.shape[0], device=padded.device), index]
+
+
+def pack_inputs(x_input, device):
+
+    # Method for packing a list or object array of numpy sequences for inference
+
+    sequences = [torch.from_numpy(np.asarray(x)).double() for x in x_input]
+    return pack_sequence(sequences, enforce_sorted=False).to(device)
+
+
+class BucketBatchSampler(data.Sampler):
+    """
+    Batches sequences of similar length together so that little compute is spent on padding.
+
+    With shuffle, the indices are shuffled and cut into pools of pool_factor batches; each pool
+    is sorted by length and split into batches, and the order of the batches is shuffled again.
+    Without shuffle, the whole dataset is sorted by length. The torch random number generator
+    is used, so the order is restored together with the rest of a training checkpoint.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, pool_factor=50):
+
+        self.lengths = list(lengths)
+        self.batch_size = int(batch_size)
+        self.shuffle = shuffle
+        self.pool_size = self.batch_size * pool_factor if shuffle else max(len(self.lengths), 1)
+
+    def __iter__(self):
+
+        num_samples = len(self.lengths)
+        if self.shuffle:
+            order = torch.randperm(num_samples).tolist()
+        else:
+            order = list(range(num_samples))
+
+        batches = []
+        for start in range(0, num_samples, self.pool_size):
+            pool = sorted(order[start:start + self.pool_size], key=self.lengths.__getitem__)
+            batches.extend(pool[i:i + self.batch_size]
+                           for i in range(0, len(pool), self.batch_size))
+
+        if self.shuffle:
+            batches = [batches[i] for i in torch.randperm(len(batches)).tolist()]
+
+        return iter(batches)
+
+    def __len__(self):
+
+        num_samples = len(self.lengths)
+        full_pools, remainder = divmod(num_samples, self.pool_size)
+        batches_per_pool = -(-self.pool_size // self.batch_size)
+        return full_pools * batches_per_pool + -(-remainder // self.batch_size)
+
+
+def sequence_loader(dataset, batch_size, shuffle):
+
+    # Method for building a dataloader that yields packed batches of length-bucketed sequences
+
+    lengths = [len(x) for x in dataset.X]
+    sampler = BucketBatchSampler(lengths, batch_size, shuffle=shuffle)
+    return data.DataLoader(dataset, batch_sampler=sampler, collate_fn=collate_packed)
+
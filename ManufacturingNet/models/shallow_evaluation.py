@@ -0,0 +1,116 @@
+"""shallow_evaluation is the evaluation engine shared by the shallow
+learning wrappers. It runs cross validation folds in parallel, keeps the
+fold estimators for ensembling or variance estimates, and records the
+training compute spent in each phase of a run.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import time
+
+import numpy as np
+from sklearn.base import is_classifier
+from sklearn.model_selection import cross_validate
+
+
+class PhaseTimer:
+    """Stopwatch recording the wall-clock and CPU time of each phase of
+    a training run.
+    """
+
+    def __init__(self):
+        """Starts the clock of the first phase."""
+        self.times = {}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def mark(self, phase):
+        """Ends the current phase, recording it under the given name, and
+        starts the next one.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.add(phase, wall - self._wall, cpu - self._cpu)
+        self._wall, self._cpu = wall, cpu
+
+    def restart(self):
+        """Starts the next phase without recording the current one."""
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def add(self, phase, wall_time, compute_time):
+        """Records a phase measured elsewhere."""
+        self.times[phase] = {"wall_time": wall_time,
+                             "compute_time": compute_time}
+
+    def get_times(self):
+        """Accessor method for the recorded phases."""
+        return self.times
+
+    def print_times(self):
+        """Prints the time spent in each phase."""
+        print("\nTraining Time per Phase:")
+        print("{:<20} {:<20} {:<20}".format("Phase", "Wall (s)",
+                                            "Compute (s)"))
+        for phase, times in self.times.items():
+            print("{:<20} {:<20.4f} {:<20.4f}".format(
+                phase, times["wall_time"], times["compute_time"]))
+
+
+def _single_column(y):
+    """Flattens y if it holds a single column of labels. Labels with
+    several columns, such as multi-output regression targets, are
+    returned unchanged.
+    """
+    shape = np.shape(y)
+    if len(shape) == 2 and shape[1] != 1:
+        return y
+    return np.ravel(y)
+
+
+def cross_validate_model(estimator, X, y, cv=None, n_jobs=None,
+                         estimate_only=False, timer=None):
+    """Cross validates a copy of estimator on X and y, running the folds
+    in n_jobs parallel jobs.
+
+    Returns the fold scores and the fitted fold estimators, or
+    (None, None) in estimate-only mode, where cross validation is
+    skipped and the holdout score is the only estimate. The wall time of
+    the folds and the compute time summed over all folds are recorded in
+    timer under "cross_validation".
+    """
+    if estimate_only:
+        return None, None
+
+    start_time = time.perf_counter()
+    results = cross_validate(estimator, X, _single_column(y), cv=cv,
+                             n_jobs=n_jobs, return_estimator=True)
+
+    if timer is not None:
+        timer.add("cross_validation", time.perf_counter() - start_time,
+                  float(np.sum(results["fit_time"])
+                        + np.sum(results["score_time"])))
+        timer.restart()
+
+    return results["test_score"], list(results["estimator"])
+
+
+def ensemble_predict(estimators, X):
+    """Predicts with every fold estimator and combines the predictions:
+    majority vote for classifiers, mean for regressors.
+    """
+    predictions = np.array([estimator.predict(X) for estimator in estimators])
+
+    if not is_classifier(estimators[0]):
+        return predictions.mean(axis=0)
+
+    classes = np.unique(predictions)
+    votes = (predictions[:, :, None] == classes).sum(axis=0)
+    return classes[votes.argmax(axis=1)]
+
+
+def ensemble_std(estimators, X):
+    """Returns the standard deviation of the fold estimators' predictions
+    for each datapoint in X, a variance estimate for regressors.
+    """
+    predictions = np.array([estimator.predict(X) for estimator in estimators])
+    return predictions.std(axis=0)
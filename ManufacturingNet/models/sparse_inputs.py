@@ -0,0 +1,124 @@
+"""sparse_inputs lets the shallow learning wrappers and the All* runners
+train on scipy.sparse matrices without converting them to dense arrays.
+
+One-hot encoded datasets, such as the Mercedes dataset, are mostly
+zeros; as CSR or CSC matrices they take a fraction of the memory of a
+dense array. Splitting, cross validation, the linear models, LinearSVC,
+random forests and XGBoost's DMatrix all accept them as they are. Models
+that would silently convert them to dense arrays are rejected instead.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import numpy as np
+from scipy import sparse
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import (LinearRegression, LogisticRegression,
+                                  SGDClassifier, SGDRegressor)
+from sklearn.pipeline import Pipeline
+from sklearn.svm import SVC, SVR, LinearSVC, LinearSVR, NuSVC, NuSVR
+from xgboost import XGBClassifier, XGBRegressor
+
+# Sparse formats that can be sliced by rows, as splitting and cross
+# validation do
+SLICEABLE_FORMATS = ("csr", "csc")
+
+# Estimators that train and predict on sparse matrices without
+# converting them to dense arrays
+SPARSE_ESTIMATORS = (LinearRegression, LogisticRegression, SGDClassifier,
+                     SGDRegressor, LinearSVC, LinearSVR, SVC, SVR, NuSVC,
+                     NuSVR, RandomForestClassifier, RandomForestRegressor,
+                     Nystroem, RBFSampler, XGBClassifier, XGBRegressor)
+
+
+def is_sparse(X):
+    """Returns whether X is a scipy.sparse matrix or array."""
+    return sparse.issparse(X)
+
+
+def is_sliceable(X):
+    """Returns whether X is a dense array or a sparse matrix in a format
+    that can be sliced by rows.
+    """
+    return not sparse.issparse(X) or X.format in SLICEABLE_FORMATS
+
+
+def to_sparse(X, format="csr", dtype=np.float64):
+    """Returns X as a sparse matrix of the given format, converting it
+    without an intermediate dense copy when it is already sparse.
+    """
+    if format not in SLICEABLE_FORMATS:
+        raise ValueError("format must be one of "
+                         + ", ".join(SLICEABLE_FORMATS) + ".")
+    if sparse.issparse(X):
+        return X.asformat(format).astype(dtype, copy=False)
+    return sparse.csr_matrix(np.asarray(X, dtype=dtype)).asformat(format)
+
+
+def density(X):
+    """Returns the fraction of nonzero entries of X."""
+    n_entries = max(X.shape[0] * X.shape[1], 1)
+    if sparse.issparse(X):
+        return X.nnz / n_entries
+    return np.count_nonzero(X) / n_entries
+
+
+def variance(X):
+    """Returns the variance of all the entries of X, as libsvm's
+    gamma='scale' uses it, without densifying a sparse X.
+    """
+    if sparse.issparse(X):
+        X = X.astype(np.float64)
+        return X.multiply(X).mean() - X.mean() ** 2
+    return np.asarray(X, dtype=float).var()
+
+
+def nbytes(X):
+    """Returns the memory taken by the entries of X, in bytes."""
+    if sparse.issparse(X):
+        if X.format in SLICEABLE_FORMATS:
+            return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+        return nbytes(X.tocsr())
+    return np.asarray(X).nbytes
+
+
+def vstack(blocks):
+    """Stacks dense arrays or sparse matrices by rows. The result is a CSR
+    matrix if any block is sparse.
+    """
+    if any(sparse.issparse(block) for block in blocks):
+        return sparse.vstack(blocks, format="csr")
+    return np.concatenate(blocks)
+
+
+def accepts_sparse(estimator):
+    """Returns whether estimator trains on sparse matrices without
+    densifying them. A pipeline does if all of its steps do.
+    """
+    if isinstance(estimator, Pipeline):
+        return all(accepts_sparse(step) for _, step in estimator.steps)
+    if isinstance(estimator, CalibratedClassifierCV):
+        return accepts_sparse(estimator.get_params()["estimator"])
+    if isinstance(estimator, (SVC, SVR, NuSVC, NuSVR)):
+        # A precomputed kernel is a dense Gram matrix
+        return estimator.get_params()["kernel"] != "precomputed"
+    if isinstance(estimator, LinearRegression):
+        # The positive constraint densifies its inputs
+        return not estimator.get_params()["positive"]
+    return isinstance(estimator, SPARSE_ESTIMATORS)
+
+
+def check_sparse_support(estimator, X):
+    """Raises ValueError if X is sparse and estimator would convert it to
+    a dense array or can't slice it.
+    """
+    if not sparse.issparse(X):
+        return
+    if not is_sliceable(X):
+        raise ValueError("Sparse attributes must be in CSR or CSC format; "
+                         + "convert them with tocsr() first.")
+    if not accepts_sparse(estimator):
+        raise ValueError(type(estimator).__name__ + " would convert the "
+                         + "sparse attributes to a dense array.")
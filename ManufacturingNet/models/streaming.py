@@ -0,0 +1,142 @@
+# Stateful streaming inference for the trained LSTM and CNNLSTM networks
+
+import threading
+
+import numpy as np
+
+import torch
+from torch.nn.utils.rnn import pack_sequence
+
+from .evaluation import inference_mode
+
+
+class StreamingPredictor():
+    """
+    Makes a prediction per new block of samples of many live streams without re-running the history.
+
+    The LSTM hidden and cell states of every stream are kept between calls, so each update only
+    processes the new timesteps: its cost does not depend on how long the stream has been running.
+    Updates of several streams are packed into one batch, even if their blocks have different lengths.
+
+    model: a trained LSTM or CNNLSTM wrapper, or their network.
+    classification: return class indices instead of raw outputs. Taken from the wrapper's loss
+    function if not given.
+    """
+
+    def __init__(self, model, classification=None, device=None):
+
+        net = getattr(model, 'net', model)
+        if classification is None:
+            classification = getattr(model, 'criterion_input', None) == '1'
+
+        # CNN_LSTM networks hold the CNN and the LSTM network as submodules
+        self.cnn = getattr(net, 'cnn', None)
+        self.head = net.lstm if self.cnn is not None else net
+        self.rnn = self.head.lstm
+
+        if self.rnn.bidirectional:
+            raise ValueError('A bidirectional LSTM needs the whole sequence and cannot be streamed')
+
+        parameter = next(net.parameters())
+        self.device = device if device is not None else parameter.device
+        self.dtype = parameter.dtype
+        self.classification = classification
+        self.net = net.to(self.device).eval()
+
+        # one sample is (features,) for LSTM and (channels, height, width) for CNNLSTM
+        self.step_ndim = 3 if self.cnn is not None else 1
+
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._free_slots = []
+        self._h = torch.zeros((self.rnn.num_layers, 0, self.rnn.hidden_size),
+                              dtype=self.dtype, device=self.device)
+        self._c = torch.zeros_like(self._h)
+
+    def _get_slots(self, stream_ids):
+
+        # Method for getting the state slot of every stream, creating zeroed slots for new streams
+
+        slots = []
+        for stream_id in stream_ids:
+            if stream_id not in self._slots:
+                if not self._free_slots:
+                    self._grow()
+                slot = self._free_slots.pop()
+                self._h[:, slot].zero_()
+                self._c[:, slot].zero_()
+                self._slots[stream_id] = slot
+            slots.append(self._slots[stream_id])
+        return torch.tensor(slots, dtype=torch.long, device=self.device)
+
+    def _grow(self):
+
+        # Method for doubling the number of state slots
+
+        capacity = self._h.shape[1]
+        extra = max(capacity, 8)
+        self._h = torch.cat([self._h, torch.zeros((self._h.shape[0], extra, self._h.shape[2]),
+                                                  dtype=self.dtype, device=self.device)], 1)
+        self._c = torch.cat([self._c, torch.zeros_like(self._h[:, capacity:])], 1)
+        self._free_slots.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+    def _to_sequence(self, x):
+
+        x = torch.as_tensor(np.asarray(x), dtype=self.dtype)
+        if x.dim() == self.step_ndim:               # a single timestep
+            x = x.unsqueeze(0)
+        return x
+
+    def update_many(self, blocks):
+        """
+        Feeds a block of new samples to every stream in blocks, a dict of stream id to an array of
+        shape (timesteps, ...) or a single sample. Returns a dict of stream id to its prediction.
+        """
+
+        stream_ids = list(blocks)
+        if not stream_ids:
+            return {}
+
+        with self._lock, inference_mode():
+
+            packed = pack_sequence([self._to_sequence(blocks[stream_id]) for stream_id in stream_ids],
+                                   enforce_sorted=False).to(self.device)
+            if self.cnn is not None:
+                packed = packed._replace(data=self.cnn(packed.data))
+
+            slots = self._get_slots(stream_ids)
+            h0 = self._h.index_select(1, slots)
+            c0 = self._c.index_select(1, slots)
+            _, (h, c) = self.rnn(packed, (h0, c0))
+            self._h.index_copy_(1, slots, h)
+            self._c.index_copy_(1, slots, c)
+
+            # the last layer's final hidden state is the LSTM output at the last new timestep
+            out = self.head.linear3(self.head.linear2(self.head.linear1(h[-1])))
+            if self.classification:
+                out = out.argmax(1)
+            out = out.cpu().numpy()
+
+        return {stream_id: out[i] for i, stream_id in enumerate(stream_ids)}
+
+    def update(self, stream_id, x):
+
+        # Method for feeding one sample or a block of samples to a single stream
+
+        return self.update_many({stream_id: x})[stream_id]
+
+    def reset(self, stream_id=None):
+
+        # Method for forgetting the state of one stream, or of all streams if no id is given
+
+        with self._lock:
+            stream_ids = list(self._slots) if stream_id is None else [stream_id]
+            for key in stream_ids:
+                if key in self._slots:
+                    self._free_slots.append(self._slots.pop(key))
+
+    def get_streams(self):
+
+        # Method for getting the ids of the streams that currently hold a state
+
+        return list(self._slots)
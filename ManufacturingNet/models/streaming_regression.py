@@ -0,0 +1,175 @@
+"""streaming_regression holds the streaming mode of the LinRegression
+wrapper.
+
+Linear least squares only needs the sufficient statistics X^T X, X^T y
+and y^T y of its training data. The dataset is read once, chunk by chunk,
+from arrays, memory-mapped .npy files or a chunk iterator, and every
+datapoint's statistics are added to those of its cross validation fold
+or of the holdout set. Every fold model, its score, and the final model
+are then solved from these small matrices, so the dataset never needs
+to fit in memory.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import numpy as np
+from scipy.sparse import issparse
+from sklearn.base import BaseEstimator, RegressorMixin
+
+
+def iter_chunks(attributes, labels=None, chunk_size=10000):
+    """Yields (attributes, labels) chunks of at most chunk_size rows.
+
+    attributes is an array, such as one memory-mapped with
+    numpy.load(filename, mmap_mode='r'), read together with labels; or a
+    callable returning a new iterator over (attributes, labels) pairs,
+    such as a generator function reading a large file in chunks.
+    Sparse chunks are made dense one chunk at a time.
+    """
+    if callable(attributes):
+        for X, y in attributes():
+            yield _dense(X), np.ravel(y).astype(float)
+        return
+
+    if not issparse(attributes):
+        # A view; memory-mapped rows are still read chunk by chunk
+        attributes = np.asarray(attributes)
+    for start in range(0, attributes.shape[0], chunk_size):
+        stop = start + chunk_size
+        yield (_dense(attributes[start:stop]),
+               np.ravel(labels[start:stop]).astype(float))
+
+
+def _dense(X):
+    """Returns a chunk as a dense float array."""
+    if issparse(X):
+        return X.toarray().astype(float, copy=False)
+    return np.asarray(X, dtype=float)
+
+
+class StreamingLinearRegression(BaseEstimator, RegressorMixin):
+    """Ordinary least squares linear regression fitted from sufficient
+    statistics accumulated over chunks of the dataset.
+
+    fit() randomly assigns each datapoint to the holdout set, with
+    probability test_size, or to one of cv folds, and reads the dataset
+    once. The model is solved on all folds, each cross validation model
+    on all folds but one, and all of them are scored from the same
+    statistics.
+    """
+
+    def __init__(self, fit_intercept=True, cv=5, test_size=0.25,
+                 chunk_size=10000, random_state=0):
+        """Initializes a StreamingLinearRegression object."""
+        self.fit_intercept = fit_intercept
+        self.cv = cv
+        self.test_size = test_size
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+    def _accumulate(self, attributes, labels):
+        """Reads the dataset once, returning the statistics of each
+        group: the cv folds followed by the holdout set.
+        """
+        rng = np.random.RandomState(self.random_state)
+        n_groups = self.cv + 1
+        stats = None
+
+        for X, y in iter_chunks(attributes, labels, self.chunk_size):
+            if stats is None:
+                # Shift by the first chunk's means for numerical stability;
+                # the intercept absorbs the shift
+                self.shift_X_ = np.zeros(X.shape[1])
+                self.shift_y_ = 0.0
+                if self.fit_intercept:
+                    self.shift_X_ = X.mean(axis=0)
+                    self.shift_y_ = y.mean()
+                n_columns = X.shape[1] + 1
+                stats = {"XtX": np.zeros((n_groups, n_columns, n_columns)),
+                         "Xty": np.zeros((n_groups, n_columns)),
+                         "yty": np.zeros(n_groups),
+                         "y_sum": np.zeros(n_groups),
+                         "n": np.zeros(n_groups)}
+
+            X = np.hstack([X - self.shift_X_, np.ones((len(X), 1))])
+            y = y - self.shift_y_
+
+            holdout = rng.random_sample(len(y)) < self.test_size
+            groups = np.where(holdout, self.cv,
+                              rng.randint(0, self.cv, len(y)))
+            for group in np.unique(groups):
+                rows = groups == group
+                X_group, y_group = X[rows], y[rows]
+                stats["XtX"][group] += X_group.T @ X_group
+                stats["Xty"][group] += X_group.T @ y_group
+                stats["yty"][group] += y_group @ y_group
+                stats["y_sum"][group] += y_group.sum()
+                stats["n"][group] += len(y_group)
+
+        if stats is None:
+            raise ValueError("The dataset is empty.")
+        return stats
+
+    def _solve(self, XtX, Xty):
+        """Returns the least squares weights of the augmented attributes,
+        the last one being the intercept.
+        """
+        if self.fit_intercept:
+            return np.linalg.lstsq(XtX, Xty, rcond=None)[0]
+
+        # Leave out the constant column
+        weights = np.linalg.lstsq(XtX[:-1, :-1], Xty[:-1], rcond=None)[0]
+        return np.append(weights, 0.0)
+
+    @staticmethod
+    def _scores(weights, XtX, Xty, yty, y_sum, n):
+        """Returns the mean squared error and R2 score of weights on the
+        datapoints summarized by the statistics.
+        """
+        if n == 0:
+            return np.nan, np.nan
+
+        sse = yty - 2 * weights @ Xty + weights @ XtX @ weights
+        sst = yty - y_sum ** 2 / n
+        return sse / n, 1 - sse / sst if sst > 0 else 0.0
+
+    def fit(self, attributes, labels=None):
+        """Fits the model, the cross validation scores and the holdout
+        scores in one pass over the dataset.
+        """
+        stats = self._accumulate(attributes, labels)
+        train = {key: value[:self.cv].sum(axis=0)
+                 for key, value in stats.items()}
+
+        weights = self._solve(train["XtX"], train["Xty"])
+        self.coef_ = weights[:-1]
+        self.intercept_ = self.shift_y_ + weights[-1] \
+            - self.shift_X_ @ self.coef_
+        self.n_samples_ = int(stats["n"].sum())
+
+        self.cross_val_scores_ = []
+        for fold in range(self.cv):
+            fold_weights = self._solve(train["XtX"] - stats["XtX"][fold],
+                                       train["Xty"] - stats["Xty"][fold])
+            self.cross_val_scores_.append(self._scores(
+                fold_weights, stats["XtX"][fold], stats["Xty"][fold],
+                stats["yty"][fold], stats["y_sum"][fold],
+                stats["n"][fold])[1])
+        self.cross_val_scores_ = np.array(self.cross_val_scores_)
+
+        self.mean_squared_error_, self.r2_score_ = self._scores(
+            weights, stats["XtX"][self.cv], stats["Xty"][self.cv],
+            stats["yty"][self.cv], stats["y_sum"][self.cv],
+            stats["n"][self.cv])
+        return self
+
+    def predict(self, X):
+        """Predicts the output of each datapoint in X, chunk by chunk."""
+        if not issparse(X):
+            X = np.asarray(X)
+        predictions = np.empty(X.shape[0])
+        for start in range(0, X.shape[0], self.chunk_size):
+            stop = start + self.chunk_size
+            predictions[start:stop] = \
+                _dense(X[start:stop]) @ self.coef_ + self.intercept_
+        return predictions
@@ -10,20 +10,36 @@ View the documentation at https://manufacturingnet.readthedocs.io/.
 from math import sqrt
 
 import matplotlib.pyplot as plt
+import numpy as np
 from sklearn.metrics import (accuracy_score, confusion_matrix, make_scorer,
                              mean_squared_error, roc_auc_score, roc_curve)
-from sklearn.model_selection import (GridSearchCV, cross_val_score,
-                                     train_test_split)
+from sklearn.model_selection import train_test_split
 from sklearn.svm import SVC, SVR, LinearSVC, LinearSVR, NuSVC, NuSVR
 
+from .bulk_scoring import score_model
+from .kernel_approximation import (approximate_model, gap_report,
+                                   print_gap_report, select_n_components)
+from .incremental import make_online, partial_update
+from .kernel_cache import precomputed_grid_search
+from .persistence import load_wrapper, save_wrapper
+from .regularization_path import path_search, select_dual
+from .search import prompt_search_settings, run_search
+from .shallow_evaluation import PhaseTimer, cross_validate_model
+from .sparse_inputs import is_sliceable
+
 
 class SVM:
     """Class model for support vector machine (SVM) models."""
 
-    def __init__(self, attributes=None, labels=None):
+    def __init__(self, attributes=None, labels=None, cv_n_jobs=None,
+                 estimate_only=False):
         """Initializes a SVM object."""
         self.attributes = attributes
         self.labels = labels
+        self.cv_n_jobs = cv_n_jobs
+        self.estimate_only = estimate_only
+        self.cv_estimators = {}
+        self.training_times = {}
 
         self.test_size = None
         self.cv = None
@@ -34,6 +50,19 @@ class SVM:
         self.gridsearch = False
         self.gs_params = None
         self.gs_result = None
+        self.search_settings = {}
+        self.kernel_cache = True
+        self.kernel_cache_mb = 1024
+        self.kernel_cache_dir = None
+        self.large_data = False
+        self.approximation = "nystroem"
+        self.linear_model = "linear_svm"
+        self.n_components = None
+        self.gap_samples = 5000
+        self.exact_models = {}
+        self.gap_reports = {}
+        self.update_epochs = 1
+        self.update_scores = {}
 
         self.classifier_SVC = None
         self.accuracy_SVC = None
@@ -194,6 +223,30 @@ class SVM:
         """Accessor method for cross_val_scores_linear_SVR."""
         return self.cross_val_scores_linear_SVR
 
+    def get_gap_reports(self):
+        """Accessor method for gap_reports, the comparison of each large
+        data mode model with the exact kernel SVM.
+        """
+        return self.gap_reports
+
+    def get_update_scores(self):
+        """Accessor method for update_scores, the score of each model on
+        each batch of new data before it was updated with it.
+        """
+        return self.update_scores
+
+    def get_cv_estimators(self):
+        """Accessor method for cv_estimators, the fitted cross validation
+        fold estimators of each model.
+        """
+        return self.cv_estimators
+
+    def get_training_times(self):
+        """Accessor method for training_times, the wall-clock and compute
+        time of each training phase of each model.
+        """
+        return self.training_times
+
     # Modifier Methods
 
     def set_attributes(self, new_attributes=None):
@@ -204,6 +257,46 @@ class SVM:
         """Modifier method for labels."""
         self.labels = new_labels
 
+    def set_cv_n_jobs(self, new_cv_n_jobs=None):
+        """Modifier method for cv_n_jobs, the number of cross validation
+        folds run in parallel.
+        """
+        self.cv_n_jobs = new_cv_n_jobs
+
+    def set_estimate_only(self, new_estimate_only=False):
+        """Modifier method for estimate_only. If True, cross validation is
+        skipped and the holdout score is the only estimate.
+        """
+        self.estimate_only = new_estimate_only
+
+    def set_kernel_cache(self, new_kernel_cache=True,
+                         new_kernel_cache_mb=1024,
+                         new_kernel_cache_dir=None):
+        """Modifier method for kernel_cache, kernel_cache_mb and
+        kernel_cache_dir. If kernel_cache is True, grid searches fit every
+        C, nu and epsilon value on a precomputed kernel matrix.
+        """
+        self.kernel_cache = new_kernel_cache
+        self.kernel_cache_mb = new_kernel_cache_mb
+        self.kernel_cache_dir = new_kernel_cache_dir
+
+    def set_update_epochs(self, new_update_epochs=1):
+        """Modifier method for update_epochs, the number of passes the
+        update methods make over each batch of new data.
+        """
+        self.update_epochs = new_update_epochs
+
+    def set_large_data(self, new_large_data=False,
+                       new_approximation="nystroem",
+                       new_linear_model="linear_svm", new_n_components=None):
+        """Modifier method for large_data, approximation, linear_model and
+        n_components. If n_components is None, it is chosen automatically.
+        """
+        self.large_data = new_large_data
+        self.approximation = new_approximation
+        self.linear_model = new_linear_model
+        self.n_components = new_n_components
+
     # Wrappers for SVM classification classes
 
     def run_SVC(self):
@@ -217,8 +310,13 @@ class SVM:
             if self.dataset_X_test is None:
                 self._split_data()
 
+            # In large data mode, replace the kernel SVM with a kernel
+            # approximation and a linear model
+            self.classifier_SVC = self._approximate(self.classifier_SVC, "SVC")
+
             # Train classifier
             # Handle exception if arguments are incorrect
+            timer = PhaseTimer()
             try:
                 self.classifier_SVC.fit(self.dataset_X_train,
                                         self.dataset_y_train)
@@ -230,6 +328,8 @@ class SVM:
                 self.classifier_SVC = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             self.accuracy_SVC = self.classifier_SVC.score(self.dataset_X_test,
                                                           self.dataset_y_test)
@@ -247,9 +347,14 @@ class SVM:
                 self.confusion_matrix_SVC = confusion_matrix(self.dataset_y_test,
                                                              y_prediction)
 
-            self.cross_val_scores_SVC = \
-                cross_val_score(self.classifier_SVC, self.attributes,
-                                self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = \
+                self._cross_validate(self.classifier_SVC, timer)
+            self.cross_val_scores_SVC = scores
+            self.cv_estimators["SVC"] = estimators
+            self.training_times["SVC"] = timer.get_times()
+            timer.print_times()
+            self._report_gap("SVC", self.classifier_SVC)
 
             # Output results
             self._output_classifier_results(model="SVC")
@@ -289,8 +394,14 @@ class SVM:
             if self.dataset_X_test is None:
                 self._split_data()
 
+            # In large data mode, replace the kernel SVM with a kernel
+            # approximation and a linear model
+            self.classifier_nu_SVC = \
+                self._approximate(self.classifier_nu_SVC, "NuSVC")
+
             # Train classifier
             # Handle exception if arguments are incorrect
+            timer = PhaseTimer()
             try:
                 self.classifier_nu_SVC.fit(self.dataset_X_train,
                                            self.dataset_y_train)
@@ -302,6 +413,8 @@ class SVM:
                 self.classifier_nu_SVC = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             self.accuracy_nu_SVC =\
                 self.classifier_nu_SVC.score(self.dataset_X_test,
@@ -321,9 +434,14 @@ class SVM:
                 self.confusion_matrix_nu_SVC = \
                     confusion_matrix(self.dataset_y_test, y_prediction)
 
-            self.cross_val_scores_nu_SVC = \
-                cross_val_score(self.classifier_nu_SVC, self.attributes,
-                                self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = \
+                self._cross_validate(self.classifier_nu_SVC, timer)
+            self.cross_val_scores_nu_SVC = scores
+            self.cv_estimators["NuSVC"] = estimators
+            self.training_times["NuSVC"] = timer.get_times()
+            timer.print_times()
+            self._report_gap("NuSVC", self.classifier_nu_SVC)
 
             # Output results
             self._output_classifier_results(model="NuSVC")
@@ -365,6 +483,7 @@ class SVM:
 
             # Train classifier
             # Handle exception if arguments are incorrect
+            timer = PhaseTimer()
             try:
                 self.classifier_linear_SVC.fit(self.dataset_X_train,
                                                self.dataset_y_train)
@@ -376,13 +495,19 @@ class SVM:
                 self.classifier_linear_SVC = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             self.accuracy_linear_SVC = \
                 self.classifier_linear_SVC.score(self.dataset_X_test,
                                                  self.dataset_y_test)
-            self.cross_val_scores_linear_SVC =\
-                cross_val_score(self.classifier_linear_SVC, self.attributes,
-                                self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = \
+                self._cross_validate(self.classifier_linear_SVC, timer)
+            self.cross_val_scores_linear_SVC = scores
+            self.cv_estimators["LinearSVC"] = estimators
+            self.training_times["LinearSVC"] = timer.get_times()
+            timer.print_times()
 
             # Output results
             self._output_classifier_results(model="LinearSVC")
@@ -424,9 +549,14 @@ class SVM:
             if self.dataset_X_test is None:
                 self._split_data()
 
+            # In large data mode, replace the kernel SVM with a kernel
+            # approximation and a linear model
+            self.regressor_SVR = self._approximate(self.regressor_SVR, "SVR")
+
             # Train regression model
             # Handle exception if arguments are incorrect and/or if labels isn't
             # quantitative data
+            timer = PhaseTimer()
             try:
                 self.regressor_SVR.fit(self.dataset_X_train,
                                        self.dataset_y_train)
@@ -439,6 +569,8 @@ class SVM:
                 self.regressor_SVR = None
                 return
 
+            timer.mark("fit")
+
             # Evaluate metrics of model
             y_prediction = self.regressor_SVR.predict(self.dataset_X_test)
             self.mean_squared_error_SVR = \
@@ -448,9 +580,14 @@ class SVM:
             if self.r2_score_SVR >= 0:
                 self.r_score_SVR = sqrt(self.r2_score_SVR)
 
-            self.cross_val_scores_SVR = \
-                cross_val_score(self.regressor_SVR, self.attributes,
-                                self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = \
+                self._cross_validate(self.regressor_SVR, timer)
+            self.cross_val_scores_SVR = scores
+            self.cv_estimators["SVR"] = estimators
+            self.training_times["SVR"] = timer.get_times()
+            timer.print_times()
+            self._report_gap("SVR", self.regressor_SVR)
 
             # Output results
             self._output_regressor_results(model="SVR")
@@ -490,9 +627,15 @@ class SVM:
             if self.dataset_X_test is None:
                 self._split_data()
 
+            # In large data mode, replace the kernel SVM with a kernel
+            # approximation and a linear model
+            self.regressor_nu_SVR = \
+                self._approximate(self.regressor_nu_SVR, "NuSVR")
+
             # Train regression model
             # Handle exception if arguments are incorrect and/or if labels isn't
             # quantitative data
+            timer = PhaseTimer()
             try:
                 self.regressor_nu_SVR.fit(self.dataset_X_train,
                                           self.dataset_y_train)
@@ -505,6 +648,8 @@ class SVM:
                 self.regressor_nu_SVR = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             y_prediction = self.regressor_nu_SVR.predict(self.dataset_X_test)
             self.mean_squared_error_nu_SVR = \
@@ -515,9 +660,14 @@ class SVM:
             if self.r2_score_nu_SVR >= 0:
                 self.r_score_nu_SVR = sqrt(self.r2_score_nu_SVR)
 
-            self.cross_val_scores_nu_SVR = \
-                cross_val_score(self.regressor_nu_SVR, self.attributes,
-                                self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = \
+                self._cross_validate(self.regressor_nu_SVR, timer)
+            self.cross_val_scores_nu_SVR = scores
+            self.cv_estimators["NuSVR"] = estimators
+            self.training_times["NuSVR"] = timer.get_times()
+            timer.print_times()
+            self._report_gap("NuSVR", self.regressor_nu_SVR)
 
             # Output results
             self._output_regressor_results(model="NuSVR")
@@ -559,6 +709,7 @@ class SVM:
             # Train regression model
             # Handle exception if arguments are incorrect and/or labels isn't
             # quantitative data
+            timer = PhaseTimer()
             try:
                 self.regressor_linear_SVR.fit(self.dataset_X_train,
                                               self.dataset_y_train)
@@ -571,6 +722,8 @@ class SVM:
                 self.regressor_linear_SVR = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             y_prediction = self.regressor_linear_SVR.predict(
                 self.dataset_X_test)
@@ -582,9 +735,13 @@ class SVM:
             if self.r2_score_linear_SVR >= 0:
                 self.r_score_linear_SVR = sqrt(self.r2_score_linear_SVR)
 
-            self.cross_val_scores_linear_SVR = \
-                cross_val_score(self.regressor_linear_SVR, self.attributes,
-                                self.labels, cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = \
+                self._cross_validate(self.regressor_linear_SVR, timer)
+            self.cross_val_scores_linear_SVR = scores
+            self.cv_estimators["LinearSVR"] = estimators
+            self.training_times["LinearSVR"] = timer.get_times()
+            timer.print_times()
 
             # Output results
             self._output_regressor_results(model="LinearSVR")
@@ -613,8 +770,296 @@ class SVM:
         print("\nLinearSVR Predictions:\n", y_prediction, "\n")
         return y_prediction
 
+    # Wrapper for bulk scoring
+
+    def predict_bulk(self, dataset_X=None, model="SVC", output=None,
+                     method="predict", chunk_size=10000, n_threads=1):
+        """Predicts each datapoint in dataset_X using the given model, "SVC",
+        "nu_SVC", "linear_SVC", "SVR", "nu_SVR" or "linear_SVR", and its
+        method, "predict", "predict_proba" or "decision_function", on n_threads
+        threads, chunk_size rows at a time, without displaying them. dataset_X
+        can be an array, a sparse matrix, the filename of a .npy file, or a
+        callable returning an iterator over chunks. The predictions are written
+        to output, an array or a .npy or CSV filename, if given. Returns the
+        predictions, or the CSV filename.
+        """
+        models = {"SVC": ("classifier_SVC", "SVC"),
+                  "nu_SVC": ("classifier_nu_SVC", "NuSVC"),
+                  "linear_SVC": ("classifier_linear_SVC", "LinearSVC"),
+                  "SVR": ("regressor_SVR", "SVR"),
+                  "nu_SVR": ("regressor_nu_SVR", "NuSVR"),
+                  "linear_SVR": ("regressor_linear_SVR", "LinearSVR")}
+        if model not in models:
+            print("model must be one of", ", ".join(models) + ".")
+            return None
+
+        # Check that the runner method has already been called
+        attribute, name = models[model]
+        if getattr(self, attribute) is None:
+            print("The", name, "model seems to be missing.",
+                  "Have you called run_" + model + "() yet?")
+            return None
+
+        # Try to score dataset_X
+        # Handle exception if dataset_X or output aren't valid
+        try:
+            return score_model(getattr(self, attribute), name, dataset_X,
+                               output, method, chunk_size, n_threads)
+        except Exception as e:
+            print("The model failed to run. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+    # Wrappers for incremental learning
+
+    def update_SVC(self, X_new=None, y_new=None):
+        """Updates the SVC model with a batch of new labeled data
+        without retraining it from scratch. Returns its score on the new
+        data before the update.
+        """
+        return self._update("classifier_SVC", "SVC", "run_SVC", X_new,
+                            y_new)
+
+    def update_nu_SVC(self, X_new=None, y_new=None):
+        """Updates the NuSVC model with a batch of new labeled data
+        without retraining it from scratch. Returns its score on the new
+        data before the update.
+        """
+        return self._update("classifier_nu_SVC", "NuSVC", "run_nu_SVC", X_new,
+                            y_new)
+
+    def update_linear_SVC(self, X_new=None, y_new=None):
+        """Updates the LinearSVC model with a batch of new labeled data
+        without retraining it from scratch. Returns its score on the new
+        data before the update.
+        """
+        return self._update("classifier_linear_SVC", "LinearSVC",
+                            "run_linear_SVC", X_new, y_new)
+
+    def update_SVR(self, X_new=None, y_new=None):
+        """Updates the SVR model with a batch of new labeled data
+        without retraining it from scratch. Returns its score on the new
+        data before the update.
+        """
+        return self._update("regressor_SVR", "SVR", "run_SVR", X_new,
+                            y_new)
+
+    def update_nu_SVR(self, X_new=None, y_new=None):
+        """Updates the NuSVR model with a batch of new labeled data
+        without retraining it from scratch. Returns its score on the new
+        data before the update.
+        """
+        return self._update("regressor_nu_SVR", "NuSVR", "run_nu_SVR", X_new,
+                            y_new)
+
+    def update_linear_SVR(self, X_new=None, y_new=None):
+        """Updates the LinearSVR model with a batch of new labeled data
+        without retraining it from scratch. Returns its score on the new
+        data before the update.
+        """
+        return self._update("regressor_linear_SVR", "LinearSVR",
+                            "run_linear_SVR", X_new, y_new)
+
+    # Persistence
+
+    def save(self, path):
+        """Writes every fitted SVM model to the directory path, without the
+        dataset, its splits or the results. Returns path.
+        """
+        return save_wrapper(self, path, (
+            "classifier_SVC", "classifier_nu_SVC", "classifier_linear_SVC",
+            "regressor_SVR", "regressor_nu_SVR", "regressor_linear_SVR"),
+            "one of the run methods")
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Returns an SVM holding the models saved in the directory path with
+        save(). Each model is read from disk the first time it is used, with
+        its arrays memory-mapped.
+        """
+        return load_wrapper(cls, path, mmap_mode)
+
     # Helper methods
 
+    def _cross_validate(self, model, timer):
+        """Cross validates model with the shared evaluation engine.
+        Returns the fold scores and the fitted fold estimators.
+        """
+        return cross_validate_model(model, self.attributes, self.labels,
+                                    cv=self.cv, n_jobs=self.cv_n_jobs,
+                                    estimate_only=self.estimate_only,
+                                    timer=timer)
+
+    def _update(self, attribute, name, run, X_new, y_new):
+        """Updates the model stored in attribute with new data. Kernel
+        SVMs are replaced by a kernel approximation on their first update.
+        Returns the model's score on the new data before the update.
+        """
+        # Check that the runner method has already been called
+        model = getattr(self, attribute)
+        if model is None:
+            print("The", name, "model seems to be missing.",
+                  "Have you called " + run + "() yet?")
+            return None
+
+        # Try to update the model
+        # Handle exception if X_new or y_new aren't valid inputs
+        try:
+            score = model.score(X_new, np.ravel(y_new))
+            model = make_online(model, self.dataset_X_train,
+                                self.dataset_y_train)
+            partial_update(model, X_new, y_new, epochs=self.update_epochs)
+        except Exception as e:
+            print("The", name, "model failed to update.",
+                  "Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+        setattr(self, attribute, model)
+        self.update_scores.setdefault(name, []).append(score)
+
+        print("\n" + name, "score on the new data before the update:", score,
+              "\n")
+        return score
+
+    def _search(self, clf, scoring):
+        """Runs the hyperparameter search of clf on the training set.
+        Exhaustive grid searches without a checkpoint compute each kernel
+        matrix once and reuse it for every other parameter and fold.
+        Returns the best parameters.
+        """
+        settings = self.search_settings
+        if self.kernel_cache and settings.get("strategy", "grid") == "grid" \
+                and settings.get("checkpoint") is None:
+            return precomputed_grid_search(
+                clf, self.gs_params, self.dataset_X_train,
+                self.dataset_y_train, scoring=scoring,
+                n_jobs=settings.get("n_jobs", -1),
+                max_memory_mb=self.kernel_cache_mb,
+                directory=self.kernel_cache_dir)
+
+        return run_search(clf, self.gs_params, self.dataset_X_train,
+                          self.dataset_y_train, scoring=scoring, **settings)
+
+    def _approximate(self, model, name):
+        """Returns model, or in large data mode a pipeline of kernel
+        features and a linear model approximating it.
+        """
+        if not self.large_data:
+            return model
+
+        self.exact_models[name] = model
+        n_components = self.n_components
+        if n_components is None:
+            n_components = select_n_components(
+                model, self.dataset_X_train, self.dataset_y_train,
+                approximation=self.approximation,
+                linear_model=self.linear_model)
+
+        return approximate_model(model, self.dataset_X_train, n_components,
+                                 approximation=self.approximation,
+                                 linear_model=self.linear_model)
+
+    def _report_gap(self, name, approximate):
+        """In large data mode, compares the approximation of the named
+        model with the exact kernel SVM on a subsample.
+        """
+        if not self.large_data:
+            return
+
+        self.gap_reports[name] = \
+            gap_report(self.exact_models[name], approximate,
+                       self.dataset_X_train, self.dataset_y_train,
+                       self.dataset_X_test, self.dataset_y_test,
+                       max_samples=self.gap_samples)
+        print_gap_report(self.gap_reports[name])
+
+    def _get_large_data(self):
+        """Prompts for large data mode and its settings. The values set
+        with set_large_data() are the defaults.
+        """
+        while True:
+            user_input = input("Use large data mode: approximate the kernel "
+                               + "and train a linear model "
+                               + ("(Y/n)? " if self.large_data else "(y/N)? ")
+                               ).lower()
+            if user_input == "":
+                break
+            elif user_input == "y":
+                self.large_data = True
+                break
+            elif user_input == "n":
+                self.large_data = False
+                break
+            else:
+                print("Invalid input.")
+
+        print("large_data =", self.large_data)
+
+        if not self.large_data:
+            print()
+            return
+
+        while True:
+            print("\nWhich kernel approximation should be used?")
+            user_input = input("Options: 1-Nystroem, 2-random Fourier "
+                               + "features (rbf kernel only) (default="
+                               + self.approximation + "): ")
+            if user_input == "":
+                break
+            elif user_input == "1":
+                self.approximation = "nystroem"
+                break
+            elif user_input == "2":
+                self.approximation = "rbf_sampler"
+                break
+            else:
+                print("Invalid input.")
+
+        print("approximation =", self.approximation)
+
+        while True:
+            print("\nWhich linear model should be trained?")
+            user_input = input("Options: 1-linear SVM, 2-SGD (default="
+                               + self.linear_model + "): ")
+            if user_input == "":
+                break
+            elif user_input == "1":
+                self.linear_model = "linear_svm"
+                break
+            elif user_input == "2":
+                self.linear_model = "sgd"
+                break
+            else:
+                print("Invalid input.")
+
+        print("linear_model =", self.linear_model)
+
+        while True:
+            user_input = input("\nEnter the number of kernel components, "
+                               + "or 'auto' to choose automatically "
+                               + "(default=" + str(self.n_components or "auto")
+                               + "): ").lower()
+            try:
+                if user_input == "":
+                    break
+                elif user_input == "auto":
+                    self.n_components = None
+                    break
+
+                user_input = int(user_input)
+                if user_input <= 0:
+                    raise Exception
+                else:
+                    self.n_components = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("n_components =", self.n_components, "\n")
+
     def _create_SVC_model(self, is_nu):
         """Runs UI for getting parameters and creating SVC or NuSVC
         model.
@@ -628,6 +1073,8 @@ class SVM:
             print("= SVC Parameter Inputs =")
             print("========================\n")
 
+        self._get_large_data()
+
         print("Default values:", "test_size = 0.25", "cv = 5",
               "graph_results = False", sep="\n")
         if is_nu:
@@ -839,6 +1286,8 @@ class SVM:
                 if break_early:
                     break
 
+                self.search_settings = prompt_search_settings()
+
                 print("\n= End of GridSearch inputs. =")
                 self.gs_params = params
                 best_params = self._run_gridsearch_classifier(is_nu)
@@ -1256,12 +1705,11 @@ class SVM:
         if self.dataset_X_test is None:
             self._split_data()
 
-        # Run GridSearch
-        grid_obj = GridSearchCV(clf, self.gs_params, scoring=acc_scorer)
-        grid_obj = grid_obj.fit(self.dataset_X_train, self.dataset_y_train)
+        # Run the hyperparameter search
+        best_params = self._search(clf, acc_scorer)
 
         # Set the clf to the best combination of parameters
-        clf = grid_obj.best_estimator_
+        clf.set_params(**best_params)
 
         # Fit the best algorithm to the data
         clf.fit(self.dataset_X_train, self.dataset_y_train)
@@ -1269,8 +1717,21 @@ class SVM:
         self.gs_result = accuracy_score(self.dataset_y_test, predictions)
 
         # Return the best parameters
-        print("\nBest GridSearch Parameters:\n", grid_obj.best_params_, "\n")
-        return grid_obj.best_params_
+        print("\nBest GridSearch Parameters:\n", best_params, "\n")
+        return best_params
+
+    def _run_regularization_path(self, model, C_values):
+        """Tunes C for the LinearSVC model given in run_linear_SVC() along
+        a regularization path. Returns the best C."""
+        if self.dataset_X_test is None:
+            self._split_data()
+
+        best_params = path_search(model, {"C": C_values},
+                                  self.dataset_X_train, self.dataset_y_train,
+                                  scoring=make_scorer(accuracy_score))
+
+        print("\nBest C:", best_params["C"], "\n")
+        return best_params["C"]
 
     def _create_linear_SVC_model(self):
         """Runs UI for getting parameters and creating LinearSVC model."""
@@ -1459,10 +1920,14 @@ class SVM:
             while True:
                 print("\nShould the algorithm solve the duel or primal",
                       "optimization problem?")
-                user_input = input("Enter 1 for dual, or 2 for primal: ")
+                user_input = input("Enter 1 for dual, 2 for primal, or 3 to "
+                                   + "choose automatically: ")
                 if user_input == "2":
                     dual = False
                     break
+                elif user_input == "3":
+                    dual = "auto"
+                    break
                 elif user_input in {"1", ""}:
                     break
                 elif user_input.lower() == "q":
@@ -1501,8 +1966,9 @@ class SVM:
                 break
 
             while True:
-                user_input = \
-                    input("\nEnter a positive regularization parameter C: ")
+                print("\nEnter a positive regularization parameter C, or a",
+                      "list of them to tune C along a regularization path.")
+                user_input = input("Example input: 0.01,0.1,1,10: ")
                 try:
                     if user_input == "":
                         break
@@ -1510,11 +1976,12 @@ class SVM:
                         break_early = True
                         break
 
-                    user_input = float(user_input)
-                    if user_input <= 0:
-                        raise Exception
+                    C_values = list(map(float, user_input.split(",")))
+                    for num in C_values:
+                        if num <= 0:
+                            raise Exception
 
-                    C = user_input
+                    C = C_values[0] if len(C_values) == 1 else C_values
                     break
                 except Exception:
                     print("Invalid input.")
@@ -1625,11 +2092,19 @@ class SVM:
         print("= End of inputs; press enter to continue. =")
         input("===========================================\n")
 
-        return LinearSVC(penalty=penalty, loss=loss, dual=dual, tol=tol, C=C,
-                         multi_class=multi_class, fit_intercept=fit_intercept,
-                         intercept_scaling=intercept_scaling,
-                         class_weight=class_weight, verbose=verbose,
-                         random_state=random_state, max_iter=max_iter)
+        if dual == "auto":
+            dual = select_dual(self.attributes, penalty, loss)
+            print("dual =", dual)
+
+        model = LinearSVC(penalty=penalty, loss=loss, dual=dual, tol=tol,
+                          multi_class=multi_class, fit_intercept=fit_intercept,
+                          intercept_scaling=intercept_scaling,
+                          class_weight=class_weight, verbose=verbose,
+                          random_state=random_state, max_iter=max_iter)
+
+        if isinstance(C, list):
+            C = self._run_regularization_path(model, C)
+        return model.set_params(C=C)
 
     def _create_SVR_model(self, is_nu):
         """Runs UI for getting parameters and creates SVR or NuSVR model."""
@@ -1642,6 +2117,8 @@ class SVM:
             print("= SVR Parameter Inputs =")
             print("========================\n")
 
+        self._get_large_data()
+
         print("Default values:", "test_size = 0.25", "cv = 5", sep="\n")
         if is_nu:
             print("nu = 0.5")
@@ -1869,6 +2346,8 @@ class SVM:
                 if break_early:
                     break
 
+                self.search_settings = prompt_search_settings()
+
                 print("\n= End of GridSearch inputs. =")
                 self.gs_params = params
                 best_params = self._run_gridsearch_regressor(is_nu)
@@ -2209,20 +2688,19 @@ class SVM:
         if self.dataset_X_test is None:
             self._split_data()
 
-        # Run GridSearch
-        grid_obj = GridSearchCV(clf, self.gs_params, scoring="r2")
-        grid_obj = grid_obj.fit(self.dataset_X_train, self.dataset_y_train)
+        # Run the hyperparameter search
+        best_params = self._search(clf, "r2")
 
         # Set the clf to the best combination of parameters
-        clf = grid_obj.best_estimator_
+        clf.set_params(**best_params)
 
         # Fit the best algorithm to the data
         clf.fit(self.dataset_X_train, self.dataset_y_train)
         self.gs_result = clf.score(self.dataset_X_test, self.dataset_y_test)
 
         # Return the best parameters
-        print("\nBest GridSearch Parameters:\n", grid_obj.best_params_, "\n")
-        return grid_obj.best_params_
+        print("\nBest GridSearch Parameters:\n", best_params, "\n")
+        return best_params
 
     def _create_linear_SVR_model(self):
         """Runs UI for getting parameters and creates LinearSVR model."""
@@ -2699,6 +3177,13 @@ class SVM:
                   "new_labels should be a populated dataset of classes.")
             return False
 
+        # Splitting needs sparse attributes in a row-sliceable format
+        if not is_sliceable(self.attributes):
+            print("attributes is a sparse matrix that can't be sliced by",
+                  "rows; call set_attributes(new_attributes.tocsr()) to",
+                  "fix this!")
+            return False
+
         # Check if attributes and labels have same number of rows (samples)
         if self.attributes.shape[0] != self.labels.shape[0]:
             print("attributes and labels don't have the same number of rows.",
@@ -0,0 +1,533 @@
+"""tree_inference compiles fitted random forests and XGBoost models into
+flat NumPy arrays for fast prediction.
+
+Every tree of the ensemble is flattened into shared node arrays (the
+feature and threshold of each split, its left and right children, where
+missing values go, and the value of each leaf) and the whole batch of
+datapoints walks down every tree at once with vectorized NumPy indexing,
+one tree level per step. Leaf values are added up tree after tree in the
+same order and precision as scikit-learn and XGBoost do, so the compiled
+model predicts exactly what the original model predicts, without the
+per-call overhead of the original model or the structures it only needs
+for training. A compiled model can also be written out as a standalone
+Python module that only needs NumPy.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import inspect
+import json
+import os
+
+import numpy as np
+from sklearn.base import is_classifier
+from sklearn.ensemble import (ExtraTreesClassifier, ExtraTreesRegressor,
+                              RandomForestClassifier, RandomForestRegressor)
+
+try:
+    import xgboost as xgb
+except ImportError:         # only needed to compile XGBoost models
+    xgb = None
+
+from ..runtime import replace_file
+
+FORESTS = (RandomForestClassifier, RandomForestRegressor,
+           ExtraTreesClassifier, ExtraTreesRegressor)
+
+# Output transformations of the XGBoost objectives and the inverse
+# transformation that turns base_score into a margin
+_LOGISTIC_OBJECTIVES = ("binary:logistic", "reg:logistic", "binary:logitraw")
+_EXP_OBJECTIVES = ("count:poisson", "reg:gamma", "reg:tweedie")
+_SOFTMAX_OBJECTIVES = ("multi:softprob", "multi:softmax")
+_IDENTITY_OBJECTIVES = ("reg:squarederror", "reg:linear",
+                        "reg:squaredlogerror", "reg:pseudohubererror",
+                        "reg:absoluteerror", "reg:quantileerror")
+
+# Number of (datapoint, tree) pairs walked at once by default
+_CHUNK_CELLS = 2 ** 20
+
+_COMPILED_FILE = "compiled.json"
+
+# Number of rows of a wrapper's dataset a compiled model is checked on
+VERIFY_ROWS = 1000
+
+
+def _dense_chunk(model, X):
+    """Returns a chunk of attributes as a float32 array, the precision
+    both libraries split on, with missing values as NaN.
+    """
+    if hasattr(X, "tocoo"):
+        X = X.tocoo()
+        if model["sparse_missing"]:
+            # XGBoost treats the entries a sparse matrix doesn't store as
+            # missing, not as zeros
+            dense = np.full(X.shape, np.nan, dtype=np.float32)
+        else:
+            dense = np.zeros(X.shape, dtype=np.float32)
+        dense[X.row, X.col] = X.data
+        X = dense
+    else:
+        X = np.asarray(X, dtype=np.float32)
+
+    missing = float(model["missing"])
+    if not np.isnan(missing):
+        X = np.where(X == missing, np.float32(np.nan), X)
+    return X
+
+
+def _traverse(model, X):
+    """Returns the leaf reached by every datapoint of X in every tree.
+    Leaves are their own children, so datapoints that reach a leaf early
+    stay there for the remaining levels.
+    """
+    feature, threshold = model["feature"], model["threshold"]
+    left, right = model["left"], model["right"]
+    node = np.repeat(model["roots"][np.newaxis], X.shape[0], axis=0)
+    rows = np.arange(X.shape[0])[:, np.newaxis]
+    has_missing = np.isnan(X).any()
+
+    for _ in range(int(model["depth"])):
+        values = X[rows, feature[node]]
+        go_left = values <= threshold[node]
+        if has_missing:
+            go_left = np.where(np.isnan(values), model["default_left"][node],
+                               go_left)
+        node = np.where(go_left, left[node], right[node])
+    return node
+
+
+def _scores(model, node):
+    """Adds up the leaf values of each output group, starting from its
+    base score and adding the trees one after the other, as the original
+    model does, so the floating point results are identical.
+    """
+    value, groups, base = model["value"], model["groups"], model["base"]
+    n_columns = value.shape[1]
+    scores = np.empty((node.shape[0], len(base) * n_columns),
+                      dtype=value.dtype)
+
+    for group in range(len(base)):
+        trees = np.flatnonzero(groups == group)
+        # Reducing over the leading axis adds the trees in order
+        leaf_values = value[node[:, trees].T]
+        scores[:, group * n_columns:(group + 1) * n_columns] = \
+            np.add.reduce(leaf_values, axis=0, initial=base[group])
+
+    if model["average"]:
+        scores /= node.shape[1]
+    return scores
+
+
+def _outputs(model, scores):
+    """Returns the predictions and, for classifiers, the class
+    probabilities of the summed scores.
+    """
+    link = str(model["link"])
+    if link == "exp":
+        scores = np.exp(scores)
+    elif link == "sigmoid":
+        scores = np.float32(1) / (np.float32(1) + np.exp(-scores))
+    elif link == "softmax":
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        scores /= scores.sum(axis=1, keepdims=True)
+
+    classes = model["classes"]
+    if len(classes) == 0:
+        return (scores[:, 0] if scores.shape[1] == 1 else scores), None
+    if scores.shape[1] == 1 and len(classes) == 2:
+        # A binary XGBoost classifier outputs the second class' probability
+        probas = np.hstack([np.float32(1) - scores, scores])
+        return classes[(scores[:, 0] > 0.5).astype(int)], probas
+    return classes.take(np.argmax(scores, axis=1)), scores
+
+
+def _predict(model, X, chunk_size=None):
+    """Predicts X chunk by chunk. Returns the predictions and the class
+    probabilities, which are None for regressors.
+    """
+    if not hasattr(X, "shape"):
+        X = np.asarray(X)
+    if chunk_size is None:
+        chunk_size = max(1, _CHUNK_CELLS // (len(model["roots"])
+                                             * model["value"].shape[1]))
+
+    predictions, probas = [], []
+    for start in range(0, X.shape[0], chunk_size):
+        chunk = _dense_chunk(model, X[start:start + chunk_size])
+        prediction, proba = _outputs(model,
+                                     _scores(model, _traverse(model, chunk)))
+        predictions.append(prediction)
+        probas.append(proba)
+
+    if not predictions:
+        raise ValueError("X contains no datapoints.")
+    if probas[0] is None:
+        return np.concatenate(predictions), None
+    return np.concatenate(predictions), np.concatenate(probas)
+
+
+_MODULE_HEADER = '''"""Predictor generated by ManufacturingNet from a fitted
+{name}. It only needs NumPy and the node arrays in {arrays}, which
+must be kept next to this file.
+
+predict(X) and predict_proba(X) take a 2D array of attributes.
+"""
+
+import os
+
+import numpy as np
+
+_CHUNK_CELLS = {chunk_cells}
+'''
+
+_MODULE_FOOTER = '''
+_directory = os.path.dirname(os.path.abspath(__file__))
+_model = dict(np.load(os.path.join(_directory, "{arrays}"),
+                      allow_pickle=True))
+
+
+def predict(X, chunk_size=None):
+    """Returns the predictions of X."""
+    return _predict(_model, X, chunk_size)[0]
+
+
+def predict_proba(X, chunk_size=None):
+    """Returns the class probabilities of X; None for regressors."""
+    return _predict(_model, X, chunk_size)[1]
+'''
+
+
+class CompiledForest:
+    """A tree ensemble compiled to flat node arrays. Create one with
+    compile_model().
+
+    predict() and predict_proba() take dense arrays or sparse matrices
+    and walk chunk_size datapoints down all trees at once; by default,
+    chunks hold about a million (datapoint, tree) pairs.
+    """
+
+    def __init__(self, arrays, name):
+        """Initializes a CompiledForest from its node arrays."""
+        self.arrays = arrays
+        self.name = name
+
+    @property
+    def n_trees(self):
+        """Returns the number of trees."""
+        return len(self.arrays["roots"])
+
+    def nbytes(self):
+        """Returns the memory taken by the node arrays, in bytes."""
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def predict(self, X, chunk_size=None):
+        """Predicts the output, or class, of each datapoint in X."""
+        return _predict(self.arrays, X, chunk_size)[0]
+
+    def predict_proba(self, X, chunk_size=None):
+        """Returns the class probabilities of each datapoint in X."""
+        probas = _predict(self.arrays, X, chunk_size)[1]
+        if probas is None:
+            raise ValueError("Only classifiers predict class probabilities.")
+        return probas
+
+    def export_module(self, filename):
+        """Writes a standalone Python module to filename whose predict()
+        and predict_proba() only need NumPy. The node arrays are saved
+        next to it, in a .npz file of the same name. Returns filename.
+        """
+        arrays_file = os.path.splitext(filename)[0] + ".npz"
+        np.savez(arrays_file, **self.arrays)
+
+        functions = (_dense_chunk, _traverse, _scores, _outputs, _predict)
+        source = _MODULE_HEADER.format(
+            name=self.name, arrays=os.path.basename(arrays_file),
+            chunk_cells=_CHUNK_CELLS)
+        for function in functions:
+            source += "\n\n" + inspect.getsource(function)
+        source += _MODULE_FOOTER.format(
+            arrays=os.path.basename(arrays_file))
+
+        with open(filename, "w") as file:
+            file.write(source)
+        return filename
+
+    def save(self, directory):
+        """Writes the node arrays to directory as .npy files, which load()
+        memory-maps. Every file is replaced whole, so a CompiledForest
+        memory-mapped from directory can be saved back to it.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for key, array in self.arrays.items():
+            replace_file(os.path.join(directory, key + ".npy"),
+                         lambda filename, array=array: np.save(
+                             filename, array,
+                             allow_pickle=array.dtype == object))
+
+        def write_info(filename):
+            with open(filename, "w") as file:
+                json.dump({"name": self.name, "arrays": list(self.arrays)},
+                          file)
+        replace_file(os.path.join(directory, _COMPILED_FILE), write_info)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Returns the CompiledForest saved in directory, with its node
+        arrays memory-mapped, so processes loading it share one copy.
+        """
+        with open(os.path.join(directory, _COMPILED_FILE)) as file:
+            info = json.load(file)
+
+        arrays = {}
+        for key in info["arrays"]:
+            filename = os.path.join(directory, key + ".npy")
+            try:
+                array = np.load(filename, mmap_mode=mmap_mode)
+            except ValueError:
+                # Classes of mixed types are Python objects, which can't
+                # be memory-mapped
+                array = np.load(filename, allow_pickle=True)
+            # Settings are small; keep them as plain arrays
+            arrays[key] = np.array(array) if array.ndim == 0 else array
+        return cls(arrays, info["name"])
+
+
+def _float32_at_most(threshold):
+    """Returns the largest float32 values not above the float64
+    thresholds. For float32 attributes x, x <= threshold holds exactly
+    when x <= the returned value does.
+    """
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def _depth(left, right, roots):
+    """Returns the depth of the deepest leaf of all trees."""
+    depth, nodes = 0, roots
+    while True:
+        inner = nodes[left[nodes] != nodes]
+        if len(inner) == 0:
+            return depth
+        nodes = np.concatenate([left[inner], right[inner]])
+        depth += 1
+
+
+def _link(trees, **arrays):
+    """Concatenates the node arrays of trees, a list of dicts holding each
+    tree's arrays with local child indices (-1 for leaves), into the
+    arrays of a CompiledForest.
+    """
+    offsets = np.cumsum([0] + [len(tree["left"]) for tree in trees])
+    left, right = [], []
+    for offset, tree in zip(offsets, trees):
+        index = np.arange(len(tree["left"])) + offset
+        leaf = tree["left"] == -1
+        # Leaves are their own children
+        left.append(np.where(leaf, index, tree["left"] + offset))
+        right.append(np.where(leaf, index, tree["right"] + offset))
+
+    arrays.update({
+        "feature": np.concatenate([np.maximum(tree["feature"], 0)
+                                   for tree in trees]).astype(np.int32),
+        "threshold": np.concatenate([tree["threshold"] for tree in trees]),
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "default_left": np.concatenate([tree["default_left"]
+                                        for tree in trees]).astype(bool),
+        "value": np.concatenate([tree["value"] for tree in trees]),
+        "roots": offsets[:-1].astype(np.int32)})
+    arrays["depth"] = np.array(_depth(arrays["left"], arrays["right"],
+                                      arrays["roots"]))
+    return arrays
+
+
+def _compile_forest(model):
+    """Compiles a fitted scikit-learn random forest or extra trees model.
+    The leaf values of classifiers are normalized to probabilities, as
+    predict_proba() does.
+    """
+    if model.n_outputs_ != 1:
+        raise ValueError("Forests with several outputs can't be compiled.")
+
+    classifier = is_classifier(model)
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :]
+        if classifier:
+            value = value[:, :model.n_classes_]
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+        default_left = getattr(tree, "missing_go_to_left",
+                               np.zeros(tree.node_count, dtype=bool))
+
+        trees.append({"feature": tree.feature,
+                      "threshold": _float32_at_most(tree.threshold),
+                      "left": tree.children_left,
+                      "right": tree.children_right,
+                      "default_left": np.asarray(default_left),
+                      "value": np.asarray(value, dtype=np.float64)})
+
+    classes = np.asarray(model.classes_) if classifier else np.array([])
+    return CompiledForest(_link(
+        trees, groups=np.zeros(len(trees), dtype=np.int32),
+        base=np.zeros(1), average=np.array(True), link=np.array("identity"),
+        classes=classes, missing=np.array(np.nan),
+        sparse_missing=np.array(False)), type(model).__name__)
+
+
+def _parse_base_score(base_score, n_groups):
+    """Returns XGBoost's base_score for each output group. It is saved as
+    a number or, in newer versions, as a list of one number per output.
+    """
+    values = np.array([float(value) for value in
+                       str(base_score).strip("[]").split(",")
+                       if value.strip()], dtype=np.float32)
+    if len(values) == 1:
+        return np.repeat(values, n_groups)
+    if len(values) != n_groups:
+        raise ValueError("Models with several targets can't be compiled.")
+    return values
+
+
+def _compile_xgboost(model, n_iterations=None):
+    """Compiles a fitted XGBClassifier, XGBRegressor or Booster. The
+    scikit-learn wrappers use the trees up to their best early stopping
+    iteration, as their predict() does.
+    """
+    booster = model.get_booster() if hasattr(model, "get_booster") \
+        else model
+    if n_iterations is None and hasattr(model, "get_booster"):
+        try:
+            n_iterations = model.best_iteration + 1
+        except AttributeError:
+            n_iterations = None
+
+    learner = json.loads(bytes(booster.save_raw(raw_format="json")))
+    learner = learner["learner"]
+    if learner["gradient_booster"]["name"] != "gbtree":
+        raise ValueError("Only gbtree boosters can be compiled, not "
+                         + learner["gradient_booster"]["name"] + ".")
+    params = learner["learner_model_param"]
+    if int(params.get("num_target", 1)) > 1:
+        raise ValueError("Models with several targets can't be compiled.")
+
+    objective = learner["objective"]["name"]
+    n_groups = max(int(params["num_class"]), 1)
+    base_score = _parse_base_score(params["base_score"], n_groups)
+    if objective in _LOGISTIC_OBJECTIVES:
+        link = "identity" if objective == "binary:logitraw" else "sigmoid"
+        base = -np.log(np.float32(1) / base_score - np.float32(1))
+    elif objective in _EXP_OBJECTIVES:
+        link, base = "exp", np.log(base_score)
+    elif objective in _SOFTMAX_OBJECTIVES:
+        link, base = "softmax", base_score
+    elif objective in _IDENTITY_OBJECTIVES:
+        link, base = "identity", base_score
+    else:
+        raise ValueError("The " + objective + " objective isn't supported.")
+
+    gbtree = learner["gradient_booster"]["model"]
+    tree_data, groups = gbtree["trees"], gbtree["tree_info"]
+    if n_iterations is not None:
+        n_parallel = int(gbtree["gbtree_model_param"]["num_parallel_tree"])
+        n_kept = n_iterations * n_parallel * n_groups
+        tree_data, groups = tree_data[:n_kept], groups[:n_kept]
+
+    trees = []
+    for data in tree_data:
+        if any(data.get("split_type", [])):
+            raise ValueError("Models with categorical splits can't be "
+                             + "compiled.")
+        left = np.asarray(data["left_children"], dtype=np.int64)
+        condition = np.asarray(data["split_conditions"], dtype=np.float32)
+        leaf = left == -1
+        # XGBoost goes left when x < condition, that is, for float32 x,
+        # when x <= the float32 value just below condition
+        threshold = np.where(leaf, condition,
+                             np.nextafter(condition, np.float32(-np.inf)))
+        trees.append({"feature": np.asarray(data["split_indices"]),
+                      "threshold": threshold.astype(np.float32),
+                      "left": left,
+                      "right": np.asarray(data["right_children"],
+                                          dtype=np.int64),
+                      "default_left": np.asarray(data["default_left"]),
+                      "value": np.where(leaf, condition,
+                                        np.float32(0))[:, np.newaxis]})
+
+    classes = np.array([])
+    if hasattr(model, "classes_") and is_classifier(model):
+        classes = np.asarray(model.classes_)
+    missing = getattr(model, "missing", np.nan)
+    return CompiledForest(_link(
+        trees, groups=np.asarray(groups, dtype=np.int32),
+        base=base.astype(np.float32),
+        average=np.array(False), link=np.array(link), classes=classes,
+        missing=np.array(np.nan if missing is None else missing),
+        sparse_missing=np.array(True)), type(model).__name__)
+
+
+def compile_model(model, n_iterations=None):
+    """Returns the CompiledForest of a fitted random forest, extra trees,
+    XGBClassifier, XGBRegressor or XGBoost Booster. n_iterations limits
+    XGBoost models to their first boosting rounds.
+    """
+    if isinstance(model, FORESTS):
+        return _compile_forest(model)
+    if xgb is not None and isinstance(model, (xgb.XGBModel, xgb.Booster)):
+        return _compile_xgboost(model, n_iterations)
+    raise ValueError(type(model).__name__ + " can't be compiled.")
+
+
+def compile_verified(model, sample, n_iterations=None):
+    """Returns the CompiledForest of model, as compile_model() does, after
+    checking that it predicts exactly what model predicts on sample.
+    Raises ValueError if it doesn't.
+    """
+    compiled = compile_model(model, n_iterations)
+    if not np.array_equal(compiled.predict(sample), model.predict(sample)):
+        raise ValueError("The compiled model's predictions differ from the "
+                         + "model's.")
+    return compiled
+
+
+def compile_attribute(wrapper, attribute, run):
+    """Compiles the model stored in the given attribute of a shallow
+    learning wrapper, checking it on the first VERIFY_ROWS rows of the
+    wrapper's attributes, and stores it in compiled_<attribute>. Returns
+    the compiled model, or None if the model is missing or can't be
+    compiled exactly.
+    """
+    # Check that the runner method has already been called
+    model = getattr(wrapper, attribute)
+    if model is None:
+        print("The", attribute, "model seems to be missing.",
+              "Have you called " + run + "() yet?")
+        return None
+
+    # Try to compile the model
+    # Handle exception if the model's structure isn't supported
+    try:
+        compiled = compile_verified(model, wrapper.attributes[:VERIFY_ROWS])
+    except Exception as e:
+        print("The", attribute, "model failed to compile; it won't be used.")
+        print("Here is the exception message:")
+        print(e)
+        return None
+
+    setattr(wrapper, "compiled_" + attribute, compiled)
+    print("\nCompiled", compiled.n_trees, "trees into",
+          round(compiled.nbytes() / 1e6, 2), "MB of node arrays.\n")
+    return compiled
+
+
+def predictor(wrapper, attribute):
+    """Returns the compiled form of the model stored in the given
+    attribute of a shallow learning wrapper if there is one, or the model
+    itself.
+    """
+    compiled = getattr(wrapper, "compiled_" + attribute)
+    return getattr(wrapper, attribute) if compiled is None else compiled
@@ -6,26 +6,43 @@ Classification and regression are both supported.
 View the documentation at https://manufacturingnet.readthedocs.io/.
 """
 
+import os
+from functools import partial
 from math import sqrt
 
 import matplotlib.pyplot as plt
 import numpy as np
 from sklearn.metrics import (accuracy_score, confusion_matrix, make_scorer,
                              mean_squared_error, roc_auc_score, roc_curve)
-from sklearn.model_selection import (GridSearchCV, cross_val_score,
-                                     train_test_split)
+from sklearn.model_selection import train_test_split
 from xgboost import XGBClassifier, XGBRegressor
 
+from ..runtime import write_metadata
+from .bulk_scoring import format_summary, score_bulk, score_model
+from .persistence import load_wrapper, save_wrapper
+from .search import prompt_search_settings, run_search
+from .shallow_evaluation import PhaseTimer, cross_validate_model
+from .sparse_inputs import is_sliceable
+from .tree_inference import compile_attribute, predictor
+from .xgb_training import (BoosterEstimator, SharedDMatrix, booster_params,
+                           continue_boosting, performance_params,
+                           predict_booster, row_indices, train_external_memory)
+
 
 class XGBoost:
     """Class framework for XGBoost's classification and regression
     functionality.
     """
 
-    def __init__(self, attributes=None, labels=None):
+    def __init__(self, attributes=None, labels=None, cv_n_jobs=None,
+                 estimate_only=False):
         """Initializes an XGBoost object."""
         self.attributes = attributes
         self.labels = labels
+        self.cv_n_jobs = cv_n_jobs
+        self.estimate_only = estimate_only
+        self.cv_estimators = {}
+        self.training_times = {}
 
         self.test_size = None
         self.cv = None
@@ -36,6 +53,16 @@ class XGBoost:
         self.gridsearch = False
         self.gs_params = None
         self.gs_result = None
+        self.search_settings = {}
+        self.performance_mode = False
+        self.early_stopping_rounds = 10
+        self.validation_fraction = 0.1
+        self.shared_data = None
+        self.external_booster = None
+        self.update_rounds = 10
+        self.update_scores = {}
+        self.compiled_classifier = None
+        self.compiled_regressor = None
 
         self.regressor = None
         self.mean_squared_error = None
@@ -43,6 +70,7 @@ class XGBoost:
         self.r_score = None
         self.cross_val_scores_regressor = None
         self.feature_importances_regressor = None
+        self.best_iteration_regressor = None
 
         self.classifier = None
         self.accuracy = None
@@ -51,6 +79,7 @@ class XGBoost:
         self.classes = None
         self.cross_val_scores_classifier = None
         self.feature_importances_classifier = None
+        self.best_iteration_classifier = None
 
     # Accessor methods
 
@@ -114,15 +143,83 @@ class XGBoost:
         """Accessor method for roc-auc."""
         return self.roc_auc
 
+    def get_best_iteration_classifier(self):
+        """Accessor method for best_iteration_classifier."""
+        return self.best_iteration_classifier
+
+    def get_best_iteration_regressor(self):
+        """Accessor method for best_iteration_regressor."""
+        return self.best_iteration_regressor
+
+    def get_external_booster(self):
+        """Accessor method for external_booster."""
+        return self.external_booster
+
+    def get_cv_estimators(self):
+        """Accessor method for cv_estimators, the fitted cross validation
+        fold estimators of each model.
+        """
+        return self.cv_estimators
+
+    def get_training_times(self):
+        """Accessor method for training_times, the wall-clock and compute
+        time of each training phase of each model.
+        """
+        return self.training_times
+
+    def get_update_scores(self):
+        """Accessor method for update_scores, the score of each model on
+        each batch of new data before it was updated with it.
+        """
+        return self.update_scores
+
+    def get_compiled_classifier(self):
+        """Accessor method for compiled_classifier."""
+        return self.compiled_classifier
+
+    def get_compiled_regressor(self):
+        """Accessor method for compiled_regressor."""
+        return self.compiled_regressor
+
     # Modifier methods
 
     def set_attributes(self, new_attributes=None):
         """Modifier method for attributes."""
         self.attributes = new_attributes
+        self.shared_data = None
 
     def set_labels(self, new_labels=None):
         """Modifier method for labels."""
         self.labels = new_labels
+        self.shared_data = None
+
+    def set_cv_n_jobs(self, new_cv_n_jobs=None):
+        """Modifier method for cv_n_jobs, the number of cross validation
+        folds run in parallel.
+        """
+        self.cv_n_jobs = new_cv_n_jobs
+
+    def set_estimate_only(self, new_estimate_only=False):
+        """Modifier method for estimate_only. If True, cross validation is
+        skipped and the holdout score is the only estimate.
+        """
+        self.estimate_only = new_estimate_only
+
+    def set_performance_mode(self, new_performance_mode=False,
+                             new_early_stopping_rounds=10,
+                             new_validation_fraction=0.1):
+        """Modifier method for performance_mode, early_stopping_rounds
+        and validation_fraction.
+        """
+        self.performance_mode = new_performance_mode
+        self.early_stopping_rounds = new_early_stopping_rounds
+        self.validation_fraction = new_validation_fraction
+
+    def set_update_rounds(self, new_update_rounds=10):
+        """Modifier method for update_rounds, the number of boosting
+        rounds each update adds.
+        """
+        self.update_rounds = new_update_rounds
 
     # Wrapper for regression functionality
 
@@ -131,6 +228,7 @@ class XGBoost:
         if self._check_inputs():
             # Initialize regressor
             self.regressor = self._create_model(classifier=False)
+            self.compiled_regressor = None
 
             # Split dataset into testing and training data
             dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test = \
@@ -139,8 +237,10 @@ class XGBoost:
 
             # Train the model and get resultant coefficients
             # Handle exception if arguments aren't correct
+            timer = PhaseTimer()
             try:
-                self.regressor.fit(dataset_X_train, dataset_y_train)
+                self.best_iteration_regressor = \
+                    self._fit(self.regressor, dataset_X_train, dataset_y_train)
             except Exception as e:
                 print("An exception occurred while training the regression",
                       "model. Check your inputs and try again.")
@@ -150,6 +250,8 @@ class XGBoost:
                 self.regressor = None
                 return
 
+            timer.mark("fit")
+
             # Make predictions using testing set
             y_prediction = self.regressor.predict(dataset_X_test)
 
@@ -161,9 +263,13 @@ class XGBoost:
             if self.r2_score >= 0:
                 self.r_score = sqrt(self.r2_score)
 
-            self.cross_val_scores_regressor = \
-                cross_val_score(self.regressor, self.attributes, self.labels,
-                                cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = self._cross_validate(self.regressor, timer)
+            self.cross_val_scores_regressor = scores
+            self.cv_estimators["XGBRegressor"] = estimators
+            self.training_times["XGBRegressor"] = timer.get_times()
+            timer.print_times()
+
             try:
                 self.feature_importances_regressor = \
                     self.regressor.feature_importances_
@@ -188,7 +294,7 @@ class XGBoost:
         # Try to make the prediction
         # Handle exception if dataset_X isn't a valid input
         try:
-            y_prediction = self.regressor.predict(dataset_X)
+            y_prediction = predictor(self, "regressor").predict(dataset_X)
         except Exception as e:
             print("The model failed to run. Check your inputs and try again.")
             print("Here is the exception message:")
@@ -205,6 +311,7 @@ class XGBoost:
         if self._check_inputs():
             # Initialize classifier
             self.classifier = self._create_model(classifier=True)
+            self.compiled_classifier = None
 
             # Split dataset into testing and training data
             dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test = \
@@ -213,8 +320,11 @@ class XGBoost:
 
             # Train the model and get resultant coefficients
             # Handle exception if arguments aren't correct
+            timer = PhaseTimer()
             try:
-                self.classifier.fit(dataset_X_train, np.ravel(dataset_y_train))
+                self.best_iteration_classifier = \
+                    self._fit(self.classifier, dataset_X_train,
+                              np.ravel(dataset_y_train))
             except Exception as e:
                 print("An exception occurred while training the",
                       "classification model. Check your inputs and try again.")
@@ -223,6 +333,8 @@ class XGBoost:
                 self.classifier = None
                 return
 
+            timer.mark("fit")
+
             # Metrics
             y_prediction = self.classifier.predict(dataset_X_test)
             probas = self.classifier.predict_proba(dataset_X_test)
@@ -240,9 +352,13 @@ class XGBoost:
                 self.confusion_matrix = \
                     confusion_matrix(dataset_y_test, y_prediction)
 
-            self.cross_val_scores_classifier = \
-                cross_val_score(self.classifier, self.attributes, self.labels,
-                                cv=self.cv)
+            timer.mark("holdout_evaluation")
+            scores, estimators = self._cross_validate(self.classifier, timer)
+            self.cross_val_scores_classifier = scores
+            self.cv_estimators["XGBClassifier"] = estimators
+            self.training_times["XGBClassifier"] = timer.get_times()
+            timer.print_times()
+
             try:
                 self.feature_importances_classifier = \
                     self.classifier.feature_importances_
@@ -266,7 +382,7 @@ class XGBoost:
         # Try to make the prediction
         # Handle exception if dataset_X isn't a valid input
         try:
-            y_prediction = self.classifier.predict(dataset_X)
+            y_prediction = predictor(self, "classifier").predict(dataset_X)
         except Exception as e:
             print("The model failed to run. Check your inputs and try again.")
             print("Here is the exception message:")
@@ -276,8 +392,343 @@ class XGBoost:
         print("\nXGBClassifier Predictions:\n", y_prediction, "\n")
         return y_prediction
 
+    # Wrapper for external memory training
+
+    def run_external_memory(self, batches, classifier=False, validation=None,
+                            cache_prefix=None, quantile=False,
+                            num_class=None):
+        """Trains a booster on a dataset too large for memory, streamed
+        from disk in batches of (attributes, labels) pairs. batches is a
+        sequence of pairs, such as memory-mapped .npy arrays, or a
+        callable returning an iterator over them. validation is an
+        optional (attributes, labels) pair used for early stopping.
+
+        The parameters are prompted for as in run_classifier() and
+        run_regressor(); the histogram tree method is always used. Class
+        labels must be encoded as 0..k-1. Returns the booster.
+        """
+        model = self._create_model(classifier)
+
+        try:
+            self.external_booster = \
+                train_external_memory(model, batches, validation=validation,
+                                      cache_prefix=cache_prefix,
+                                      quantile=quantile, num_class=num_class)
+        except Exception as e:
+            print("An exception occurred while training the model with",
+                  "external memory. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            self.external_booster = None
+            return None
+
+        best_iteration = getattr(self.external_booster, "best_iteration",
+                                 None)
+        if best_iteration is not None:
+            print("\nEarly stopping kept", best_iteration + 1, "trees.")
+
+        print("\nCall predict_external_memory() to make predictions for new",
+              "data.")
+        return self.external_booster
+
+    def predict_external_memory(self, dataset_X=None, classes=None):
+        """Predicts the output of each datapoint in dataset_X using the
+        booster from run_external_memory(). Class indices are mapped
+        through classes when given. Returns the predictions.
+        """
+        if self.external_booster is None:
+            print("The external memory booster seems to be missing.",
+                  "Have you called run_external_memory() yet?")
+            return None
+
+        try:
+            y_prediction = predict_booster(self.external_booster, dataset_X,
+                                           classes)
+        except Exception as e:
+            print("The model failed to run. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+        print("\nXGBoost Predictions:\n", y_prediction, "\n")
+        return y_prediction
+
+    # Wrapper for bulk scoring
+
+    def predict_bulk(self, dataset_X=None, model="classifier", output=None,
+                     method="predict", chunk_size=10000, n_threads=1,
+                     classes=None):
+        """Predicts each datapoint in dataset_X using the given model,
+        "classifier", "regressor" or "external_memory", and its method,
+        "predict" or "predict_proba", on n_threads threads, chunk_size rows
+        at a time, without displaying them. dataset_X can be an array, a
+        sparse matrix, the filename of a .npy file, or a callable returning
+        an iterator over chunks. The predictions are written to output, an
+        array or a .npy or CSV filename, if given. Class indices of the
+        external memory booster are mapped through classes when given.
+        Returns the predictions, or the CSV filename.
+        """
+        attributes = {"classifier": "classifier", "regressor": "regressor",
+                      "external_memory": "external_booster"}
+        if model not in attributes:
+            print("model must be one of", ", ".join(attributes) + ".")
+            return None
+
+        # Check that the runner method has already been called
+        if getattr(self, attributes[model]) is None:
+            print("The", model, "model seems to be missing.",
+                  "Have you called run_" + model + "() yet?")
+            return None
+
+        # Try to score dataset_X, with the compiled model if there is one
+        # Handle exception if dataset_X or output aren't valid
+        try:
+            if model != "external_memory":
+                return score_model(predictor(self, model), "XGBoost " + model,
+                                   dataset_X, output, method, chunk_size,
+                                   n_threads)
+
+            if method != "predict":
+                raise ValueError("The external memory booster only supports "
+                                 + "method=\"predict\".")
+            y_prediction, summary = score_bulk(
+                partial(predict_booster, self.external_booster,
+                        classes=classes),
+                dataset_X, output, chunk_size, n_threads)
+            print(format_summary("XGBoost external_memory", summary, output))
+            return y_prediction
+        except Exception as e:
+            print("The model failed to run. Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+    # Wrappers for compiled inference
+
+    def compile_classifier(self):
+        """Compiles the classifier model into flat NumPy node arrays, which
+        predict_classifier() then uses. Returns the compiled model.
+        """
+        return compile_attribute(self, "classifier", "run_classifier")
+
+    def compile_regressor(self):
+        """Compiles the regressor model into flat NumPy node arrays, which
+        predict_regressor() then uses. Returns the compiled model.
+        """
+        return compile_attribute(self, "regressor", "run_regressor")
+
+    # Wrappers for incremental learning
+
+    def update_classifier(self, X_new=None, y_new=None):
+        """Updates the classifier model with a batch of new labeled data
+        by boosting it for update_rounds more rounds on it. Returns its
+        accuracy on the new data before the update.
+        """
+        return self._update("classifier", "XGBClassifier", "run_classifier",
+                            X_new, y_new)
+
+    def update_regressor(self, X_new=None, y_new=None):
+        """Updates the regressor model with a batch of new labeled data
+        by boosting it for update_rounds more rounds on it. Returns its R2
+        score on the new data before the update.
+        """
+        return self._update("regressor", "XGBRegressor", "run_regressor",
+                            X_new, y_new)
+
+    # Export functionality
+
+    def export_classifier(self, path):
+        """Writes the classifier's booster to the directory path as a
+        standalone artifact, loadable with ManufacturingNet.runtime.load()
+        and servable with ManufacturingNet.serve. Returns path.
+        """
+        if self.classifier is None:
+            print("The classifier model seems to be missing.",
+                  "Have you called run_classifier() yet?")
+            return None
+
+        classes = {str(index): label
+                   for index, label in enumerate(np.asarray(self.classes).tolist())}
+        return self._export(self.classifier, path, "classification", classes)
+
+    def export_regressor(self, path):
+        """Writes the regressor's booster to the directory path as a
+        standalone artifact, loadable with ManufacturingNet.runtime.load()
+        and servable with ManufacturingNet.serve. Returns path.
+        """
+        if self.regressor is None:
+            print("The regressor model seems to be missing.",
+                  "Have you called run_regressor() yet?")
+            return None
+
+        return self._export(self.regressor, path, "regression", None)
+
+    # Persistence
+
+    def save(self, path):
+        """Writes the fitted classifier, regressor and external memory booster,
+        and their compiled forms, to the directory path, without the dataset,
+        its splits or the results. Returns path.
+        """
+        return save_wrapper(self, path, ("classifier", "regressor",
+                                         "external_booster"),
+                            "one of the run methods")
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Returns an XGBoost object holding the models saved in the directory
+        path with save(). Each model is read from disk the first time it is
+        used, with its arrays memory-mapped.
+        """
+        return load_wrapper(cls, path, mmap_mode)
+
     # Helper methods
 
+    def _cross_validate(self, model, timer):
+        """Cross validates model with the shared evaluation engine.
+        Returns the fold scores and the fitted fold estimators.
+
+        In performance mode, the folds are slices of the shared DMatrix
+        and are trained one at a time, each on all cores. Their boosters
+        are returned as BoosterModels, which predict attributes rather
+        than row indices.
+        """
+        if self.performance_mode:
+            classifier = isinstance(model, XGBClassifier)
+            estimator = self._booster_estimator(model, classifier)
+            scores, estimators = cross_validate_model(
+                estimator, row_indices(len(self.shared_data)), self.labels,
+                cv=self.cv, n_jobs=1, estimate_only=self.estimate_only,
+                timer=timer)
+            if estimators is not None:
+                estimators = [fold.to_model() for fold in estimators]
+            return scores, estimators
+
+        return cross_validate_model(model, self.attributes, self.labels,
+                                    cv=self.cv, n_jobs=self.cv_n_jobs,
+                                    estimate_only=self.estimate_only,
+                                    timer=timer)
+
+    def _update(self, attribute, name, run, X_new, y_new):
+        """Continues boosting the model stored in attribute on the new
+        data. Returns the model's score on the new data before the update.
+        """
+        # Check that the runner method has already been called
+        model = getattr(self, attribute)
+        if model is None:
+            print("The", attribute, "model seems to be missing.",
+                  "Have you called " + run + "() yet?")
+            return None
+
+        # Try to update the model
+        # Handle exception if X_new or y_new aren't valid inputs
+        try:
+            score = model.score(X_new, np.ravel(y_new))
+            continue_boosting(model, X_new, y_new, rounds=self.update_rounds)
+        except Exception as e:
+            print("The", attribute, "model failed to update.",
+                  "Check your inputs and try again.")
+            print("Here is the exception message:")
+            print(e)
+            return None
+
+        self.update_scores.setdefault(name, []).append(score)
+        # The compiled model no longer matches the updated one
+        setattr(self, "compiled_" + attribute, None)
+        setattr(self, "best_iteration_" + attribute, None)
+
+        print("\n" + name, "score on the new data before the update:", score,
+              "\n")
+        return score
+
+    def _fit(self, model, dataset_X, dataset_y):
+        """Fits model. In performance mode, validation_fraction of the
+        data is held out as the early stopping set. Returns the best
+        iteration, or None without early stopping.
+        """
+        if not self.performance_mode:
+            model.fit(dataset_X, dataset_y)
+            return None
+
+        dataset_X_fit, dataset_X_valid, dataset_y_fit, dataset_y_valid = \
+            train_test_split(dataset_X, dataset_y,
+                             test_size=self.validation_fraction)
+        model.fit(dataset_X_fit, dataset_y_fit,
+                  eval_set=[(dataset_X_valid, dataset_y_valid)], verbose=False)
+
+        best_iteration = getattr(model, "best_iteration", None)
+        if best_iteration is not None:
+            print("\nEarly stopping kept", best_iteration + 1, "of",
+                  model.get_params()["n_estimators"], "trees.")
+        return best_iteration
+
+    def _apply_performance_mode(self, model):
+        """Sets the histogram tree method, all CPU cores and early
+        stopping on model in performance mode. A number of cores other
+        than 1 entered by the user is kept. Returns model.
+        """
+        if not self.performance_mode:
+            return model
+
+        params = performance_params(self.early_stopping_rounds)
+        if model.get_params()["n_jobs"] not in {None, 1}:
+            del params["n_jobs"]
+        return model.set_params(**params)
+
+    def _get_shared_data(self, classifier):
+        """Returns the DMatrix of the whole dataset, building it on first
+        use. It is reused by every CV fold and GridSearch candidate until
+        attributes or labels change.
+        """
+        if self.shared_data is None or \
+                (self.shared_data.classes is not None) != classifier:
+            self.shared_data = SharedDMatrix(self.attributes, self.labels,
+                                             classifier=classifier)
+        return self.shared_data
+
+    def _booster_estimator(self, model, classifier):
+        """Returns a BoosterEstimator with the parameters of model that
+        trains on the shared DMatrix.
+        """
+        return BoosterEstimator(
+            self._get_shared_data(classifier), classifier=classifier,
+            n_estimators=model.get_params()["n_estimators"],
+            early_stopping_rounds=self.early_stopping_rounds,
+            validation_fraction=self.validation_fraction,
+            **booster_params(model))
+
+    def _export(self, model, path, task, classes):
+        """Saves a fitted model's booster in XGBoost's JSON format next to
+        the metadata read by ManufacturingNet.runtime.
+        """
+        # The runtime predicts with every tree, so trees past an early
+        # stopping iteration are dropped, as predict_*() ignores them
+        booster = model.get_booster()
+        best_iteration = getattr(model, "best_iteration", None)
+        if best_iteration is not None:
+            booster = booster[:best_iteration + 1]
+            booster.set_attr(best_iteration=None, best_score=None)
+
+        os.makedirs(path, exist_ok=True)
+        booster.save_model(os.path.join(path, "model.json"))
+
+        params = model.get_params()
+        metadata = {"format": "xgboost",
+                    "model_file": "model.json",
+                    "model_type": type(self).__name__,
+                    "task": task,
+                    "input_shape": [int(self.attributes.shape[1])],
+                    "variable_length": False,
+                    "dtype": "float32",
+                    "classes": classes,
+                    "normalization": None,
+                    "config": {key: value for key, value in params.items()
+                               if isinstance(value, (bool, int, float, str))}}
+        write_metadata(path, metadata)
+
+        print("Model exported to", path)
+        return path
+
     def _create_model(self, classifier):
         """Runs UI for getting parameters and creating classifier or
         regression model.
@@ -291,6 +742,8 @@ class XGBoost:
             print("= XGBRegressor Parameter Inputs =")
             print("=================================\n")
 
+        self._get_performance_mode()
+
         print("Default values:", "test_size = 0.25", "cv = 5", sep="\n")
         if classifier:
             print("graph_results = False",
@@ -330,8 +783,8 @@ class XGBoost:
                 print("= End of inputs; press enter to continue. =")
                 input("===========================================\n")
                 if classifier:
-                    return XGBClassifier()
-                return XGBRegressor()
+                    return self._apply_performance_mode(XGBClassifier())
+                return self._apply_performance_mode(XGBRegressor())
             elif user_input == "n":
                 break
             else:
@@ -570,6 +1023,8 @@ class XGBoost:
                 params["max_depth"] = mdepth_params
                 print("max_depths:", mdepth_params)
 
+                self.search_settings = prompt_search_settings()
+
                 print("\n= End of GridSearch inputs. =\n")
                 self.gs_params = params
                 best_params = self._run_gridsearch(classifier)
@@ -1027,7 +1482,23 @@ class XGBoost:
         input("===========================================\n")
 
         if classifier:
-            return XGBClassifier(max_depth=max_depth,
+            model = XGBClassifier(max_depth=max_depth,
+                                  learning_rate=learning_rate,
+                                  n_estimators=n_estimators,
+                                  objective=objective, booster=booster,
+                                  n_jobs=n_jobs, nthread=nthread, gamma=gamma,
+                                  min_child_weight=min_child_weight,
+                                  max_delta_step=max_delta_step,
+                                  subsample=subsample,
+                                  colsample_bytree=colsample_bytree,
+                                  colsample_bylevel=colsample_bylevel,
+                                  reg_alpha=reg_alpha, reg_lambda=reg_lambda,
+                                  scale_pos_weight=scale_pos_weight,
+                                  base_score=base_score,
+                                  random_state=random_state, missing=missing,
+                                  verbosity=verbosity)
+        else:
+            model = XGBRegressor(max_depth=max_depth,
                                  learning_rate=learning_rate,
                                  n_estimators=n_estimators, objective=objective,
                                  booster=booster, n_jobs=n_jobs,
@@ -1043,17 +1514,72 @@ class XGBoost:
                                  random_state=random_state, missing=missing,
                                  verbosity=verbosity)
 
-        return XGBRegressor(max_depth=max_depth, learning_rate=learning_rate,
-                            n_estimators=n_estimators, objective=objective,
-                            booster=booster, n_jobs=n_jobs, nthread=nthread,
-                            gamma=gamma, min_child_weight=min_child_weight,
-                            max_delta_step=max_delta_step, subsample=subsample,
-                            colsample_bytree=colsample_bytree,
-                            colsample_bylevel=colsample_bylevel,
-                            reg_alpha=reg_alpha, reg_lambda=reg_lambda,
-                            scale_pos_weight=scale_pos_weight,
-                            base_score=base_score, random_state=random_state,
-                            missing=missing, verbosity=verbosity)
+        return self._apply_performance_mode(model)
+
+    def _get_performance_mode(self):
+        """Prompts for performance mode and its early stopping settings.
+        The values set with set_performance_mode() are the defaults.
+        """
+        while True:
+            user_input = input("Use performance mode: histogram trees, all "
+                               + "CPU cores and early stopping "
+                               + ("(Y/n)? " if self.performance_mode
+                                  else "(y/N)? "))
+            user_input = user_input.lower()
+            if user_input == "":
+                break
+            elif user_input == "y":
+                self.performance_mode = True
+                break
+            elif user_input == "n":
+                self.performance_mode = False
+                break
+            else:
+                print("Invalid input.")
+
+        print("performance_mode =", self.performance_mode)
+
+        if not self.performance_mode:
+            print()
+            return
+
+        while True:
+            user_input = input("\nEnter the number of rounds without "
+                               + "improvement before stopping (default="
+                               + str(self.early_stopping_rounds) + "): ")
+            try:
+                if user_input == "":
+                    break
+
+                user_input = int(user_input)
+                if user_input <= 0:
+                    raise Exception
+                else:
+                    self.early_stopping_rounds = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("early_stopping_rounds =", self.early_stopping_rounds)
+
+        while True:
+            user_input = input("\nWhat fraction of the training set should "
+                               + "be used for early stopping (default="
+                               + str(self.validation_fraction) + ")? ")
+            try:
+                if user_input == "":
+                    break
+
+                user_input = float(user_input)
+                if user_input <= 0 or user_input >= 1:
+                    raise Exception
+                else:
+                    self.validation_fraction = user_input
+                    break
+            except Exception:
+                print("Invalid input.")
+
+        print("validation_fraction =", self.validation_fraction, "\n")
 
     def _output_classifier_results(self):
         """Outputs model metrics after run_classifier() finishes."""
@@ -1116,6 +1642,9 @@ class XGBoost:
     def _run_gridsearch(self, classifier):
         """Runs GridSearch with the parameters given in run_classifier()
         or run_regressor(). Returns the best parameters."""
+        if self.performance_mode:
+            return self._run_performance_gridsearch(classifier)
+
         dataset_X_train, dataset_X_test, dataset_y_train, dataset_y_test = \
             train_test_split(self.attributes, self.labels,
                              test_size=self.test_size)
@@ -1123,12 +1652,13 @@ class XGBoost:
             acc_scorer = make_scorer(accuracy_score)
             clf = XGBClassifier()
 
-            # Run GridSearch
-            grid_obj = GridSearchCV(clf, self.gs_params, scoring=acc_scorer)
-            grid_obj = grid_obj.fit(dataset_X_train, dataset_y_train)
+            # Run the hyperparameter search
+            best_params = run_search(clf, self.gs_params, dataset_X_train,
+                                     dataset_y_train, scoring=acc_scorer,
+                                     **self.search_settings)
 
             # Set the clf to the best combination of parameters
-            clf = grid_obj.best_estimator_
+            clf.set_params(**best_params)
 
             # Fit the best algorithm to the data
             clf.fit(dataset_X_train, dataset_y_train)
@@ -1137,12 +1667,13 @@ class XGBoost:
         else:
             clf = XGBRegressor()
 
-            # Run GridSearch
-            grid_obj = GridSearchCV(clf, self.gs_params, scoring="r2")
-            grid_obj = grid_obj.fit(dataset_X_train, dataset_y_train)
+            # Run the hyperparameter search
+            best_params = run_search(clf, self.gs_params, dataset_X_train,
+                                     dataset_y_train, scoring="r2",
+                                     **self.search_settings)
 
             # Set the clf to the best combination of parameters
-            clf = grid_obj.best_estimator_
+            clf.set_params(**best_params)
 
             # Fit the best algorithm to the data
             clf.fit(dataset_X_train, dataset_y_train)
@@ -1150,8 +1681,40 @@ class XGBoost:
             self.gs_result = clf.score(dataset_X_test, dataset_y_test)
 
         # Return the best parameters
-        print("\nBest GridSearch Parameters:\n", grid_obj.best_params_, "\n")
-        return grid_obj.best_params_
+        print("\nBest GridSearch Parameters:\n", best_params, "\n")
+        return best_params
+
+    def _run_performance_gridsearch(self, classifier):
+        """Runs GridSearch on slices of the shared DMatrix, training one
+        candidate at a time on all cores with early stopping. Returns the
+        best parameters.
+        """
+        if classifier:
+            model = XGBClassifier()
+        else:
+            model = XGBRegressor()
+        estimator = self._booster_estimator(
+            self._apply_performance_mode(model), classifier)
+
+        labels = np.ravel(self.labels)
+        train_index, test_index = \
+            train_test_split(np.arange(len(labels)), test_size=self.test_size)
+
+        # The DMatrix can't be sent to worker processes
+        settings = dict(self.search_settings, n_jobs=1)
+        best_params = run_search(estimator, self.gs_params,
+                                 train_index.reshape(-1, 1),
+                                 labels[train_index], **settings)
+
+        # Fit the best algorithm to the data
+        estimator.set_params(**best_params)
+        estimator.fit(train_index.reshape(-1, 1))
+        self.gs_result = estimator.score(test_index.reshape(-1, 1),
+                                         labels[test_index])
+
+        # Return the best parameters
+        print("\nBest GridSearch Parameters:\n", best_params, "\n")
+        return best_params
 
     def _check_inputs(self):
         """Verifies if the instance data is ready for use in XGBoost model."""
@@ -1169,6 +1732,13 @@ class XGBoost:
                   "dependent variables.")
             return False
 
+        # Splitting needs sparse attributes in a row-sliceable format
+        if not is_sliceable(self.attributes):
+            print("attributes is a sparse matrix that can't be sliced by",
+                  "rows; call set_attributes(new_attributes.tocsr()) to",
+                  "fix this!")
+            return False
+
         # Check if attributes and labels have same number of rows (samples)
         if self.attributes.shape[0] != self.labels.shape[0]:
             print("attributes and labels don't have the same number of rows.",
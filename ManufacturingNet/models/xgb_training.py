@@ -0,0 +1,408 @@
+"""xgb_training holds the performance mode of the XGBoost wrapper.
+
+The dataset is converted once to an XGBoost DMatrix that every cross
+validation fold and every GridSearch candidate slices, instead of each
+fit converting its own copy of the arrays. Boosters are trained with the
+histogram tree method on all cores and stop early once the score on a
+validation set stops improving. Datasets larger than memory can be
+streamed from disk in batches through XGBoost's external memory
+interface.
+
+View the documentation at https://manufacturingnet.readthedocs.io/.
+"""
+
+import os
+
+import numpy as np
+import xgboost as xgb
+from sklearn.base import BaseEstimator
+from sklearn.metrics import accuracy_score, r2_score
+from sklearn.model_selection import train_test_split
+
+# Parameters of the scikit-learn wrappers that xgboost.train() doesn't
+# take as booster parameters
+_WRAPPER_PARAMS = ("n_estimators", "early_stopping_rounds", "callbacks",
+                   "eval_metric", "use_label_encoder", "enable_categorical",
+                   "missing", "importance_type", "kwargs")
+
+
+def performance_params(early_stopping_rounds=10):
+    """Returns the parameters of the performance mode: the histogram tree
+    method, all CPU cores and early stopping.
+    """
+    return {"tree_method": "hist", "n_jobs": os.cpu_count(),
+            "early_stopping_rounds": early_stopping_rounds}
+
+
+def booster_params(model):
+    """Returns the booster parameters of an XGBClassifier or XGBRegressor
+    in the form taken by xgboost.train().
+    """
+    params = {key: value for key, value in model.get_xgb_params().items()
+              if key not in _WRAPPER_PARAMS and value is not None}
+    if "n_jobs" in params:
+        params["nthread"] = params.pop("n_jobs")
+    if "random_state" in params:
+        params["seed"] = params.pop("random_state")
+    return params
+
+
+class SharedDMatrix:
+    """A dataset converted once to an XGBoost DMatrix.
+
+    Folds and holdout splits are row slices of the same DMatrix, cached
+    so that every GridSearch candidate reuses the slices of the previous
+    ones. Copies of a SharedDMatrix, such as those made by sklearn's
+    clone(), refer to the same DMatrix.
+    """
+
+    max_slices = 64
+
+    def __init__(self, attributes, labels, classifier=False, missing=np.nan):
+        """Builds the DMatrix. Class labels are encoded as 0..k-1, as
+        XGBoost expects.
+        """
+        labels = np.ravel(labels)
+        self.classes = None
+        if classifier:
+            self.classes, labels = np.unique(labels, return_inverse=True)
+
+        self.labels = labels
+        self.dmatrix = xgb.DMatrix(attributes, label=labels, missing=missing,
+                                   nthread=-1)
+        self._slices = {}
+
+    def __deepcopy__(self, memo):
+        """Shares the DMatrix instead of copying it."""
+        return self
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return len(self.labels)
+
+    def slice(self, index):
+        """Returns the DMatrix of the rows in index."""
+        index = np.asarray(index, dtype=np.int64)
+        key = index.tobytes()
+        if key not in self._slices:
+            if len(self._slices) >= self.max_slices:
+                # Drop the oldest slice
+                del self._slices[next(iter(self._slices))]
+            self._slices[key] = self.dmatrix.slice(index)
+        return self._slices[key]
+
+
+def _train(params, num_boost_round, dtrain, dvalid=None,
+           early_stopping_rounds=None):
+    """Trains a booster, stopping early on dvalid when it is given."""
+    if dvalid is None:
+        return xgb.train(params, dtrain, num_boost_round=num_boost_round)
+
+    return xgb.train(params, dtrain, num_boost_round=num_boost_round,
+                     evals=[(dvalid, "validation")],
+                     early_stopping_rounds=early_stopping_rounds,
+                     verbose_eval=False)
+
+
+def _predict(booster, dmatrix, output_margin=False):
+    """Predicts with the trees up to the best early stopping iteration."""
+    best_iteration = getattr(booster, "best_iteration", None)
+    if best_iteration is None:
+        return booster.predict(dmatrix, output_margin=output_margin)
+    return booster.predict(dmatrix, output_margin=output_margin,
+                           iteration_range=(0, best_iteration + 1))
+
+
+class BoosterEstimator(BaseEstimator):
+    """Scikit-learn estimator training native XGBoost boosters on the
+    rows of a SharedDMatrix.
+
+    fit(), predict() and score() take a column of row indices into data
+    instead of the attributes, so cross validation and GridSearch slice
+    the shared DMatrix rather than converting their folds again; predict()
+    also accepts any xgboost.DMatrix. Every fit holds out
+    validation_fraction of its rows for early stopping.
+    """
+
+    def __init__(self, data=None, classifier=False, n_estimators=100,
+                 early_stopping_rounds=10, validation_fraction=0.1,
+                 **params):
+        """Initializes a BoosterEstimator object. params are the booster
+        parameters taken by xgboost.train(), such as those returned by
+        booster_params().
+        """
+        self.data = data
+        self.classifier = classifier
+        self.n_estimators = n_estimators
+        self.early_stopping_rounds = early_stopping_rounds
+        self.validation_fraction = validation_fraction
+        self.params = params
+
+    @property
+    def _estimator_type(self):
+        """Makes sklearn treat the estimator as a classifier or a
+        regressor.
+        """
+        return "classifier" if self.classifier else "regressor"
+
+    def __sklearn_tags__(self):
+        """Makes sklearn >= 1.6 treat the estimator as a classifier or a
+        regressor.
+        """
+        tags = super().__sklearn_tags__()
+        tags.estimator_type = self._estimator_type
+        return tags
+
+    def get_params(self, deep=True):
+        """Returns the estimator and booster parameters."""
+        params = {"data": self.data, "classifier": self.classifier,
+                  "n_estimators": self.n_estimators,
+                  "early_stopping_rounds": self.early_stopping_rounds,
+                  "validation_fraction": self.validation_fraction}
+        params.update(self.params)
+        return params
+
+    def set_params(self, **params):
+        """Sets estimator and booster parameters."""
+        for key, value in params.items():
+            if key in {"data", "classifier", "n_estimators",
+                       "early_stopping_rounds", "validation_fraction"}:
+                setattr(self, key, value)
+            else:
+                self.params[key] = value
+        return self
+
+    def _booster_params(self):
+        """Returns the parameters passed to xgboost.train()."""
+        params = dict(self.params)
+        if self.classifier and len(self.data.classes) > 2:
+            params["objective"] = "multi:softprob"
+            params["num_class"] = len(self.data.classes)
+        elif self.classifier:
+            params.setdefault("objective", "binary:logistic")
+        return {key: value for key, value in params.items()
+                if value is not None}
+
+    def fit(self, X, y=None):
+        """Trains a booster on the rows of data listed in X."""
+        index = np.ravel(X).astype(np.int64)
+
+        dvalid = None
+        if self.early_stopping_rounds and self.validation_fraction:
+            index, valid_index = train_test_split(
+                index, test_size=self.validation_fraction,
+                random_state=self.params.get("seed"))
+            dvalid = self.data.slice(np.sort(valid_index))
+
+        self.booster_ = _train(self._booster_params(), self.n_estimators,
+                               self.data.slice(np.sort(index)), dvalid,
+                               self.early_stopping_rounds)
+        self.best_iteration_ = getattr(self.booster_, "best_iteration", None)
+        return self
+
+    def predict(self, X):
+        """Predicts the rows of data listed in X, or the rows of X if it
+        is an xgboost.DMatrix.
+        """
+        if isinstance(X, xgb.DMatrix):
+            dmatrix = X
+        else:
+            dmatrix = self.data.slice(np.ravel(X))
+
+        outputs = _predict(self.booster_, dmatrix)
+        if not self.classifier:
+            return outputs
+        if outputs.ndim == 1:
+            return self.data.classes[(outputs > 0.5).astype(int)]
+        return self.data.classes[outputs.argmax(axis=1)]
+
+    def score(self, X, y):
+        """Returns the accuracy of a classifier or the R2 score of a
+        regressor.
+        """
+        if self.classifier:
+            return accuracy_score(y, self.predict(X))
+        return r2_score(y, self.predict(X))
+
+    def to_model(self):
+        """Returns a BoosterModel predicting attributes with the fitted
+        booster.
+        """
+        classes = self.data.classes if self.classifier else None
+        return BoosterModel(self.booster_, classes)
+
+
+class BoosterModel(BaseEstimator):
+    """Scikit-learn estimator predicting attributes with a fitted
+    booster, such as that of a BoosterEstimator fold. Class predictions
+    are mapped through classes; regressors have classes=None.
+    """
+
+    def __init__(self, booster=None, classes=None):
+        """Initializes a BoosterModel object."""
+        self.booster = booster
+        self.classes = classes
+
+    @property
+    def _estimator_type(self):
+        """Makes sklearn treat the model as a classifier or a regressor."""
+        return "regressor" if self.classes is None else "classifier"
+
+    def __sklearn_tags__(self):
+        """Makes sklearn >= 1.6 treat the model as a classifier or a
+        regressor.
+        """
+        tags = super().__sklearn_tags__()
+        tags.estimator_type = self._estimator_type
+        return tags
+
+    def predict(self, X):
+        """Predicts the attributes X."""
+        return predict_booster(self.booster, X, self.classes)
+
+    def predict_proba(self, X):
+        """Returns the class probabilities of the attributes X."""
+        if self.classes is None:
+            raise ValueError("Regressors don't predict probabilities.")
+        outputs = _predict(self.booster, xgb.DMatrix(X))
+        if outputs.ndim == 1:
+            return np.column_stack([1 - outputs, outputs])
+        return outputs
+
+    def score(self, X, y):
+        """Returns the accuracy of a classifier or the R2 score of a
+        regressor.
+        """
+        if self.classes is not None:
+            return accuracy_score(y, self.predict(X))
+        return r2_score(y, self.predict(X))
+
+
+def continue_boosting(model, X_new, y_new, rounds=10):
+    """Continues boosting a fitted XGBClassifier or XGBRegressor for
+    rounds rounds on new data, so the new trees correct its errors on it.
+    Trees past an early stopping iteration are dropped first. Returns
+    model.
+    """
+    booster = model.get_booster()
+    best_iteration = getattr(model, "best_iteration", None)
+    if best_iteration is not None:
+        booster = booster[:best_iteration + 1]
+
+    params = booster_params(model)
+    y_new = np.ravel(y_new)
+    if hasattr(model, "classes_"):
+        # Boosters learn class indices, not labels
+        classes = np.asarray(model.classes_)
+        index = np.minimum(np.searchsorted(classes, y_new), len(classes) - 1)
+        if np.any(classes[index] != y_new):
+            raise ValueError("The new data contains unknown classes.")
+        y_new = index
+        if len(classes) > 2:
+            params["objective"] = "multi:softprob"
+            params["num_class"] = len(classes)
+
+    booster = xgb.train(params, xgb.DMatrix(X_new, label=y_new),
+                        num_boost_round=rounds, xgb_model=booster)
+    # Predict with every tree, including the new ones
+    booster.set_attr(best_iteration=None, best_score=None)
+    model.load_model(booster.save_raw())
+    return model
+
+
+def row_indices(n_rows):
+    """Returns the column of row indices that BoosterEstimator takes in
+    place of the attributes.
+    """
+    return np.arange(n_rows).reshape(-1, 1)
+
+
+class BatchIterator(xgb.DataIter):
+    """Feeds XGBoost a dataset in batches for external memory training.
+
+    batches is a sequence of (attributes, labels) pairs, such as arrays
+    memory-mapped from .npy files, or a callable returning a new iterator
+    over such pairs, such as a generator function reading a large file
+    in chunks. Each pass over the data calls it again.
+    """
+
+    def __init__(self, batches, cache_prefix=None):
+        """Initializes a BatchIterator object. XGBoost caches the
+        converted pages in files starting with cache_prefix.
+        """
+        self.batches = batches
+        self._iterator = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        """Restarts the iteration over the batches."""
+        self._iterator = None
+
+    def next(self, input_data):
+        """Passes the next batch to XGBoost; returns 0 when done."""
+        if self._iterator is None:
+            self._iterator = iter(self.batches() if callable(self.batches)
+                                  else self.batches)
+        try:
+            attributes, labels = next(self._iterator)
+        except StopIteration:
+            return 0
+
+        input_data(data=attributes, label=np.ravel(labels))
+        return 1
+
+
+def external_memory_dmatrix(batches, cache_prefix=None, quantile=False,
+                            max_bin=256):
+    """Builds a DMatrix from batches without loading them all at once.
+
+    With the default quantile=False, the pages are cached on disk under
+    cache_prefix (default: a directory in the working directory) and
+    streamed during training. With quantile=True, the batches are
+    quantized into a QuantileDMatrix held in memory, which is several
+    times smaller than the raw data but can't be sliced.
+    """
+    if quantile:
+        return xgb.QuantileDMatrix(BatchIterator(batches), max_bin=max_bin)
+
+    if cache_prefix is None:
+        cache_prefix = os.path.join(os.getcwd(), "xgboost_cache")
+    os.makedirs(os.path.dirname(cache_prefix) or ".", exist_ok=True)
+    return xgb.DMatrix(BatchIterator(batches, cache_prefix=cache_prefix))
+
+
+def train_external_memory(model, batches, validation=None, cache_prefix=None,
+                          quantile=False, num_class=None):
+    """Trains a booster with the parameters of model, an XGBClassifier
+    or XGBRegressor, on batches streamed from disk. validation is an
+    optional (attributes, labels) pair used for early stopping.
+
+    Class labels must already be encoded as 0..k-1; pass num_class for
+    more than two classes. Returns the booster.
+    """
+    params = booster_params(model)
+    params["tree_method"] = "hist"
+    if num_class is not None and num_class > 2:
+        params["objective"] = "multi:softprob"
+        params["num_class"] = num_class
+    dtrain = external_memory_dmatrix(batches, cache_prefix, quantile)
+
+    dvalid = None
+    if validation is not None:
+        dvalid = xgb.DMatrix(validation[0], label=np.ravel(validation[1]))
+
+    early_stopping_rounds = model.get_params().get("early_stopping_rounds")
+    return _train(params, model.get_params()["n_estimators"], dtrain, dvalid,
+                  early_stopping_rounds or 10)
+
+
+def predict_booster(booster, attributes, classes=None):
+    """Predicts attributes with a booster from train_external_memory().
+    Class predictions are mapped through classes when given.
+    """
+    outputs = _predict(booster, xgb.DMatrix(attributes))
+    if classes is None:
+        return outputs
+    if outputs.ndim == 1:
+        return np.asarray(classes)[(outputs > 0.5).astype(int)]
+    return np.asarray(classes)[outputs.argmax(axis=1)]
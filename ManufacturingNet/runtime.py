@@ -0,0 +1,196 @@
+"""runtime loads models exported with the export() methods of the
+ManufacturingNet wrappers and makes predictions with them.
+
+It only imports numpy and, when the artifact is loaded, the runtime that
+executes it (torch for TorchScript, onnxruntime for ONNX, xgboost for
+XGBoost boosters). Neither the model wrappers nor scikit-learn,
+matplotlib or torchvision are imported, so it starts quickly on
+inference-only machines.
+
+Read the documentation at https://manufacturingnet.readthedocs.io.
+"""
+
+import json
+import os
+
+import numpy as np
+
+METADATA_FILE = 'metadata.json'
+OUTPUT_TYPES = ('class', 'proba', 'value', 'label')
+
+
+def replace_file(filename, write):
+    """Calls write with a temporary filename next to filename, then moves
+    the temporary file over filename. Processes reading or memory-mapping
+    the old file keep seeing it unchanged until they open it again.
+    """
+    root, extension = os.path.splitext(filename)
+    # Keep the extension, which numpy and xgboost read the format from
+    temporary = root + '.tmp' + extension
+    try:
+        write(temporary)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, filename)
+
+
+def _write_json(data, **kwargs):
+    """Returns a write function for replace_file() that dumps data as
+    JSON.
+    """
+    def write(filename):
+        with open(filename, 'w') as f:
+            json.dump(data, f, **kwargs)
+    return write
+
+
+def write_metadata(path, metadata):
+    """Writes the metadata of an exported model to the directory path."""
+    os.makedirs(path, exist_ok=True)
+    replace_file(os.path.join(path, METADATA_FILE),
+                 _write_json(metadata, indent=2))
+
+
+class ExportedModel:
+    """An exported model together with its metadata."""
+
+    def __init__(self, path):
+        """Reads the metadata in path and loads the model."""
+        self.path = path
+
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+
+        self.format = self.metadata['format']
+        self.task = self.metadata['task']
+        self.dtype = np.dtype(self.metadata.get('dtype') or 'float64')
+        self.classes = self.metadata.get('classes')
+
+        normalization = self.metadata.get('normalization')
+        if normalization is not None:
+            self._shift = np.asarray(normalization['shift'], dtype=self.dtype)
+            self._scale = np.asarray(normalization['scale'], dtype=self.dtype)
+        else:
+            self._shift = None
+            self._scale = None
+
+        self._model = self._load_model(os.path.join(path, self.metadata['model_file']))
+
+    def _load_model(self, model_path):
+        """Loads the model file with the runtime matching its format."""
+        if self.format == 'torchscript':
+            import torch
+
+            model = torch.jit.load(model_path, map_location='cpu')
+            model.eval()
+            return model
+
+        if self.format == 'onnx':
+            try:
+                import onnxruntime
+            except ImportError:
+                print('onnxruntime is required to run ONNX models.')
+                print('Install it with: pip install onnxruntime')
+                raise
+
+            return onnxruntime.InferenceSession(model_path)
+
+        if self.format == 'xgboost':
+            import xgboost
+
+            booster = xgboost.Booster()
+            booster.load_model(model_path)
+            return booster
+
+        raise ValueError('Unsupported model format: ' + str(self.format))
+
+    def get_metadata(self):
+        """Accessor method for the artifact metadata."""
+        return self.metadata
+
+    def get_classes(self):
+        """Accessor method for the class index to label mapping."""
+        return self.classes
+
+    def _prepare(self, X):
+        """Casts and normalizes a batch of inputs."""
+        X = np.asarray(X, dtype=self.dtype)
+        if self._shift is not None:
+            X = (X - self._shift) / self._scale
+        return np.ascontiguousarray(X)
+
+    def raw_predict(self, X):
+        """Returns the raw model output for a batch of inputs X: logits
+        for deep classifiers, class probabilities for XGBoost classifiers
+        and output values for regressors.
+        """
+        X = self._prepare(X)
+
+        if self.format == 'torchscript':
+            import torch
+
+            with torch.no_grad():
+                return self._model(torch.from_numpy(X)).numpy()
+
+        if self.format == 'xgboost':
+            if hasattr(self._model, 'inplace_predict'):
+                return self._model.inplace_predict(X)
+
+            import xgboost
+
+            return self._model.predict(xgboost.DMatrix(X))
+
+        return self._model.run(None, {'input': X})[0]
+
+    def postprocess(self, outputs, output=None):
+        """Turns raw outputs into class indices ('class'), class
+        probabilities ('proba'), class labels ('label') or output values
+        ('value'). Defaults to 'class' for classification and 'value'
+        for regression.
+        """
+        if output is None:
+            output = 'class' if self.task == 'classification' else 'value'
+        if output not in OUTPUT_TYPES:
+            raise ValueError('output must be one of ' + ', '.join(OUTPUT_TYPES))
+
+        if output == 'value':
+            return outputs
+
+        if self.format == 'xgboost':
+            # binary boosters return the probability of the positive class
+            probabilities = outputs if outputs.ndim == 2 \
+                else np.column_stack([1.0 - outputs, outputs])
+        else:
+            probabilities = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        if output == 'proba':
+            return probabilities
+
+        indices = probabilities.argmax(axis=1)
+        if output == 'label' and self.classes is not None:
+            return np.array([self.classes[str(index)] for index in indices])
+        return indices
+
+    def predict_proba(self, X):
+        """Returns class probabilities for a batch of inputs X."""
+        return self.postprocess(self.raw_predict(X), 'proba')
+
+    def predict(self, X):
+        """Returns class indices for classification models and output
+        values for regression models, for a batch of inputs X.
+        """
+        return self.postprocess(self.raw_predict(X))
+
+    def predict_labels(self, X):
+        """Returns the class labels of the predictions for a batch of
+        inputs X, using the class mapping stored at export.
+        """
+        return self.postprocess(self.raw_predict(X), 'label')
+
+
+def load(path):
+    """Loads the artifact written to the directory path by export()."""
+    return ExportedModel(path)
@@ -0,0 +1,4 @@
+from .client import Client
+from .server import DynamicBatcher, ModelMetrics, ModelServer
+
+__all__=['Client', 'DynamicBatcher', 'ModelMetrics', 'ModelServer']
@@ -0,0 +1,42 @@
+"""Runs a model server from the command line:
+
+    python -m ManufacturingNet.serve --model signal=exported/cnn --model quality=exported/xgb --port 8000
+
+Read the documentation at https://manufacturingnet.readthedocs.io.
+"""
+
+import argparse
+
+from .server import ModelServer
+
+
+def main(argv=None):
+    """Parses the command line arguments and serves the models."""
+    parser = argparse.ArgumentParser(prog='python -m ManufacturingNet.serve',
+                                     description='Serve exported ManufacturingNet models over HTTP.')
+    parser.add_argument('--model', action='append', required=True, metavar='NAME=PATH',
+                        help='name and directory of an exported model; can be repeated')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of worker threads shared by all models')
+    parser.add_argument('--max-batch-size', type=int, default=64,
+                        help='largest number of samples run in one batch')
+    parser.add_argument('--max-wait-us', type=int, default=1000,
+                        help='longest time a request waits for its batch to fill, in microseconds')
+    args = parser.parse_args(argv)
+
+    models = {}
+    for entry in args.model:
+        name, sep, path = entry.partition('=')
+        if not sep or not name or not path:
+            parser.error('--model expects NAME=PATH, got ' + entry)
+        models[name] = path
+
+    server = ModelServer(models, host=args.host, port=args.port, workers=args.workers,
+                         max_batch_size=args.max_batch_size, max_wait_us=args.max_wait_us)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
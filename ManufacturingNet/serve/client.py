@@ -0,0 +1,56 @@
+"""client talks to a ManufacturingNet model server over HTTP using only
+the standard library.
+
+Read the documentation at https://manufacturingnet.readthedocs.io.
+"""
+
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+
+class Client:
+    """Client for a running ModelServer."""
+
+    def __init__(self, url='http://127.0.0.1:8000', timeout=30.0):
+        """Initializes a client for the server at url."""
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        """Sends a GET request, or a POST request if body is given, and
+        returns the decoded JSON response.
+        """
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        request = Request(self.url + path, data=data,
+                          headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except HTTPError as e:
+            message = json.loads(e.read()).get('error', e.reason)
+            raise RuntimeError('{} {}: {}'.format(e.code, path, message)) from None
+
+    def health(self):
+        """Returns the status of the server."""
+        return self._request('/health')
+
+    def metrics(self):
+        """Returns the request and latency metrics of every model."""
+        return self._request('/metrics')
+
+    def models(self):
+        """Returns the metadata of every served model."""
+        return self._request('/models')
+
+    def predict(self, name, inputs, output=None):
+        """Sends a batch of inputs to the named model and returns the
+        outputs as a numpy array. output is 'class', 'proba', 'label' or
+        'value'; by default the model's task decides.
+        """
+        body = {'inputs': np.asarray(inputs).tolist()}
+        if output is not None:
+            body['output'] = output
+        return np.asarray(self._request('/predict/' + name, body)['outputs'])
@@ -0,0 +1,334 @@
+"""server serves exported ManufacturingNet models over HTTP. Concurrent
+requests for the same model are grouped into batches by a dynamic
+batcher and run on a worker pool shared by all the models of the process.
+
+Read the documentation at https://manufacturingnet.readthedocs.io.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+
+import numpy as np
+
+from ..runtime import ExportedModel, load
+
+
+class ModelMetrics:
+    """Request, batch and latency counters of one served model."""
+
+    def __init__(self, window=1000):
+        """Initializes the counters. Latency percentiles are computed over
+        the last window requests.
+        """
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.samples = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+
+    def record_batch(self, num_samples):
+        """Records a batch of num_samples samples sent to the model."""
+        with self._lock:
+            self.batches += 1
+            self.batch_sizes.append(num_samples)
+
+    def record_request(self, num_samples, latency, failed=False):
+        """Records a finished request and its latency in seconds."""
+        with self._lock:
+            self.requests += 1
+            self.samples += num_samples
+            self.latencies.append(latency)
+            if failed:
+                self.errors += 1
+
+    def get_summary(self, queue_depth=0):
+        """Returns the counters and the latency percentiles in ms."""
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000.0
+            batch_sizes = np.array(self.batch_sizes)
+            summary = {'requests': self.requests,
+                       'samples': self.samples,
+                       'batches': self.batches,
+                       'errors': self.errors,
+                       'queue_depth': queue_depth,
+                       'mean_batch_size': float(batch_sizes.mean()) if len(batch_sizes) else 0.0}
+
+        for percentile in (50, 95, 99):
+            summary['latency_p{}_ms'.format(percentile)] = \
+                float(np.percentile(latencies, percentile)) if len(latencies) else 0.0
+        return summary
+
+
+class _Request:
+    """A pending prediction request."""
+
+    def __init__(self, inputs, output):
+        self.inputs = inputs
+        self.output = output
+        self.future = Future()
+        self.start = time.perf_counter()
+
+
+class DynamicBatcher:
+    """Groups the concurrent requests of one model into batches.
+
+    A batch is closed when it holds max_batch_size samples or when
+    max_wait_us microseconds have passed since its first request arrived,
+    and is then run on the shared worker pool.
+    """
+
+    def __init__(self, model, pool, max_batch_size=64, max_wait_us=1000):
+        """Starts the thread collecting the requests of model."""
+        self.model = model
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1e6
+        self.metrics = ModelMetrics()
+
+        self._queue = Queue()
+        self._running = True
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def submit(self, inputs, output=None):
+        """Queues a batch of inputs and returns a Future of the outputs."""
+        inputs = np.asarray(inputs)
+        if inputs.ndim == 0:
+            raise ValueError('inputs must be a batch of samples')
+
+        request = _Request(inputs, output)
+        self._queue.put(request)
+        return request.future
+
+    def get_queue_depth(self):
+        """Accessor method for the number of requests waiting for a batch."""
+        return self._queue.qsize()
+
+    def _collect(self):
+        """Builds batches from the queued requests until stopped."""
+        while self._running:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except Empty:
+                continue
+            if first is None:
+                break
+
+            batch = [first]
+            size = len(first.inputs)
+            deadline = time.perf_counter() + self.max_wait
+
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+                if request is None:
+                    self._running = False
+                    break
+                batch.append(request)
+                size += len(request.inputs)
+
+            self.pool.submit(self._run, batch)
+
+    def _run(self, batch):
+        """Runs one batch on the model and resolves the futures of its
+        requests. Requests whose samples have different shapes, such as
+        sequences of different lengths, are run as separate groups.
+        """
+        groups = {}
+        for request in batch:
+            groups.setdefault(request.inputs.shape[1:], []).append(request)
+
+        for requests in groups.values():
+            try:
+                inputs = np.concatenate([request.inputs for request in requests])
+                self.metrics.record_batch(len(inputs))
+                outputs = self.model.raw_predict(inputs)
+            except Exception as e:
+                for request in requests:
+                    self._finish(request, error=e)
+                continue
+
+            offset = 0
+            for request in requests:
+                part = outputs[offset:offset + len(request.inputs)]
+                offset += len(request.inputs)
+                try:
+                    self._finish(request, self.model.postprocess(part, request.output))
+                except Exception as e:
+                    self._finish(request, error=e)
+
+    def _finish(self, request, result=None, error=None):
+        """Resolves the future of a request and records its latency."""
+        self.metrics.record_request(len(request.inputs), time.perf_counter() - request.start,
+                                    failed=error is not None)
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(result)
+
+    def stop(self):
+        """Stops collecting requests once the queued ones are batched."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+class ModelServer:
+    """Serves several exported models from one process.
+
+    models: dict of model name to the directory of an exported model or a
+    loaded ExportedModel. All models share a pool of worker threads.
+    """
+
+    def __init__(self, models, host='127.0.0.1', port=8000, workers=4, max_batch_size=64,
+                 max_wait_us=1000, request_timeout=30.0):
+        """Loads the models and starts their batchers."""
+        self.host = host
+        self.port = port
+        self.request_timeout = request_timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.started = time.time()
+
+        self.batchers = {}
+        for name, model in models.items():
+            if not isinstance(model, ExportedModel):
+                model = load(model)
+            self.batchers[name] = DynamicBatcher(model, self.pool, max_batch_size, max_wait_us)
+
+        self._httpd = None
+        self._thread = None
+
+    def get_models(self):
+        """Accessor method for the names of the served models."""
+        return list(self.batchers)
+
+    def predict(self, name, inputs, output=None):
+        """Runs a batch of inputs through the named model, batched with
+        the other concurrent requests, and returns the outputs.
+        """
+        if name not in self.batchers:
+            raise KeyError('Unknown model: ' + str(name))
+        return self.batchers[name].submit(inputs, output).result(self.request_timeout)
+
+    def health(self):
+        """Returns the status of the server."""
+        return {'status': 'ok',
+                'models': self.get_models(),
+                'uptime_s': time.time() - self.started}
+
+    def metrics(self):
+        """Returns the request and latency metrics of every model."""
+        return {name: batcher.metrics.get_summary(batcher.get_queue_depth())
+                for name, batcher in self.batchers.items()}
+
+    def model_info(self):
+        """Returns the metadata of every model."""
+        return {name: batcher.model.get_metadata() for name, batcher in self.batchers.items()}
+
+    def start(self):
+        """Starts the HTTP server on a background thread and returns the
+        address it listens on.
+        """
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def serve_forever(self):
+        """Runs the HTTP server until interrupted."""
+        address = self.start()
+        print('Serving', ', '.join(self.get_models()), 'at', address)
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stops the HTTP server, the batchers and the worker pool."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        for batcher in self.batchers.values():
+            batcher.stop()
+        self.pool.shutdown(wait=True)
+
+
+def _make_handler(server):
+    """Returns the request handler class bound to server.
+
+    GET /health, GET /metrics and GET /models return JSON documents.
+    POST /predict/<name> takes {"inputs": [...], "output": "class"} and
+    returns {"outputs": [...]}.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, server.health())
+            elif self.path == '/metrics':
+                self._send(200, server.metrics())
+            elif self.path == '/models':
+                self._send(200, server.model_info())
+            else:
+                self._send(404, {'error': 'Unknown path: ' + self.path})
+
+        def do_POST(self):
+            if not self.path.startswith('/predict/'):
+                self._send(404, {'error': 'Unknown path: ' + self.path})
+                return
+
+            name = self.path[len('/predict/'):]
+            if name not in server.batchers:
+                self._send(404, {'error': 'Unknown model: ' + name})
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length))
+                inputs = body['inputs']
+                output = body.get('output')
+            except (ValueError, KeyError, TypeError) as e:
+                self._send(400, {'error': 'Invalid request: ' + str(e)})
+                return
+
+            try:
+                outputs = server.predict(name, inputs, output)
+            except ValueError as e:
+                self._send(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+                return
+
+            self._send(200, {'outputs': np.asarray(outputs).tolist()})
+
+        def log_message(self, format, *args):
+            # Requests are counted in /metrics instead of being logged one by one
+            pass
+
+    return Handler
@@ -0,0 +1,74 @@
+"""Compares scoring a large memory-mapped dataset with a random forest in
+one predict() call and with bulk scoring, chunked on one or more threads.
+
+Usage: python benchmarks/bulk_scoring.py [--rows 2000000] [--trees 100]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+
+from ManufacturingNet.models.bulk_scoring import score_bulk
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    X, y = make_classification(20000, args.features, n_informative=10,
+                               random_state=0)
+    model = RandomForestClassifier(args.trees, max_depth=12, n_jobs=1,
+                                   random_state=0).fit(X, y)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "attributes.npy")
+        attributes = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=np.float32,
+            shape=(args.rows, args.features))
+        rng = np.random.RandomState(0)
+        for start in range(0, args.rows, 100000):
+            stop = min(start + 100000, args.rows)
+            attributes[start:stop] = rng.randn(stop - start, args.features)
+        attributes.flush()
+        del attributes
+
+        X_big = np.load(filename, mmap_mode="r")
+        expected, seconds, peak = measure(lambda: model.predict(X_big))
+        print("{:<22} {:>10} {:>12} {:>8}".format(
+            "Method", "Time (s)", "Peak (MB)", "Exact"))
+        print("{:<22} {:>10.2f} {:>12.1f} {:>8}".format(
+            "predict()", seconds, peak, "yes"))
+
+        for n_threads in (1, 2, os.cpu_count() or 1):
+            (y_prediction, _), seconds, peak = measure(
+                lambda: score_bulk(model.predict, filename,
+                                   chunk_size=args.chunk_size,
+                                   n_threads=n_threads))
+            exact = np.array_equal(y_prediction, expected)
+            print("{:<22} {:>10.2f} {:>12.1f} {:>8}".format(
+                "bulk, {} thread(s)".format(n_threads), seconds, peak,
+                "yes" if exact else "no"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compares the time-distributed CNN_LSTM forward pass with the former
+per-timestep loop.
+
+Usage: python benchmarks/cnn_lstm_forward.py [--batch 16] [--time 100]
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+
+from ManufacturingNet.models.CNN_LSTM_Default import CNN_LSTM
+
+
+class _Head(nn.Module):
+    # Stand-in for the interactive LSTM network with the same interface
+
+    def __init__(self, input_size, hidden_size=64, output_size=4):
+        super(_Head, self).__init__()
+        self.input_size = input_size
+        self.lstm = nn.LSTM(input_size, hidden_size, batch_first=True)
+        self.linear = nn.Linear(hidden_size, output_size)
+
+    def forward(self, x):
+        out, _ = self.lstm(x)
+        return self.linear(out[:, -1, :])
+
+
+def loop_forward(model, x):
+    # The per-timestep loop used before the time-distributed path
+    b, time_steps = x.shape[:2]
+    lstm_input = torch.zeros(
+        (b, time_steps, model.lstm.input_size)).double().to(x.device)
+    for i in range(time_steps):
+        lstm_input[:, i, :] = model.cnn.forward(x[:, i, :, :, :])
+    return model.lstm(lstm_input)
+
+
+def timeit(fn, repeats):
+    fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--time", type=int, default=100)
+    parser.add_argument("--size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    cnn = nn.Sequential(nn.Conv2d(1, 8, 3), nn.BatchNorm2d(8), nn.ReLU(),
+                        nn.MaxPool2d(2), nn.Flatten())
+    flat = 8 * ((args.size - 2) // 2) ** 2
+    x = torch.randn(args.batch, args.time, 1, args.size, args.size,
+                    dtype=torch.float64, device=device)
+
+    print("{:<28} {:>12}".format("Variant", "ms / batch"))
+    for label, chunk in (("per-timestep loop", None), ("time-distributed", None),
+                         ("time-distributed, chunk=256", 256)):
+        model = CNN_LSTM(cnn, _Head(flat), device, max_chunk=chunk).double().to(device)
+        model.eval()
+        with torch.no_grad():
+            if label == "per-timestep loop":
+                seconds = timeit(lambda: loop_forward(model, x), args.repeats)
+            else:
+                seconds = timeit(lambda: model(x), args.repeats)
+        print("{:<28} {:>12.2f}".format(label, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compares the prediction latency and memory of fitted random forests and
+XGBoost models with their compiled NumPy form.
+
+Usage: python benchmarks/compiled_trees.py [--rows 20000] [--trees 500]
+"""
+
+import argparse
+import pickle
+import time
+
+import numpy as np
+from sklearn.datasets import make_classification, make_regression
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from xgboost import XGBClassifier, XGBRegressor
+
+from ManufacturingNet.models.tree_inference import compile_model
+
+
+def latency(predict, X, batch, repeats):
+    predict(X[:batch])
+    start = time.perf_counter()
+    for i in range(repeats):
+        predict(X[i * batch % len(X):][:batch])
+    return (time.perf_counter() - start) / repeats / batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--trees", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    X_class, y_class = make_classification(args.rows, args.features,
+                                           n_informative=10, n_classes=3,
+                                           random_state=0)
+    X_reg, y_reg = make_regression(args.rows, args.features, noise=1.0,
+                                   random_state=0)
+    models = (
+        ("RandomForestClassifier", RandomForestClassifier(
+            args.trees, max_depth=12, random_state=0), X_class, y_class),
+        ("RandomForestRegressor", RandomForestRegressor(
+            args.trees, max_depth=12, random_state=0), X_reg, y_reg),
+        ("XGBClassifier", XGBClassifier(n_estimators=args.trees),
+         X_class, y_class),
+        ("XGBRegressor", XGBRegressor(n_estimators=args.trees),
+         X_reg, y_reg))
+
+    print("{:<24} {:<9} {:>12} {:>12} {:>10} {:>6}".format(
+        "Model", "Form", "us/row (1)", "us/row (256)", "Size (MB)",
+        "Exact"))
+    for name, model, X, y in models:
+        model.fit(X, y)
+        compiled = compile_model(model)
+        exact = np.array_equal(compiled.predict(X), model.predict(X))
+
+        for form, predict, size in (
+                ("original", model.predict, len(pickle.dumps(model))),
+                ("compiled", compiled.predict, compiled.nbytes())):
+            single = latency(predict, X, 1, args.repeats)
+            batched = latency(predict, X, 256, args.repeats // 10 or 1)
+            print("{:<24} {:<9} {:>12.1f} {:>12.2f} {:>10.1f} {:>6}".format(
+                name, form, single * 1e6, batched * 1e6, size / 1e6,
+                str(exact)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compares training the shallow regression models on the one-hot encoded
+Mercedes dataset as a dense array and as a CSR matrix.
+
+Download the dataset with ManufacturingNet.datasets.MercedesData() and
+pass the path of its training CSV file.
+
+Usage: python benchmarks/mercedes_sparse.py path/to/train.csv [--trees 100]
+"""
+
+import argparse
+import csv
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.svm import LinearSVR
+from xgboost import XGBRegressor
+
+from ManufacturingNet.models.sparse_inputs import (check_sparse_support,
+                                                   density, nbytes)
+
+
+def load_mercedes(filename):
+    # ID and y, then the categorical columns X0..X8 and the binary ones
+    with open(filename, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        rows = list(reader)
+
+    columns = header[2:]
+    categorical = [i for i, name in enumerate(columns)
+                   if not rows[0][i + 2].lstrip("-").isdigit()]
+    binary = [i for i in range(len(columns)) if i not in categorical]
+
+    values = np.array([row[2:] for row in rows], dtype=object)
+    labels = np.array([float(row[1]) for row in rows])
+
+    encoder = OneHotEncoder(handle_unknown="ignore")
+    encoded = encoder.fit_transform(values[:, categorical].astype(str))
+    flags = sparse.csr_matrix(values[:, binary].astype(np.float64))
+    return sparse.hstack([encoded, flags], format="csr"), labels
+
+
+def measure(model, X_train, y_train, X_test, y_test):
+    tracemalloc.start()
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return fit_time, peak, model.score(X_test, y_test)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("csv")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    X_sparse, y = load_mercedes(args.csv)
+    X_dense = X_sparse.toarray()
+    print("{} rows, {} columns, {:.1%} nonzero".format(
+        X_sparse.shape[0], X_sparse.shape[1], density(X_sparse)))
+    print("dense: {:.1f} MB, CSR: {:.1f} MB\n".format(
+        nbytes(X_dense) / 1e6, nbytes(X_sparse) / 1e6))
+
+    index_train, index_test = train_test_split(
+        np.arange(len(y)), test_size=0.25, random_state=args.seed)
+
+    models = (
+        ("LinearRegression", lambda: LinearRegression()),
+        ("LinearSVR", lambda: LinearSVR(loss="squared_epsilon_insensitive",
+                                        dual=False)),
+        ("RandomForest", lambda: RandomForestRegressor(
+            n_estimators=args.trees, n_jobs=-1, random_state=args.seed)),
+        ("XGBRegressor", lambda: XGBRegressor(tree_method="hist",
+                                              random_state=args.seed)))
+
+    print("{:<18} {:<7} {:>10} {:>12} {:>8}".format(
+        "Model", "Input", "Fit (s)", "Peak (MB)", "R2"))
+    for name, make_model in models:
+        for label, X in (("dense", X_dense), ("CSR", X_sparse)):
+            model = make_model()
+            check_sparse_support(model, X)
+            fit_time, peak, score = measure(model, X[index_train],
+                                            y[index_train], X[index_test],
+                                            y[index_test])
+            print("{:<18} {:<7} {:>10.3f} {:>12.1f} {:>8.4f}".format(
+                name, label, fit_time, peak, score))
+
+
+if __name__ == "__main__":
+    main()